@@ -0,0 +1,100 @@
+"""
+Per-keystroke path completion latency in a large directory, prompt_toolkit's PathCompleter versus
+the cached completer
+
+Usage:
+    python -m bench.completion_latency                 # 100k files in a temporary directory
+    python -m bench.completion_latency --files 20000 --json completion.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from prompt_toolkit.completion import CompleteEvent, PathCompleter
+from prompt_toolkit.document import Document
+
+from plugins.completion import HybridCompleter
+from .run_bench import percentile
+
+
+def make_tree(root: str, files: int):
+    for i in range(files):
+        open(os.path.join(root, f"file_{i:06d}.txt"), "w").close()
+    for i in range(max(1, files // 100)):
+        os.mkdir(os.path.join(root, f"dir_{i:04d}"))
+
+
+def keystrokes(line: str) -> List[str]:
+    """Every prefix of line, as typed one key at a time."""
+    return [line[:i] for i in range(1, len(line) + 1)]
+
+
+def measure(complete: Callable[[str], list], lines: List[str]) -> Dict[str, float]:
+    samples = []
+    for line in lines:
+        for text in keystrokes(line):
+            started = time.perf_counter()
+            complete(text)
+            samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "keystrokes": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "max": max(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure path completion latency per keystroke")
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="capybara-completion-")
+    cwd = os.getcwd()
+    try:
+        make_tree(root, args.files)
+        os.chdir(root)
+        lines = ["cat file_0421", "ls dir_00", "cat file_09999", "wc -l file_5"]
+        event = CompleteEvent(completion_requested=True)
+
+        def old(text: str) -> list:
+            # What each keystroke used to do: a fresh PathCompleter over the text before the cursor
+            word = text.rsplit(" ", 1)[-1]
+            return list(PathCompleter().get_completions(Document(word), event))
+
+        completer = HybridCompleter([])
+
+        def new(text: str) -> list:
+            return list(completer.get_completions(Document(text), event))
+
+        started = time.perf_counter()
+        new("cat f")
+        cold_ms = (time.perf_counter() - started) * 1000
+        report = {
+            "files": args.files,
+            "cold_listing_ms": cold_ms,
+            "path_completer": measure(old, lines),
+            "cached": measure(new, lines),
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{args.files} files, first listing {report['cold_listing_ms']:.1f} ms")
+    print(f"{'completer':<16} {'keys':>5} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for name in ("path_completer", "cached"):
+        r = report[name]
+        print(f"{name:<16} {r['keystrokes']:>5} {r['p50']:>9.2f} {r['p95']:>9.2f} {r['max']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+!grep answered from the trigram content index versus a brute-force parallel scan and grep -r
+
+Usage:
+    python -m bench.content_search                     # 20k source files in a temporary directory
+    python -m bench.content_search --files 100000 --repeat 5 --json search.json
+    python -m bench.content_search --repo ~/src/linux  # an existing tree; --files is ignored
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import string
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from plugins.content_search import BINARY_SNIFF, DEFAULT_MAX_FILE_KB, DEFAULT_WORKERS, ContentIndex
+from plugins.repo_walker import walk_repo
+
+FILES_PER_DIR = 40
+# Planted in a handful of files, so the index has something rare to find
+NEEDLE = "needle_7f3a"
+# (label, pattern, ignore case)
+QUERIES = [
+    ("rare literal", NEEDLE, False),
+    ("common identifier", "return", False),
+    ("alternation", f"{NEEDLE}|haystack_b2c9", False),
+    ("ignore case", NEEDLE.upper(), True),
+    ("regex with literals", r"def \w+_needle\(", False),
+    ("no trigrams", r"\d{6,}", False),
+]
+
+
+def make_repo(root: str, files: int):
+    """files Python-like modules of about 6 KB from a shared vocabulary, plus a few binaries and ignored files."""
+    rng = random.Random(0)
+    words = sorted({"".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(20000)})
+    # Word frequencies fall off like a real vocabulary's: a few words everywhere, most of them rare
+    rng.shuffle(words)
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+    def word() -> str:
+        return rng.choices(words, cum_weights=cumulative)[0]
+
+    planted = set(rng.sample(range(files), min(files, 8)))
+    for i in range(files):
+        directory = os.path.join(root, f"pkg_{i // (FILES_PER_DIR * 25):03d}", f"mod_{i // FILES_PER_DIR:05d}")
+        os.makedirs(directory, exist_ok=True)
+        lines = [f"import {word()}\n", f"from {word()} import {word()}\n\n"]
+        for _ in range(40):
+            name, arg, attr = word(), word(), word()
+            lines.append(f"def {name}_{word()}({arg}, {word()}=None):\n"
+                         f"    return {arg}.{attr}({rng.randint(0, 999)})\n\n")
+        if i in planted:
+            lines.insert(rng.randint(2, len(lines)), f"def check_needle({NEEDLE}):\n    return {NEEDLE}\n\n")
+        with open(os.path.join(directory, f"module_{i:06d}.py"), "w") as f:
+            f.writelines(lines)
+    for i in range(50):
+        with open(os.path.join(root, f"pkg_000/blob_{i}.bin"), "wb") as f:
+            f.write(b"\0" + os.urandom(64 * 1024))
+    os.makedirs(os.path.join(root, "node_modules", "dep"))
+    for i in range(200):
+        with open(os.path.join(root, "node_modules", "dep", f"{i}.js"), "w") as f:
+            f.write(f"module.exports = '{NEEDLE}';\n")
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("*.log\n")
+
+
+def brute_force(root: str, pattern: str, ignore_case: bool, workers: int) -> int:
+    """Matching lines found by walking the tree and reading every text file on a thread pool, as !grep prints them."""
+    regex = re.compile(pattern.encode(), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    limit = DEFAULT_MAX_FILE_KB * 1024
+
+    def scan(path: str) -> int:
+        try:
+            with open(os.path.join(root, path), "rb") as f:
+                data = f.read(limit + 1)
+        except OSError:
+            return 0
+        if len(data) > limit or b"\0" in data[:BINARY_SNIFF]:
+            return 0
+        lines = {}
+        for match in regex.finditer(data):
+            start = data.rfind(b"\n", 0, match.start()) + 1
+            if start not in lines:
+                end = data.find(b"\n", start)
+                lines[start] = (data.count(b"\n", 0, start) + 1, data[start:end].decode("utf-8", errors="replace"))
+        return len(lines)
+
+    paths = walk_repo(root, workers).files()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(scan, paths, chunksize=64))
+
+
+def grep_r(root: str, pattern: str, ignore_case: bool):
+    """grep -rnP over the tree, skipping what make_repo's tree ignores, or None without GNU grep."""
+    command = ["grep", "-rnIP", "--exclude-dir=.git", "--exclude-dir=node_modules"] + (["-i"] if ignore_case else [])
+    try:
+        subprocess.run(command + [pattern, "."], cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+
+
+def timed_ms(run) -> float:
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure indexed !grep against a brute-force scan")
+    parser.add_argument("--files", type=int, default=20_000)
+    parser.add_argument("--repo", help="search this tree instead of a generated one")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.repo) if args.repo else tempfile.mkdtemp(prefix="capybara-search-")
+    db_dir = tempfile.mkdtemp(prefix="capybara-search-db-")
+    report = {"cpus": os.cpu_count(), "workers": args.workers, "queries": {}}
+    try:
+        if not args.repo:
+            make_repo(root, args.files)
+        db = os.path.join(db_dir, "search.db")
+        index = ContentIndex(root, db, workers=args.workers, max_matches=10 ** 9)
+        report["build_ms"] = timed_ms(index.update)
+        report.update(index.stats())
+        report["index_mb"] = sum(os.path.getsize(os.path.join(db_dir, name)) for name in os.listdir(db_dir)) / 2 ** 20
+        # Without inotify every update walks the tree and stats each file
+        unwatched = ContentIndex(root, db, workers=args.workers, watch=False)
+        report["update_stat_ms"] = statistics.median(timed_ms(unwatched.update) for _ in range(args.repeat))
+        report["update_ms"] = statistics.median(timed_ms(index.update) for _ in range(args.repeat))
+        if not args.repo:
+            # A branch switch or a formatter run: a hundred files rewritten
+            for path in walk_repo(root).files()[:100]:
+                st = os.stat(os.path.join(root, path))
+                os.utime(os.path.join(root, path), ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+            report["update_100_ms"] = timed_ms(index.update)
+
+        for label, pattern, ignore_case in QUERIES:
+            def indexed():
+                result = index.search(pattern, ignore_case)
+                first = None
+                for _ in result:
+                    if first is None:
+                        first = time.perf_counter()
+                return result, first
+
+            samples, firsts = [], []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                result, first = indexed()
+                samples.append((time.perf_counter() - started) * 1000)
+                firsts.append(((first or time.perf_counter()) - started) * 1000)
+            matches = brute_force(root, pattern, ignore_case, args.workers)
+            brute = statistics.median(timed_ms(lambda: brute_force(root, pattern, ignore_case, args.workers))
+                                      for _ in range(args.repeat))
+            grep = None
+            if shutil.which("grep"):
+                grep = statistics.median(timed_ms(lambda: grep_r(root, pattern, ignore_case)) for _ in range(args.repeat))
+            report["queries"][label] = {
+                "pattern": pattern, "matches": result.matches, "brute_matches": matches,
+                "files_read": result.files_read, "index_ms": statistics.median(samples),
+                "first_ms": statistics.median(firsts), "brute_ms": brute, "grep_ms": grep,
+            }
+    finally:
+        if not args.repo:
+            shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    print(f"{report['text_files']} text files of {report['files']}, {report['cpus']} CPUs, {args.workers} workers, "
+          f"median of {args.repeat} runs")
+    print(f"Index build {report['build_ms'] / 1000:.1f} s, {report['index_mb']:.0f} MB, {report['trigrams']} trigrams; "
+          f"update with nothing changed {report['update_ms']:.0f} ms (inotify), "
+          f"{report['update_stat_ms']:.0f} ms (walk and stat)" +
+          (f", after 100 files changed {report['update_100_ms']:.0f} ms" if "update_100_ms" in report else ""))
+    print(f"{'query':<20} {'matches':>8} {'files read':>10} {'first ms':>9} {'index ms':>9} {'brute ms':>9} "
+          f"{'grep -r ms':>10}")
+    for label, r in report["queries"].items():
+        grep = f"{r['grep_ms']:>10.0f}" if r["grep_ms"] is not None else f"{'-':>10}"
+        mismatch = "" if r["matches"] == r["brute_matches"] else f"  (brute force found {r['brute_matches']})"
+        print(f"{label:<20} {r['matches']:>8} {r['files_read']:>10} {r['first_ms']:>9.0f} {r['index_ms']:>9.0f} "
+              f"{r['brute_ms']:>9.0f} {grep}{mismatch}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
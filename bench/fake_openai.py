@@ -0,0 +1,187 @@
+"""
+Local OpenAI-compatible stand-in server for offline benchmarks
+Serves /v1/chat/completions with configurable latency, token rate, errors and streaming
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Every reply starts with MARKER so the harness can tell when answer text first reaches the screen
+MARKER = "quokka"
+WORDS = [MARKER, "shell", "command", "file", "list", "search", "repository", "branch", "python", "output"]
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        """Clients hanging up mid-reply (cancelled, hedged or timed-out calls) are expected; other errors still print."""
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.2, jitter: float = 0.0,
+                 token_rate: float = 200.0, reply_tokens: int = 60, error_rate: float = 0.0,
+                 error_status: int = 500, model_latency: Optional[Dict[str, float]] = None, seed: int = 0):
+        """
+        Initialize the server.
+
+        Args:
+            latency: Seconds before the first token (time to first byte)
+            jitter: Extra uniformly random latency in seconds
+            token_rate: Tokens generated per second after the first one
+            reply_tokens: Tokens per reply, capped by the request's max_tokens
+            error_rate: Fraction of requests answered with error_status
+            model_latency: Per-model latency overrides, e.g. to make the primary model hang
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.model_latency = model_latency or {}
+        self.requests = 0
+        self.requests_by_model: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._httpd = _QuietHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.requests_by_model = {}
+
+    def _plan(self, model: str):
+        """Count a request and decide its delay and whether it fails."""
+        with self._lock:
+            self.requests += 1
+            self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+            delay = self.model_latency.get(model, self.latency) + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        return delay, fail
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                model = request.get("model", "unknown")
+                delay, fail = server._plan(model)
+                time.sleep(delay)
+                if fail:
+                    self._send_json(server.error_status, {"error": {"message": "Injected failure", "type": "server_error"}})
+                    return
+
+                count = min(server.reply_tokens, request.get("max_tokens") or server.reply_tokens)
+                tokens = [WORDS[i % len(WORDS)] + " " for i in range(count)]
+                created = int(time.time())
+
+                if not request.get("stream"):
+                    time.sleep(max(0, count - 1) / server.token_rate)
+                    self._send_json(200, {
+                        "id": "chatcmpl-bench",
+                        "object": "chat.completion",
+                        "created": created,
+                        "model": model,
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": count, "total_tokens": count},
+                    })
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(1 / server.token_rate)
+                    self._send_chunk(model, created, {"content": token}, None)
+                self._send_chunk(model, created, {}, "stop")
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+
+            def _send_chunk(self, model, created, delta, finish_reason):
+                payload = {
+                    "id": "chatcmpl-bench",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stand-in server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="tokens per second")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(port=args.port, latency=args.latency, jitter=args.jitter, token_rate=args.token_rate,
+                              reply_tokens=args.reply_tokens, error_rate=args.error_rate).start()
+    print(f"Fake OpenAI server listening on {server.base_url}")
+    print(f"Point the CLI at it with: OPENAI_BASE_URL={server.base_url} OPENAI_API_KEY=bench python cli.py")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+!find answered from the file index versus running find over the tree
+
+Usage:
+    python -m bench.find_index                     # 200k files in a temporary directory
+    python -m bench.find_index --files 1000000 --repeat 5 --json find.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from bench.repo_walk import make_tree
+from plugins.file_index import FileIndex
+
+QUERIES = [
+    'find . -type f -name "*.py"',
+    r'find . -type f \( -name "*.py" -o -name "*.js" \) | wc -l',
+    'find . -name "file_001.js"',
+    'find . -type d -empty',
+    'find . -size +1M',
+    'find . -path "./pkg_001/*" -name "*.json"',
+]
+
+
+def timed_ms(run) -> float:
+    started = time.perf_counter()
+    run()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure indexed !find queries against find")
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="capybara-find-")
+    db_dir = tempfile.mkdtemp(prefix="capybara-find-db-")
+    cwd = os.getcwd()
+    report = {"files": args.files, "cpus": os.cpu_count(), "queries": {}}
+    try:
+        make_tree(root, args.files)
+        os.chdir(root)
+        index = FileIndex(root, os.path.join(db_dir, "index.db"))
+        report["build_ms"] = timed_ms(index.update)
+        # Without inotify (or past its watch limit) every directory is stat'ed on each update
+        unwatched = FileIndex(root, os.path.join(db_dir, "index.db"), watch=False)
+        report["update_stat_ms"] = statistics.median(timed_ms(unwatched.update) for _ in range(args.repeat))
+        report["update_ms"] = statistics.median(timed_ms(index.update) for _ in range(args.repeat))
+        for query in QUERIES:
+            result = index.query(query)
+            indexed = statistics.median(timed_ms(lambda: index.query(query)) for _ in range(args.repeat))
+            walked = statistics.median(
+                timed_ms(lambda: subprocess.run(query, shell=True, stdout=subprocess.DEVNULL)) for _ in range(args.repeat))
+            report["queries"][query] = {"matches": result.count, "index_ms": indexed, "find_ms": walked}
+        report["index_mb"] = os.path.getsize(os.path.join(db_dir, "index.db")) / 1024 / 1024
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    print(f"{args.files} files, {report['cpus']} CPUs, median of {args.repeat} runs")
+    print(f"Index build {report['build_ms']:.0f} ms, {report['index_mb']:.0f} MB; "
+          f"update with nothing changed {report['update_ms']:.0f} ms (inotify), "
+          f"{report['update_stat_ms']:.0f} ms (directory mtimes)")
+    print(f"{'query':<62} {'matches':>8} {'index ms':>9} {'find ms':>8}")
+    for query, r in report["queries"].items():
+        print(f"{query:<62} {r['matches']:>8} {r['index_ms']:>9.0f} {r['find_ms']:>8.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Throughput of shell command output through the output sink, per strategy and size
+
+Each case runs in a fresh process so its peak memory is its own. Output goes to
+/dev/null, so the numbers measure the CLI rather than a terminal emulator.
+
+Usage:
+    python -m bench.output_throughput                  # 1 MB, 100 MB and 1 GB
+    python -m bench.output_throughput --sizes 1 10 --json output.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from rich.console import Console
+
+from plugins.output_sink import OutputSink
+from plugins.shell_exec import run_streaming
+
+MB = 1024 * 1024
+MODES = {
+    "rich": "every chunk through Rich (the old console.print path)",
+    "text": "decoded text written to the console file",
+    "bulk": "undecoded bytes written to the binary stream",
+    "spill": "bulk until the pager threshold, then spill to disk",
+}
+
+
+def run_case(mode: str, size_mb: float) -> dict:
+    size = int(size_mb * MB)
+    text_out = open(os.devnull, "w", encoding="utf-8")
+    raw_out = open(os.devnull, "wb")
+    console = Console(file=text_out, force_terminal=True, width=120)
+    options = {
+        "rich": dict(rich_limit=size + 1, page=False),
+        "text": dict(rich_limit=0, page=False),
+        "bulk": dict(rich_limit=0, raw=raw_out, page=False),
+        "spill": dict(rich_limit=0, raw=raw_out, pager_limit=8 * MB, page=True),
+    }[mode]
+    sink = OutputSink(console, **options)
+
+    started = time.perf_counter()
+    result = run_streaming(f"yes 'capybara output line with some text' | head -c {size}", sink, tty_passthrough=False)
+    elapsed = time.perf_counter() - started
+    sink.discard()
+    return {
+        "mode": mode,
+        "size_mb": size_mb,
+        "seconds": elapsed,
+        "mb_per_s": result.stdout_bytes / MB / elapsed if elapsed else 0.0,
+        "buffer_peak_kb": result.buffer_peak / 1024,
+        "peak_rss_mb": result.peak_rss / MB,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure shell output throughput per output strategy")
+    parser.add_argument("--sizes", type=float, nargs="*", default=[1, 100, 1024], help="output sizes in MB")
+    parser.add_argument("--modes", nargs="*", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--rich-max", type=float, default=10, help="largest size in MB to run through Rich")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--case", nargs=2, metavar=("MODE", "SIZE_MB"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case[0], float(args.case[1]))))
+        return
+
+    results = []
+    print(f"{'mode':<6} {'size':>8} {'seconds':>8} {'MB/s':>8} {'buffer KB':>10} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        for mode in args.modes:
+            if mode == "rich" and size > args.rich_max:
+                continue
+            child = subprocess.run([sys.executable, "-m", "bench.output_throughput", "--case", mode, str(size)],
+                                   capture_output=True, text=True, check=True)
+            r = json.loads(child.stdout)
+            results.append(r)
+            print(f"{mode:<6} {size:>6g}MB {r['seconds']:>8.2f} {r['mb_per_s']:>8.0f} "
+                  f"{r['buffer_peak_kb']:>10.0f} {r['peak_rss_mb']:>12.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
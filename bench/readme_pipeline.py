@@ -0,0 +1,93 @@
+"""
+!readme wall-clock time against the fake OpenAI server, by number of workers
+Each run starts with an empty manifest, so every file summary, directory summary and section is requested.
+
+Usage:
+    python -m bench.readme_pipeline                # 40 files in 8 packages, 1/2/4/8 workers
+    python -m bench.readme_pipeline --files 120 --workers 1 8 --latency 0.5 --json pipeline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .fake_openai import FakeOpenAIServer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_repo(files: int, packages: int) -> str:
+    """files Python modules spread over packages, with a requirements.txt and an entry point."""
+    repo = tempfile.mkdtemp(prefix="capybara-readme-")
+    Path(repo, "requirements.txt").write_text("rich\nrequests\n")
+    Path(repo, "main.py").write_text("from pkg_0 import module_0\n\nif __name__ == '__main__':\n    module_0.run()\n")
+    for i in range(files):
+        package = Path(repo, f"pkg_{i % packages}")
+        package.mkdir(exist_ok=True)
+        body = "".join(f"def step_{j}(value):\n    return value + {j}\n\n" for j in range(20))
+        (package / f"module_{i}.py").write_text(f'"""Module {i}."""\n\n{body}def run():\n    return step_0(0)\n')
+    return repo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure !readme wall-clock time by worker count")
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--packages", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server time to first token")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=args.latency).start()
+    cache_dir = tempfile.mkdtemp(prefix="capybara-readme-cache-")
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["CAPYBARA_CACHE_DIR"] = cache_dir
+    os.environ["CAPYBARA_README_INCREMENTAL"] = "off"
+    os.environ["CAPYBARA_README_MAX_FILES"] = str(args.files)
+
+    sys.path.insert(0, str(ROOT))
+    from plugins.readme_generator import generate_readme, get_last_reuse_report
+    from plugins.response_cache import get_cache
+    from plugins.fuzzy_cache import get_fuzzy_cache
+
+    get_cache().enabled = False
+    get_fuzzy_cache().enabled = False
+    repo = make_repo(args.files, args.packages)
+    report = {"files": args.files, "packages": args.packages, "latency": args.latency, "runs": {}}
+    try:
+        for workers in args.workers:
+            os.environ["CAPYBARA_README_WORKERS"] = str(workers)
+            samples = []
+            for _ in range(args.repeat):
+                server.reset_counters()
+                started = time.perf_counter()
+                generate_readme(repo)
+                samples.append(time.perf_counter() - started)
+            stats = get_last_reuse_report()
+            report["runs"][workers] = {"median_s": statistics.median(samples), "best_s": min(samples),
+                                       "calls": server.requests, "map_s": stats["map_s"], "reduce_s": stats["reduce_s"]}
+    finally:
+        server.stop()
+        shutil.rmtree(repo, ignore_errors=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"{args.files} files in {args.packages} packages, {args.latency:.2f}s per call, median of {args.repeat} runs")
+    print(f"{'workers':>7} {'median s':>9} {'best s':>7} {'calls':>6} {'map s':>6} {'reduce s':>9}")
+    for workers, r in report["runs"].items():
+        print(f"{workers:>7} {r['median_s']:>9.2f} {r['best_s']:>7.2f} {r['calls']:>6} "
+              f"{r['map_s']:>6.2f} {r['reduce_s']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Repository walk time for !readme context, the previous listdir/os.walk passes versus the shared walker
+
+Usage:
+    python -m bench.repo_walk                  # 200k files in a temporary directory
+    python -m bench.repo_walk --files 50000 --workers 1 4 8 --json walk.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from plugins.readme_generator import KEY_FILES, SOURCE_EXTENSIONS
+from plugins.repo_walker import format_tree, walk_repo
+
+FILES_PER_DIR = 50
+EXTENSIONS = [".py", ".js", ".md", ".json", ".txt"]
+
+
+def make_tree(root: str, files: int):
+    """files files in a three-level tree, plus ignored node_modules and build output."""
+    per_package = FILES_PER_DIR * 20
+    for i in range(max(1, files // FILES_PER_DIR)):
+        directory = os.path.join(root, f"pkg_{i // 20:03d}", "src" if i % 2 else "lib", f"mod_{i:05d}")
+        os.makedirs(directory, exist_ok=True)
+        for j in range(FILES_PER_DIR):
+            open(os.path.join(directory, f"file_{j:03d}{EXTENSIONS[j % len(EXTENSIONS)]}"), "w").close()
+    for name in ("node_modules/left-pad/lib", "out/cache"):
+        directory = os.path.join(root, name)
+        os.makedirs(directory)
+        for j in range(per_package):
+            open(os.path.join(directory, f"{j}.js"), "w").close()
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("out/\n*.log\n")
+    with open(os.path.join(root, "package.json"), "w") as f:
+        f.write('{"name": "bench"}\n')
+
+
+def old_context(root: str):
+    """What !readme did before: a listdir/isdir tree per depth, an os.walk for sources, and key file reads."""
+    def tree(path: str, max_depth: int, depth: int = 0) -> List[str]:
+        if depth >= max_depth:
+            return []
+        lines = []
+        try:
+            for item in sorted(os.listdir(path)):
+                if item.startswith('.') or item in ['node_modules', '__pycache__', 'venv', '.git']:
+                    continue
+                item_path = os.path.join(path, item)
+                if os.path.isdir(item_path):
+                    lines.append(item + "/")
+                    lines += tree(item_path, max_depth, depth + 1)
+                else:
+                    lines.append(item)
+        except PermissionError:
+            pass
+        return lines
+
+    for depth in (4, 3, 2, 1):
+        tree(root, depth)
+    sources = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in ['.git', 'node_modules', '__pycache__', 'venv', 'dist', 'build']]
+        sources += [os.path.join(directory, f) for f in files if any(f.endswith(ext) for ext in SOURCE_EXTENSIONS)]
+        if len(sources) > 500:
+            break
+    for name in KEY_FILES:
+        if os.path.exists(os.path.join(root, name)):
+            with open(os.path.join(root, name), encoding="utf-8", errors="ignore") as f:
+                f.read(2000)
+
+
+def new_context(root: str, workers: int):
+    scan = walk_repo(root, workers=workers)
+    for depth in (4, 3, 2, 1):
+        format_tree(scan, depth)
+    sources = [f for f in scan.files() if f.endswith(tuple(SOURCE_EXTENSIONS))]
+    scan.read_heads([name for name in KEY_FILES if scan.is_file(name)] + sources[:20], 4096)
+
+
+def drop_caches() -> bool:
+    """Empty the page, dentry and inode caches (Linux, as root), so the next walk reads the disk."""
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def measure(run: Callable[[], None], repeat: int, cold: bool = False) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        if cold:
+            drop_caches()
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"median_ms": statistics.median(samples), "best_ms": min(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure repository walk time for README context")
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="capybara-walk-")
+    try:
+        make_tree(root, args.files)
+        cold = drop_caches()
+        report = {"files": args.files, "cpus": os.cpu_count()}
+        for mode in ("warm", "cold") if cold else ("warm",):
+            # Warm runs read the same cached metadata; cold runs start from an empty cache each time
+            old_context(root)
+            report[f"before, {mode}"] = measure(lambda: old_context(root), args.repeat, mode == "cold")
+            for workers in args.workers:
+                report[f"walker x{workers}, {mode}"] = measure(lambda: new_context(root, workers), args.repeat,
+                                                              mode == "cold")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{args.files} files, {report['cpus']} CPUs, median of {args.repeat} runs"
+          + ("" if cold else " (cold runs need root on Linux)"))
+    print(f"{'variant':<18} {'median ms':>10} {'best ms':>9}")
+    for name, r in report.items():
+        if isinstance(r, dict):
+            print(f"{name:<18} {r['median_ms']:>10.0f} {r['best_ms']:>9.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline latency benchmark for the AI paths of cli.py
+Drives execute_command against the local fake OpenAI server and reports
+p50/p95/p99 latency, time to first output and API calls per command.
+
+Usage:
+    python -m bench.run_bench                      # print a report
+    python -m bench.run_bench --save-baseline bench/baseline.json
+    python -m bench.run_bench --baseline bench/baseline.json   # exit 1 on regression
+"""
+import argparse
+import builtins
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .fake_openai import MARKER, FakeOpenAIServer
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = [
+    ("chat", "?what does a capybara eat"),
+    ("explain", "!explain tar -xzvf archive.tar.gz"),
+    # Phrased so the local resolver defers to the AI path being measured
+    ("git", "!git rebase my feature branch onto main interactively"),
+    ("find", "!find the files that configure logging"),
+    ("readme", "!readme {repo}"),
+    ("autofix", "sh -c 'exit 3'"),
+]
+
+
+class _TimingWriter(io.StringIO):
+    """Console file that remembers when answer text was first written."""
+
+    def __init__(self):
+        super().__init__()
+        self.first_output: Optional[float] = None
+
+    def write(self, s):
+        if self.first_output is None and MARKER in s:
+            self.first_output = time.perf_counter()
+        return super().write(s)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(samples: Dict[str, List[float]], calls: int, runs: int) -> dict:
+    result = {"runs": runs, "calls_per_command": calls / runs if runs else 0.0}
+    for metric, values in samples.items():
+        result[metric] = {
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    return result
+
+
+def make_sample_repo() -> str:
+    repo = tempfile.mkdtemp(prefix="capybara-bench-")
+    Path(repo, "requirements.txt").write_text("rich\n")
+    Path(repo, "main.py").write_text("print('hello')\n")
+    Path(repo, "pkg").mkdir()
+    for i in range(20):
+        Path(repo, "pkg", f"module_{i}.py").write_text(f"def f{i}():\n    return {i}\n")
+    return repo
+
+
+def run(args) -> dict:
+    server = FakeOpenAIServer(latency=args.latency, jitter=args.jitter, token_rate=args.token_rate,
+                              reply_tokens=args.reply_tokens, error_rate=args.error_rate).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["CAPYBARA_AUTOFIX_DELAY"] = "0"
+    # Every iteration must reach the server, or the numbers only measure the caches
+    os.environ["CAPYBARA_README_INCREMENTAL"] = "off"
+
+    sys.path.insert(0, str(ROOT))
+    from rich.console import Console
+    import cli
+    from plugins.response_cache import get_cache
+    from plugins.fuzzy_cache import get_fuzzy_cache
+
+    get_cache().enabled = False
+    get_fuzzy_cache().enabled = False
+    builtins.input = lambda prompt="": "n"
+
+    fix_shown = threading.Event()
+    show = cli.auto_fixer.show
+
+    def show_and_signal(fix):
+        show(fix)
+        fix_shown.set()
+
+    cli.auto_fixer.show = show_and_signal
+    repo = make_sample_repo()
+    report = {
+        "server": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "token_rate": args.token_rate,
+            "reply_tokens": args.reply_tokens,
+            "error_rate": args.error_rate,
+        },
+        "scenarios": {},
+    }
+
+    try:
+        for name, template in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            command = template.format(repo=repo)
+            samples = {"return_ms": [], "first_output_ms": [], "end_to_end_ms": []}
+            server.reset_counters()
+
+            for i in range(args.warmup + args.iterations):
+                writer = _TimingWriter()
+                cli.console = Console(file=writer, width=100, force_terminal=True)
+                fix_shown.clear()
+
+                started = time.perf_counter()
+                cli.execute_command(command)
+                returned = time.perf_counter()
+                if name == "autofix":
+                    fix_shown.wait(timeout=args.timeout)
+                finished = time.perf_counter()
+
+                if i < args.warmup:
+                    server.reset_counters()
+                    continue
+                samples["return_ms"].append((returned - started) * 1000)
+                samples["end_to_end_ms"].append((finished - started) * 1000)
+                first = writer.first_output or finished
+                samples["first_output_ms"].append((first - started) * 1000)
+
+            report["scenarios"][name] = summarize(samples, server.requests, args.iterations)
+    finally:
+        server.stop()
+
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float, slack_ms: float) -> List[str]:
+    """Return a list of regressions of report against baseline."""
+    problems = []
+    for name, current in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for metric in ("first_output_ms", "end_to_end_ms"):
+            now = current[metric]["p95"]
+            before = previous[metric]["p95"]
+            if now > before * (1 + tolerance) + slack_ms:
+                problems.append(f"{name}: {metric} p95 {now:.1f} ms > baseline {before:.1f} ms")
+        if current["calls_per_command"] > previous["calls_per_command"] + 0.01:
+            problems.append(
+                f"{name}: {current['calls_per_command']:.2f} calls/command > baseline {previous['calls_per_command']:.2f}"
+            )
+    return problems
+
+
+def print_report(report: dict):
+    header = f"{'scenario':<10} {'calls':>6} {'return p50':>11} {'first p50':>10} {'first p95':>10} {'e2e p50':>9} {'e2e p95':>9} {'e2e p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in report["scenarios"].items():
+        print(
+            f"{name:<10} {r['calls_per_command']:>6.2f} {r['return_ms']['p50']:>11.1f} "
+            f"{r['first_output_ms']['p50']:>10.1f} {r['first_output_ms']['p95']:>10.1f} "
+            f"{r['end_to_end_ms']['p50']:>9.1f} {r['end_to_end_ms']['p95']:>9.1f} {r['end_to_end_ms']['p99']:>9.1f}"
+        )
+    print("(all times in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CapybaraCLI AI paths against a local fake OpenAI server")
+    parser.add_argument("-n", "--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--only", nargs="*", help="scenario names to run")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for an auto-fix")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--save-baseline", help="write the report as a baseline")
+    parser.add_argument("--baseline", help="compare against this baseline and exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95 regression")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="allowed absolute p95 regression")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+
+    for path in filter(None, [args.json, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance, args.slack_ms)
+        if problems:
+            print("\nRegressions against baseline:")
+            for problem in problems:
+                print(f"  - {problem}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
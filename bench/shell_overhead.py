@@ -0,0 +1,84 @@
+"""
+Per-command overhead of a fresh shell per command versus the persistent shell session
+
+Usage:
+    python -m bench.shell_overhead            # 200 runs of each command
+    python -m bench.shell_overhead -n 1000 --json shell.json
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from plugins.shell_exec import TextSink, run_streaming
+from plugins.shell_session import ShellSession
+from .run_bench import percentile
+
+COMMANDS = ["true", "echo hello", "pwd", "ls > /dev/null", "x=1; y=$((x + 1)); echo $y"]
+
+
+def measure(run: Callable[[str], None], command: str, iterations: int, warmup: int) -> List[float]:
+    samples = []
+    for i in range(warmup + iterations):
+        started = time.perf_counter()
+        run(command)
+        if i >= warmup:
+            samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def run(args) -> Dict[str, dict]:
+    def sink():
+        return TextSink(lambda text: None, lambda text: None)
+
+    session = ShellSession(args.shell)
+    modes = {
+        "fresh": lambda cmd: run_streaming(cmd, sink(), tty_passthrough=False),
+        "persistent": lambda cmd: session.run(cmd, sink()),
+    }
+    report = {}
+    try:
+        for command in COMMANDS:
+            report[command] = {}
+            for mode, runner in modes.items():
+                samples = measure(runner, command, args.iterations, args.warmup)
+                report[command][mode] = {
+                    "p50": percentile(samples, 50),
+                    "p95": percentile(samples, 95),
+                    "mean": sum(samples) / len(samples),
+                }
+    finally:
+        session.close()
+    return report
+
+
+def print_report(report: Dict[str, dict]):
+    header = f"{'command':<30} {'fresh p50':>10} {'fresh p95':>10} {'persist p50':>12} {'persist p95':>12} {'speedup':>8}"
+    print(header)
+    print("-" * len(header))
+    for command, modes in report.items():
+        fresh, persistent = modes["fresh"], modes["persistent"]
+        speedup = fresh["p50"] / persistent["p50"] if persistent["p50"] else 0.0
+        print(f"{command:<30} {fresh['p50']:>10.2f} {fresh['p95']:>10.2f} "
+              f"{persistent['p50']:>12.2f} {persistent['p95']:>12.2f} {speedup:>7.1f}x")
+    print("(all times in ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fresh-shell and persistent-shell command overhead")
+    parser.add_argument("-n", "--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--shell", help="shell for the persistent session (default: bash, else /bin/sh)")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
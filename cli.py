@@ -1,112 +1,297 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import io
+import itertools
 import os
+import signal
 import subprocess
-import yaml
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from prompt_toolkit import PromptSession
-from prompt_toolkit.history import FileHistory
-from prompt_toolkit.completion import Completer, Completion, PathCompleter
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from typing import Tuple
 from rich import box
-from rich.console import Console
-from openai import OpenAI
+from rich.console import Console, Group
+from rich.live import Live
 from rich.panel import Panel
+from rich.spinner import Spinner
 from rich.text import Text
-from rich.markdown import Markdown
-from rich.syntax import Syntax
-from plugins.keyboard_sound import toggle_keyboard_sounds, is_keyboard_sounds_active, start_keyboard_sounds, stop_keyboard_sounds
+from plugins.keyboard_sound import toggle_keyboard_sounds, is_keyboard_sounds_active, start_keyboard_sounds, stop_keyboard_sounds, warm_up as warm_up_sounds
 from plugins.soundpack_manager import discover_soundpacks, format_soundpack_list, get_soundpack_by_index, get_soundpack_by_name
+from plugins.ai_utils import cached_completion
+from plugins.client_provider import get_client, get_config, load_env_file, connection_stats, format_connection_stats
+from plugins.model_router import get_router, format_router_status
+from plugins.auto_fix import create_auto_fixer
+from plugins.response_cache import get_cache, format_cache_stats
+from plugins.intent_resolver import resolver_stats, format_resolver_stats
+from plugins.fuzzy_cache import get_fuzzy_cache, format_fuzzy_stats
+from plugins.batch_runner import DEFAULT_JOBS, read_commands, run_batch, make_emitter, is_concurrent
+from plugins.shell_exec import is_interactive, run_streaming, format_exec_result, format_size
+from plugins.output_sink import OutputSink, Pager, RICH_LIMIT, PAGER_LIMIT
+from plugins.job_control import get_job_table, format_job, format_jobs
+from plugins.shell_session import get_shell_session, persistent_shell_enabled, set_persistent_shell, format_session_status
+from plugins.instrumentation import get_metrics, timed, format_stats
+from plugins.cancellation import cancel_scope, current_token
 
 console = Console()
-session = PromptSession(history=FileHistory(".capybara_history"))
+# Created by run_cli, so batch mode never touches the terminal
+session = None
 
 # Global variable to store current soundpack
 current_soundpack = None
 
-def load_config():
-    # Try .env file first
-    env_file = Path(__file__).parent / ".env"
-    if env_file.exists():
-        with open(env_file) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    value = value.strip().strip('"').strip("'")
-                    os.environ[key.strip()] = value
-    
-    # Check environment variable
-    if os.environ.get("OPENAI_API_KEY"):
-        return {"openai_api_key": os.environ["OPENAI_API_KEY"]}
-    
-    # Try config.yaml
-    try:
-        with open("config.yaml") as f:
-            return yaml.safe_load(f)
-    except FileNotFoundError:
-        api_key = input("Enter OpenAI API Key: ").strip()
-        config = {"openai_api_key": api_key}
-        with open("config.yaml", "w") as f:
-            yaml.dump(config, f)
-        return config
-
-config = load_config()
-client = OpenAI(api_key=config["openai_api_key"])
-
-class HybridCompleter(Completer):
-    def get_completions(self, document, complete_event):
-        text = document.text_before_cursor
-        if text.startswith("?"):
-            yield Completion(
-                "ask",
-                start_position=-1,
-                display="?Ask Capybara anything"
-            )
-        elif text.startswith("!"):
-            partial = text[1:]
-            for cmd in ["explain", "git", "find", "readme", "sounds", "vibes", "soundpacks", "packs", "select", "help"]:
-                if cmd.startswith(partial):
-                    yield Completion(
-                        cmd[len(partial):],
-                        start_position=-len(partial),
-                        display=f"!{cmd} - AI helper"
-                    )
-        else:
-            yield from PathCompleter().get_completions(document, complete_event)
+# False in batch mode, where nobody is there to answer a question
+interactive = True
+
+# Statistics of the last shell command, for !last
+last_exec = None
+
+# CAPYBARA_* settings in .env apply to everything configured below; the API key itself is resolved later
+load_env_file()
+
+
+# Built-in ! commands, for completion and for grouping timings
+COMMANDS = ["explain", "git", "find", "grep", "search", "readme", "sounds", "vibes", "soundpacks", "packs", "select", "cache", "pool", "last", "shell", "jobs", "fg", "kill", "stats", "help"]
 
+def make_completer():
+    """One completer for the whole session; its directory listings stay cached between prompts"""
+    from plugins.completion import HybridCompleter, soundpack_names, git_arguments
+    jobs = lambda arg: [str(job.id) for job in get_job_table(show_job_done).jobs()]
+    return HybridCompleter(COMMANDS, {
+        "select": soundpack_names(os.path.join(os.path.dirname(__file__), "sounds")),
+        "git": git_arguments,
+        "cache": lambda arg: ["clear"],
+        "shell": lambda arg: ["on", "off"],
+        "stats": lambda arg: ["export json", "export trace", "reset"],
+        "fg": jobs,
+        "kill": jobs,
+    })
+
+@timed("ai explain")
 def explain_command(cmd: str) -> str:
+    fuzzy = get_fuzzy_cache()
+    explanation = fuzzy.lookup("explain", cmd)
+    if explanation:
+        return explanation
+
     prompt = f"Explain this shell command in one line:\n{cmd}"
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+    explanation = cached_completion(
+        get_client(),
+        "gpt-4o-mini",
+        [{"role": "user", "content": prompt}],
+        temperature=0.7,
+        max_tokens=500
+    )
+    fuzzy.add("explain", cmd, explanation)
+    return explanation
+
+def grep_arguments(args: str) -> Tuple[str, bool]:
+    """Pattern and ignore-case flag of `!grep [-i] PATTERN`; one pair of quotes around the pattern is dropped"""
+    args = args.strip()
+    ignore_case = args == "-i" or args.startswith("-i ")
+    if ignore_case:
+        args = args[2:].strip()
+    if len(args) > 1 and args[0] == args[-1] and args[0] in "'\"":
+        args = args[1:-1]
+    return args, ignore_case
+
+class Elapsed:
+    """Spinner line with the time a command has been waiting, redrawn on every refresh"""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.monotonic()
+        # Only the REPL can cancel; batch commands run to completion
+        self.hint = " (Ctrl-C to cancel)" if current_token() is not None else ""
+        self.spinner = Spinner("dots", style="cyan")
+
+    def __rich__(self):
+        self.spinner.text = Text(f"{self.label} {time.monotonic() - self.started:.1f}s{self.hint}", style="dim")
+        return self.spinner
+
+def active_console() -> Console:
+    """The console this thread prints to; Live refreshes from its own thread, so it needs the real one"""
+    return console.current() if isinstance(console, ThreadLocalConsole) else console
+
+@contextmanager
+def busy(label: str):
+    """Show a spinner with the elapsed time while an AI call is outstanding"""
+    if not console.is_terminal:
+        yield
+        return
+    # Redirecting stdout is process-wide, and other threads may be printing
+    with Live(Elapsed(label), console=active_console(), refresh_per_second=12, transient=True,
+              redirect_stdout=False, redirect_stderr=False):
+        yield
+
+def render_streaming(generate, make_panel, make_final_panel=None) -> str:
+    """
+    Render a streamed completion incrementally in a Live panel.
+
+    generate receives an on_delta callback and returns the full text;
+    the last frame is replaced by make_final_panel(text) when given.
+    """
+    if not console.is_terminal:
+        # Nothing to animate when output is captured or piped, so ask for the whole answer at once
+        text = generate(None)
+        with timed("render panel"):
+            console.print((make_final_panel or make_panel)(text))
+        return text
+
+    chunks = []
+    last_update = 0.0
+    waiting = Elapsed("Thinking")
+
+    with Live(Group(make_panel(""), waiting), console=active_console(), refresh_per_second=12, vertical_overflow="ellipsis",
+              redirect_stdout=False, redirect_stderr=False) as live:
+        def on_delta(delta):
+            nonlocal last_update
+            chunks.append(delta)
+            # Markdown re-parses the whole text, so throttle rebuilds to the refresh rate
+            now = time.monotonic()
+            if now - last_update >= 1 / 12:
+                last_update = now
+                with timed("render panel"):
+                    live.update(Group(make_panel("".join(chunks)), waiting))
+
+        text = generate(on_delta)
+        with timed("render panel"):
+            live.update((make_final_panel or make_panel)(text))
+    return text
+
+@timed("ai fix")
+def request_fix(cmd: str, stderr: str) -> str:
+    return cached_completion(
+        get_client(),
+        "gpt-4o-mini",
+        [{"role": "user", "content": f"Fix this shell error concisely:\nCommand: {cmd}\nError: {stderr}\nProvide ONLY the corrected command."}],
         temperature=0.7,
         max_tokens=500
     )
-    return response.choices[0].message.content
+
+# Notices that arrived while a foreground command was running, printed before the next prompt
+pending_notices = []
+
+def print_above_prompt(print_fn):
+    """Run print_fn above the prompt if one is showing, else before the next one"""
+    app = session.app if session is not None else None
+    if app is None:
+        print_fn()
+    elif app.is_running and app.loop is not None:
+        from prompt_toolkit.application import run_in_terminal
+        app.loop.call_soon_threadsafe(lambda: run_in_terminal(print_fn))
+    else:
+        pending_notices.append(print_fn)
+
+def show_fix(fix: str):
+    """Print a fix suggestion, above the prompt if one is currently showing"""
+    def print_fix():
+        console.print(Panel.fit(
+            fix.strip(),
+            title="Try This",
+            border_style="red",
+            width=80
+        ))
+
+    print_above_prompt(print_fix)
+
+def show_job_done(job):
+    """Announce a finished background job"""
+    color = "green" if job.returncode == 0 else "red"
+    print_above_prompt(lambda: console.print(f"[{color}]{format_job(job)}[/{color}] [dim](!fg {job.id} for output)[/dim]"))
+
+auto_fixer = create_auto_fixer(request_fix, show_fix)
+
+def make_output_sink(page: bool = True) -> OutputSink:
+    # Bulk output goes to the binary stream under stdout, skipping decoding and Rich altogether
+    raw = sys.stdout.buffer if console.file is sys.stdout and hasattr(sys.stdout, "buffer") else None
+    return OutputSink(
+        console,
+        raw=raw,
+        rich_limit=int(float(os.getenv("CAPYBARA_RICH_OUTPUT_KB", RICH_LIMIT // 1024)) * 1024),
+        pager_limit=int(float(os.getenv("CAPYBARA_PAGER_MB", PAGER_LIMIT // 1024 // 1024)) * 1024 * 1024),
+        page=page and interactive and console.is_terminal
+    )
+
+def run_shell(cmd: str):
+    """Run a shell command, streaming its output to the console and, when it is huge, to the pager afterwards"""
+    sink = make_output_sink()
+    with timed("shell run"):
+        if persistent_shell_enabled():
+            tty = interactive and sys.stdin.isatty() and is_interactive(cmd)
+            result = get_shell_session().run(cmd, sink, tty=tty)
+        else:
+            result = run_streaming(
+                cmd,
+                sink,
+                tty_passthrough=interactive,
+                stdin=None if interactive else subprocess.DEVNULL
+            )
+    if sink.needs_newline:
+        console.file.write("\n")
+    try:
+        if sink.paged:
+            Pager(sink.spill_path, title=cmd, dropped=sink.dropped).run()
+    finally:
+        sink.discard()
+    return result
 
 def get_current_dir() -> str:
     cwd = os.getcwd()
     home = os.path.expanduser("~")
     return cwd.replace(home, "~")
 
+def command_name(cmd: str) -> str:
+    """Short label for a command line, used to group its timings"""
+    if cmd.startswith("?"):
+        return "?"
+    word = cmd.split(maxsplit=1)[0] if cmd.strip() else ""
+    if word.startswith("!") and word[1:] in COMMANDS:
+        return word
+    if cmd.endswith("&") and not cmd.endswith("&&"):
+        return "job"
+    if word == "cd":
+        return "cd"
+    return "shell"
+
 def execute_command(cmd: str):
-    global current_soundpack
+    with timed(f"command {command_name(cmd)}"):
+        dispatch_command(cmd)
+
+def dispatch_command(cmd: str):
+    global current_soundpack, last_exec
+    # A new command supersedes any fix still pending for the previous one
+    auto_fixer.cancel()
     try:
         if cmd.startswith("?"):
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": cmd[1:]}],
-                temperature=0.7,
-                max_tokens=1000
+            from rich.markdown import Markdown
+            render_streaming(
+                lambda on_delta: cached_completion(
+                    get_client(),
+                    "gpt-4o-mini",
+                    [{"role": "user", "content": cmd[1:]}],
+                    temperature=0.7,
+                    max_tokens=1000,
+                    on_delta=on_delta
+                ),
+                lambda text: Panel.fit(
+                    Markdown(text),
+                    title="Capybara",
+                    border_style="blue",
+                    width=80
+                ),
+                lambda text: Panel.fit(
+                    text,
+                    title="Capybara",
+                    border_style="blue",
+                    width=80
+                )
             )
-            console.print(Panel.fit(
-                response.choices[0].message.content,
-                title="Capybara",
-                border_style="blue",
-                width=80
-            ))
         elif cmd.startswith("!explain"):
-            explanation = explain_command(cmd[8:])
+            with busy("Explaining"):
+                explanation = explain_command(cmd[8:])
             console.print(Panel.fit(
                 explanation,
                 title="Explanation",
@@ -115,7 +300,8 @@ def execute_command(cmd: str):
             ))
         elif cmd.startswith("!git"):
             from plugins.git_helper import handle_git
-            suggestion = handle_git(cmd[4:].split())
+            with busy("Asking"):
+                suggestion = handle_git(cmd[4:].split())
             console.print(Panel.fit(
                 suggestion,
                 title="Git Suggestion",
@@ -124,30 +310,89 @@ def execute_command(cmd: str):
             ))
         elif cmd.startswith("!find"):
             from plugins.file_search import handle_find
-            search_cmd = handle_find(cmd[5:])
+            with busy("Searching"):
+                search_cmd = handle_find(cmd[5:])
             console.print(Panel.fit(
                 search_cmd,
                 title="File Search",
                 border_style="cyan",
                 width=80
             ))
+            if os.getenv("CAPYBARA_FIND_INDEX", "on").lower() not in ("0", "off", "false", "no"):
+                from plugins.file_index import format_find_result, get_file_index, too_broad
+                reason = too_broad(os.getcwd())
+                index = get_file_index(os.getcwd()) if reason is None else None
+                if reason:
+                    console.print(Text(f"Not run from the file index: {reason}", style="dim"))
+                # Batch mode waits for the first build; at the prompt it runs in the background
+                elif interactive and not index.ready():
+                    console.print(Text("Not run yet: the file index of this directory is being built in the "
+                                       "background, and !find answers from it once it is ready", style="dim"))
+                else:
+                    try:
+                        with busy("Searching the file index"):
+                            result = index.query(search_cmd)
+                        console.print(format_find_result(result))
+                    except ValueError as e:
+                        console.print(Text(f"Not run from the file index: {e}", style="dim"))
+        elif cmd.startswith("!grep") or cmd.startswith("!search"):
+            from plugins.content_search import format_match, format_search_summary, get_content_index
+            if cmd.startswith("!grep"):
+                pattern, ignore_case = grep_arguments(cmd[5:])
+            else:
+                from plugins.file_search import handle_search
+                with busy("Searching"):
+                    pattern, ignore_case = handle_search(cmd[7:]), False
+                console.print(Panel.fit(
+                    Text(pattern),
+                    title="Content Search",
+                    border_style="cyan",
+                    width=80
+                ))
+            if not pattern:
+                console.print("[yellow]Usage: !grep [-i] PATTERN or !search QUERY[/]")
+                return
+            from plugins.file_index import too_broad
+            reason = too_broad(os.getcwd())
+            if reason:
+                console.print(Text(f"Not searched: {reason}", style="dim"))
+                return
+            try:
+                with busy("Updating the content index"):
+                    result = get_content_index(os.getcwd()).search(pattern, ignore_case)
+            except ValueError as e:
+                console.print(Text(str(e), style="red"))
+                return
+            # Printed as the files are read, rather than once every match is in
+            for match in result:
+                console.print(format_match(*match))
+            console.print(format_search_summary(result))
         elif cmd.startswith("!readme"):
-            from plugins.readme_generator import handle_readme_generation
+            from plugins.readme_generator import handle_readme_generation, get_last_context_report, get_last_reuse_report
+            from plugins.readme_manifest import format_reuse_report
+            from plugins.context_packer import format_pack_report
+            from rich.markdown import Markdown
             console.print("[yellow]Generating README... This may take a moment.[/]")
-            readme_content = handle_readme_generation(cmd[7:].split())
-            console.print(Panel(
-                Markdown(readme_content),
-                title="Generated README",
-                border_style="green",
-                width=100
-            ))
+            readme_content = render_streaming(
+                lambda on_delta: handle_readme_generation(cmd[7:].split(), on_delta=on_delta),
+                lambda text: Panel(
+                    Markdown(text),
+                    title="Generated README",
+                    border_style="green",
+                    width=100
+                )
+            )
+            if get_last_context_report():
+                console.print(Text(format_pack_report(get_last_context_report()), style="dim"))
+            if get_last_reuse_report():
+                console.print(Text(format_reuse_report(get_last_reuse_report()), style="dim"))
             # Ask if user wants to save
-            save = input("\nSave to README.md? (y/n): ").strip().lower()
+            save = input("\nSave to README.md? (y/n): ").strip().lower() if interactive else "n"
             if save == 'y':
                 with open("README.md", "w", encoding="utf-8") as f:
                     f.write(readme_content)
                 console.print("[green]✓ Saved to README.md[/]")
-        elif cmd.startswith("cd"):
+        elif cmd.startswith("cd") and not persistent_shell_enabled():
             try:
                 path = os.path.expanduser(cmd[3:].strip() or "~")
                 os.chdir(path)
@@ -201,6 +446,8 @@ def execute_command(cmd: str):
             ))
             if soundpacks:
                 console.print("[dim]Use [bold]!select <number|name>[/bold] to choose a soundpack[/dim]")
+                # !select or !sounds usually follows, so open the audio device now
+                warm_up_sounds()
         
         elif cmd.startswith("!select "):
             # Select a soundpack
@@ -240,6 +487,109 @@ def execute_command(cmd: str):
                     border_style="red",
                     width=80
                 ))
+        elif cmd == "!cache" or cmd.startswith("!cache "):
+            cache = get_cache()
+            if cmd[6:].strip() == "clear":
+                removed = cache.clear()
+                similar = get_fuzzy_cache().clear()
+                console.print(Panel.fit(
+                    f"[green]✓ Cleared {removed} cached responses and {similar} remembered queries[/green]",
+                    title="Response Cache",
+                    border_style="green",
+                    width=80
+                ))
+            else:
+                console.print(Panel.fit(
+                    format_cache_stats(cache.stats()) + "\n\n" + format_fuzzy_stats(get_fuzzy_cache().stats())
+                    + "\n\n" + format_resolver_stats(resolver_stats()),
+                    title="Response Cache",
+                    border_style="cyan",
+                    width=80
+                ))
+                console.print("[dim]Use [bold]!cache clear[/bold] to drop all cached responses[/dim]")
+        elif cmd == "!pool":
+            router = get_router()
+            console.print(Panel.fit(
+                format_connection_stats(connection_stats()) + "\n\n" + format_router_status(router.status(), router.hedges),
+                title="Connection Pool",
+                border_style="cyan",
+                width=80
+            ))
+        elif cmd.endswith("&") and not cmd.endswith("&&") and cmd[:-1].strip():
+            job = get_job_table(show_job_done).start(cmd[:-1].strip())
+            console.print(f"[dim][{job.id}] {job.proc.pid}[/dim]")
+        elif cmd == "!jobs":
+            console.print(Panel.fit(
+                format_jobs(get_job_table(show_job_done).jobs()),
+                title="Jobs",
+                border_style="cyan",
+                width=100
+            ))
+        elif cmd.startswith("!fg") or cmd.startswith("!kill"):
+            jobs = get_job_table(show_job_done)
+            name, _, arg = cmd.partition(" ")
+            arg = arg.strip().lstrip("%")
+            if not arg:
+                # Like a shell, default to the most recent job
+                arg = str(jobs.jobs()[-1].id) if jobs.jobs() else ""
+            job = jobs.get(int(arg)) if arg.isdigit() else None
+            if job is None:
+                console.print(f"[red]No such job: {arg or '(none)'}[/red] [dim]- see !jobs[/dim]")
+            elif name == "!kill":
+                jobs.kill(job.id)
+                console.print(format_job(job))
+            else:
+                console.print(f"[dim]{format_job(job)}[/dim]")
+                if job.dropped_bytes:
+                    console.print(f"[dim]… {format_size(job.dropped_bytes)} of earlier output not kept[/dim]")
+                sink = make_output_sink(page=False)
+                jobs.foreground(job.id, sink.stdout)
+                sink.flush()
+                if sink.needs_newline:
+                    console.file.write("\n")
+                console.print(f"[dim]{format_job(job)}[/dim]")
+        elif cmd == "!shell" or cmd.startswith("!shell "):
+            action = cmd[6:].strip().lower()
+            if action in ("on", "off"):
+                set_persistent_shell(action == "on")
+            console.print(Panel.fit(
+                format_session_status(get_shell_session(), persistent_shell_enabled()),
+                title="Shell",
+                border_style="cyan",
+                width=80
+            ))
+        elif cmd == "!last":
+            console.print(Panel.fit(
+                format_exec_result(last_exec) if last_exec else "[dim]No shell command has run yet[/dim]",
+                title="Last Command",
+                border_style="cyan",
+                width=80
+            ))
+        elif cmd == "!stats" or cmd.startswith("!stats "):
+            args = cmd[6:].split()
+            metrics = get_metrics()
+            if args[:1] == ["reset"]:
+                metrics.reset()
+                console.print("[green]✓ Timings reset[/green]")
+            elif args[:1] == ["export"]:
+                fmt = args[1] if len(args) > 1 else "json"
+                if fmt not in ("json", "trace"):
+                    raise ValueError("Use !stats export json|trace [path]")
+                path = args[2] if len(args) > 2 else f"capybara-{'trace' if fmt == 'trace' else 'stats'}.json"
+                if fmt == "trace":
+                    metrics.export_trace(path)
+                else:
+                    metrics.export_json(path)
+                console.print(f"[green]✓ Wrote {path}[/green]")
+            else:
+                console.print(Panel.fit(
+                    format_stats(metrics.snapshot()),
+                    title="Latency",
+                    border_style="cyan",
+                    width=100
+                ))
+                if not metrics.enabled:
+                    console.print("[dim]Recording is off (CAPYBARA_STATS=off)[/dim]")
         elif cmd == "!help":
             console.print(Panel.fit(
                 Text.from_markup("""
@@ -247,11 +597,21 @@ def execute_command(cmd: str):
 [cyan]?[query][/]         - Ask Capybara anything
 [yellow]!explain [cmd][/] - Explain shell commands
 [green]!git [action][/]     - Smart Git helper
-[magenta]!find [query][/]    - Natural language file search
+[magenta]!find [query][/]    - Natural language file search, answered from a file index
+[magenta]!grep [-i] [regex][/] - Search file contents through a trigram index
+[magenta]!search [query][/]  - Natural language content search
 [blue]!readme [path][/]   - Generate README for a repository
 [bold green]!sounds / !vibes[/] - Toggle keyboard sounds
 [bold cyan]!soundpacks[/]      - List available soundpacks
 [bold cyan]!select <name>[/]   - Select a soundpack
+[bold blue]!cache [dim](clear)[/dim][/]   - Show AI cache hit rate / clear it
+[bold blue]!pool[/]            - Show API connection reuse and model health
+[bold blue]!last[/]            - Show exit status, output size and peak memory of the last command
+[bold blue]!shell [dim](on|off)[/dim][/]   - Keep one shell running so exports and aliases persist
+[bold blue]cmd &[/]            - Run a command in the background
+[bold blue]!jobs / !fg N / !kill N[/] - List, follow or stop background jobs
+[bold blue]!stats [dim](export json|trace, reset)[/dim][/] - Latency histograms of commands, AI calls and completion
+[bold blue]Ctrl-C[/]           - Cancel a running ?, !explain, !git, !find, !grep or !search request
 [dim]exit/quit - Exit shell"""),
                 title="Help",
                 border_style="blue",
@@ -259,29 +619,9 @@ def execute_command(cmd: str):
             ))
 
         else:
-            result = subprocess.run(
-                cmd, shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-            if result.stdout:
-                console.print(result.stdout)
-            if result.stderr:
-                console.print(f"[red]{result.stderr}[/]")
-            if result.returncode != 0:
-                fix_response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[{"role": "user", "content": f"Fix this shell error concisely:\nCommand: {cmd}\nError: {result.stderr}\nProvide ONLY the corrected command."}],
-                    temperature=0.7,
-                    max_tokens=500
-                )
-                console.print(Panel.fit(
-                    fix_response.choices[0].message.content.strip(),
-                    title="Try This",
-                    border_style="red",
-                    width=80
-                ))
+            last_exec = run_shell(cmd)
+            if last_exec.returncode != 0:
+                auto_fixer.submit(cmd, last_exec.returncode, last_exec.stderr_tail)
     except Exception as e:
         console.print(Panel.fit(
             f"Error: {str(e)}\nType [b]!help[/] for assistance",
@@ -289,7 +629,26 @@ def execute_command(cmd: str):
             width=80
         ))
 
-def run_cli():
+def warm_up():
+    """Load what the first AI command needs in the background, after the prompt is up"""
+    def load():
+        try:
+            get_fuzzy_cache().warm()
+            get_client()
+            import rich.markdown  # noqa: F401 - parsed on first use by ? and !readme
+        except Exception:
+            pass
+
+    threading.Thread(target=load, daemon=True, name="capybara-warmup").start()
+
+def run_cli(startup_only: bool = False):
+    """
+    Show the banner and run the prompt loop.
+
+    With startup_only, exit the process as soon as the prompt would be shown;
+    --profile-startup times that.
+    """
+    global session, console
     try:
         with open("ascii.txt", "r", encoding="utf-8") as f:
             capybara_art = f.read()
@@ -304,29 +663,196 @@ def run_cli():
         subtitle_align="right"
     ))
 
-    while True:
-        try:
-            user_input = session.prompt(
-                f"CapybaraCLI {get_current_dir()}> ",
-                completer=HybridCompleter(),
-                auto_suggest=AutoSuggestFromHistory()
-            ).strip()
+    # Resolve the API key before the prompt, so a missing key is asked for up front
+    get_config()
+    # prompt_toolkit is the largest import left, so it loads after the banner is on screen
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.auto_suggest import ThreadedAutoSuggest
+    from prompt_toolkit.completion import ThreadedCompleter
+    from prompt_toolkit.history import ThreadedHistory
+    from plugins.history_store import get_history_store, StoreHistory, FrecencyAutoSuggest
+    history = get_history_store()
+    session = PromptSession(
+        # History loads, completes and suggests off the main thread, so typing never waits on disk
+        history=ThreadedHistory(StoreHistory(history)),
+        completer=ThreadedCompleter(make_completer()),
+        auto_suggest=ThreadedAutoSuggest(FrecencyAutoSuggest(history))
+    )
+    if startup_only:
+        sys.stdout.flush()
+        os._exit(0)
+    warm_up()
+    # AI commands run on worker threads with their own consoles; everything else prints as before
+    console = ThreadLocalConsole(default=console)
+
+    async def repl():
+        while True:
+            try:
+                while pending_notices:
+                    pending_notices.pop(0)()
+                user_input = (await session.prompt_async(f"CapybaraCLI {get_current_dir()}> ")).strip()
+
+                if not user_input:
+                    continue
+                if user_input.lower() in ["exit", "quit"]:
+                    break
 
-            if not user_input:
+                if is_cancellable(user_input):
+                    await run_cancellable(user_input)
+                else:
+                    execute_command(user_input)
+
+            except KeyboardInterrupt:
+                console.print(Panel.fit(
+                    Text.from_markup("\n[yellow]Use 'exit' to quit[/]")
+                ))
                 continue
-            if user_input.lower() in ["exit", "quit"]:
+            except EOFError:
                 break
 
-            execute_command(user_input)
+    # Not asyncio.run: that installs its own Ctrl-C handler, which would stop Ctrl-C reaching shell commands
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(repl())
+    finally:
+        loop.close()
+
+def is_cancellable(cmd: str) -> bool:
+    """AI commands that only print, so they can be abandoned midway; !readme asks a question, so it is not one"""
+    return is_concurrent(cmd)
 
-        except KeyboardInterrupt:
-            console.print(Panel.fit(
-                Text.from_markup("\n[yellow]Use 'exit' to quit[/]")
-            ))
-            continue
+async def run_cancellable(cmd: str):
+    """
+    Run an AI command on a worker thread while the event loop watches for Ctrl-C.
+
+    Ctrl-C returns to the prompt at once: the command's token is set so its stream
+    and retries stop at the next check, and its remaining output is dropped.
+    """
+    loop = asyncio.get_running_loop()
+    real = console.current()
+    gate = GatedFile(real.file)
+    worker_console = Console(file=gate, force_terminal=real.is_terminal, color_system=real.color_system,
+                             width=real.width)
+    token = threading.Event()
+
+    def work():
+        with cancel_scope(token):
+            console.run_with(worker_console, execute_command, cmd)
+
+    started = time.monotonic()
+    done = loop.run_in_executor(None, work)
+    interrupted = loop.create_future()
+    try:
+        loop.add_signal_handler(signal.SIGINT, lambda: interrupted.done() or interrupted.set_result(None))
+    except (NotImplementedError, RuntimeError):
+        # No loop signal handlers on Windows: the command runs to completion
+        await done
+        return
+    try:
+        await asyncio.wait([done, interrupted], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+
+    if not interrupted.done():
+        interrupted.cancel()
+        done.result()
+        return
+    token.set()
+    gate.close()
+    # The worker finishes in the background; whatever it raises has nowhere to go
+    done.add_done_callback(lambda f: f.cancelled() or f.exception())
+    real.show_cursor(True)
+    real.print(f"\n[yellow]Cancelled after {time.monotonic() - started:.1f}s[/]")
+
+class ThreadLocalConsole:
+    """Console stand-in that lets each worker thread print to its own console; other threads use default"""
+
+    def __init__(self, default: Console = None, **options):
+        self._default = default
+        self._options = options
+        self._local = threading.local()
+
+    def current(self) -> Console:
+        current = getattr(self._local, "console", None) or self._default
+        if current is None:
+            raise AttributeError("no console for this thread")
+        return current
+
+    def run_with(self, target: Console, fn, *args):
+        self._local.console = target
+        try:
+            return fn(*args)
+        finally:
+            self._local.console = None
+
+    def run_captured(self, fn, *args) -> str:
+        buffer = io.StringIO()
+        self.run_with(Console(file=buffer, **self._options), fn, *args)
+        return buffer.getvalue()
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+class GatedFile:
+    """Text stream that passes writes through until closed, so an abandoned command cannot print over the prompt"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._open = True
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._open = False
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            if self._open:
+                self._stream.write(text)
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            if self._open:
+                self._stream.flush()
+
+    def isatty(self) -> bool:
+        return self._stream.isatty()
+
+    def fileno(self) -> int:
+        return self._stream.fileno()
+
+    @property
+    def encoding(self) -> str:
+        return getattr(self._stream, "encoding", "utf-8")
+
+def run_batch_mode(path: str, jobs: int = DEFAULT_JOBS, fmt: str = "text") -> int:
+    """Run commands from a file ('-' for stdin), printing results in input order. Returns an exit status."""
+    global console, interactive
+    interactive = False
+    get_config()
+    get_fuzzy_cache().warm()
+    # A fix belongs next to the command that failed, not wherever a background thread lands it
+    auto_fixer.background = False
+    console = ThreadLocalConsole(width=100)
+
+    source = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        commands = itertools.takewhile(lambda item: item[1].lower() not in ["exit", "quit"], read_commands(source))
+        errors = run_batch(
+            commands,
+            lambda cmd: console.run_captured(execute_command, cmd),
+            make_emitter(fmt),
+            jobs=jobs
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return 1 if errors else 0
 
 def render_markdown(content: str, width: int = 80) -> Panel:
     """Render markdown content with proper formatting"""
+    from rich.markdown import Markdown
     return Panel(
         Markdown(content.strip()),
         border_style="blue",
@@ -335,5 +861,29 @@ def render_markdown(content: str, width: int = 80) -> Panel:
         padding=(1, 2)
     )
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description="Capybara Smart CLI")
+    parser.add_argument("--batch", metavar="FILE", help="run commands from FILE ('-' for stdin) instead of prompting")
+    parser.add_argument("--jobs", type=int, default=int(os.getenv("CAPYBARA_BATCH_JOBS", DEFAULT_JOBS)),
+                        help="AI commands to run at once in batch mode")
+    parser.add_argument("--format", choices=["text", "jsonl"], default="text", help="batch output format")
+    parser.add_argument("--profile-startup", action="store_true", help="report time to the first prompt and per-import timings")
+    parser.add_argument("--startup-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        from plugins.startup_profile import profile_startup, format_startup_profile
+        try:
+            console.print(format_startup_profile(profile_startup(__file__)))
+        except RuntimeError as e:
+            console.print(Text(str(e), style="red"))
+            sys.exit(1)
+        return
+    if args.startup_only:
+        run_cli(startup_only=True)
+    if args.batch:
+        sys.exit(run_batch_mode(args.batch, args.jobs, args.format))
     run_cli()
+
+if __name__ == "__main__":
+    main()
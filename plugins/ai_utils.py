@@ -1,28 +1,79 @@
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
+from .cancellation import check_cancelled, current_token
+from .client_provider import get_client
+from .instrumentation import timed
+from .model_router import get_router
+from .response_cache import get_cache, make_key
 
 models = ["gpt-4o-mini", "gpt-3.5-turbo", "gpt-4o"]
 
 
 def get_openai_client():
-    """Initialize and return OpenAI client with API key from .env file"""
-    # Get the directory where this script is located, then go up one level to workspace root
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    workspace_root = os.path.dirname(script_dir)
-    env_path = os.path.join(workspace_root, ".env")
-    
-    # Load environment variables from .env file
-    load_dotenv(env_path)
+    """Return the shared, pooled OpenAI client"""
+    return get_client()
+
+
+def cached_completion(client, model, messages, max_tokens=1000, temperature=0.7, on_delta=None, timeout=None):
+    """
+    Run a chat completion through the persistent response cache
     
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in .env file")
+    Args:
+        on_delta: Optional callback receiving text chunks as they stream in.
+            Cache hits are delivered as a single chunk.
+        timeout: Optional per-request deadline in seconds (not part of the cache key)
     
-    return OpenAI(api_key=api_key)
+    Returns:
+        The message content of the first choice
+    """
+    key = make_key(model, messages, max_tokens=max_tokens, temperature=temperature)
+    streamed = False
+    token = current_token()
+    request_options = {"timeout": timeout} if timeout else {}
+
+    @timed(f"openai {model}")
+    def compute():
+        nonlocal streamed
+        if on_delta is None:
+            response = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **request_options
+            )
+            return response.choices[0].message.content
+
+        parts = []
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **request_options
+        )
+        try:
+            for chunk in stream:
+                # Stopping here closes the connection, so a cancelled answer is not paid for in full
+                check_cancelled(token)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    streamed = True
+                    parts.append(delta)
+                    on_delta(delta)
+        finally:
+            stream.close()
+        return "".join(parts)
+
+    content = get_cache().get_or_compute(key, compute, token)
+    if on_delta is not None and not streamed and content:
+        on_delta(content)
+    return content
 
 
-def generate_content(prompt, model_names=models, max_tokens=1000, temperature=0.7):
+@timed("ai generate_content")
+def generate_content(prompt, model_names=models, max_tokens=1000, temperature=0.7, on_delta=None):
     """
     Generate content using OpenAI API with fallback models
     
@@ -31,24 +82,49 @@ def generate_content(prompt, model_names=models, max_tokens=1000, temperature=0.
         model_names: List of model names to try (in order)
         max_tokens: Maximum tokens in response
         temperature: Sampling temperature (0-2)
+        on_delta: Optional callback receiving text chunks as they stream in
     
     Returns:
         Generated text content
     """
-    last_exception = None
-    client = get_openai_client()
-    
+    messages = [{"role": "user", "content": prompt}]
+    cache = get_cache()
+
+    # Any model's cached answer is good enough and costs no round trip
     for model_name in model_names:
-        try:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            last_exception = e
-            continue
-    
-    raise RuntimeError(f"All OpenAI models failed. Last error: {last_exception}")
+        cached = cache.lookup(make_key(model_name, messages, max_tokens=max_tokens, temperature=temperature))
+        if cached is not None:
+            if on_delta:
+                on_delta(cached)
+            return cached.strip()
+
+    client = get_openai_client()
+    emitted = False
+    # Attempts run on the router's threads, which do not see the caller's token
+    token = current_token()
+
+    def forward(delta):
+        nonlocal emitted
+        check_cancelled(token)
+        emitted = True
+        on_delta(delta)
+
+    def attempt(model_name, timeout):
+        check_cancelled(token)
+        if emitted:
+            # Falling back after partial output would splice two answers together
+            raise RuntimeError("response stream broke off after partial output")
+        return cached_completion(
+            client,
+            model_name,
+            messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            on_delta=forward if on_delta else None,
+            timeout=timeout
+        )
+
+    # Hedging would interleave two streams, so streaming callers only get sequential fallback
+    streaming = on_delta is not None
+    content = get_router().call(list(model_names), attempt, hedge=not streaming, enforce_deadline=not streaming)
+    return content.strip()
@@ -0,0 +1,98 @@
+"""
+Background auto-fix suggestions for failed shell commands
+The fix is requested off the main thread so the prompt comes back immediately
+"""
+import os
+import re
+import threading
+from typing import Callable, Iterable, Optional
+
+ERROR_CLASSES = ("not_found", "permission", "usage", "interrupted", "other")
+DEFAULT_ERROR_CLASSES = ("not_found", "permission", "usage", "other")
+
+
+def classify_error(returncode: int, stderr: str) -> str:
+    """Map an exit status and stderr text to a coarse error class."""
+    text = (stderr or "").lower()
+
+    if returncode < 0 or returncode in (130, 137, 143):
+        return "interrupted"
+    if returncode == 127 or "command not found" in text or "is not recognized" in text:
+        return "not_found"
+    if returncode == 126 or "permission denied" in text:
+        return "permission"
+    if returncode == 2 or re.search(r"usage:|invalid option|unknown option|unrecognized option|syntax error", text):
+        return "usage"
+    return "other"
+
+
+class AutoFixer:
+    def __init__(self, request_fix: Callable[[str, str], str], show: Callable[[str], None],
+                 min_delay: float = 0.0, error_classes: Iterable[str] = DEFAULT_ERROR_CLASSES,
+                 enabled: bool = True, background: bool = True):
+        """
+        Initialize the auto-fixer.
+
+        Args:
+            request_fix: Called as request_fix(cmd, stderr) on a worker thread; returns the suggestion
+            show: Called with the suggestion once it arrives, unless cancelled
+            min_delay: Seconds to wait before requesting a fix; a new command within
+                this window cancels it without any network call
+            error_classes: Error classes (see classify_error) that get a fix at all
+            enabled: When False, submit never requests anything
+            background: When False, submit waits for the fix and shows it before returning
+        """
+        self.request_fix = request_fix
+        self.show = show
+        self.min_delay = min_delay
+        self.error_classes = set(error_classes)
+        self.enabled = enabled
+        self.background = background
+        self._cancel: Optional[threading.Event] = None
+        self._lock = threading.Lock()
+
+    def submit(self, cmd: str, returncode: int, stderr: str) -> bool:
+        """Start a background fix request for a failed command. Returns True if one was started."""
+        self.cancel()
+        if not self.enabled or classify_error(returncode, stderr) not in self.error_classes:
+            return False
+
+        cancel = threading.Event()
+        if not self.background:
+            self._run(cmd, stderr, cancel, delay=False)
+            return True
+
+        with self._lock:
+            self._cancel = cancel
+        threading.Thread(target=self._run, args=(cmd, stderr, cancel), daemon=True).start()
+        return True
+
+    def cancel(self):
+        """Drop any pending fix; a response that is already in flight is discarded."""
+        with self._lock:
+            if self._cancel is not None:
+                self._cancel.set()
+                self._cancel = None
+
+    def _run(self, cmd: str, stderr: str, cancel: threading.Event, delay: bool = True):
+        if delay and self.min_delay > 0 and cancel.wait(self.min_delay):
+            return
+        try:
+            fix = self.request_fix(cmd, stderr)
+        except Exception:
+            # A suggestion is best effort; never surface a failure over the next prompt
+            return
+        if fix and not cancel.is_set():
+            self.show(fix)
+
+
+def create_auto_fixer(request_fix: Callable[[str, str], str], show: Callable[[str], None]) -> AutoFixer:
+    """Build an AutoFixer configured from CAPYBARA_AUTOFIX* environment variables."""
+    classes = os.getenv("CAPYBARA_AUTOFIX_ERRORS")
+    return AutoFixer(
+        request_fix,
+        show,
+        min_delay=float(os.getenv("CAPYBARA_AUTOFIX_DELAY", 0)),
+        error_classes=[c.strip() for c in classes.split(",") if c.strip()] if classes else DEFAULT_ERROR_CLASSES,
+        enabled=os.getenv("CAPYBARA_AUTOFIX", "on").lower() not in ("0", "off", "false", "no"),
+    )
@@ -0,0 +1,125 @@
+"""
+Non-interactive batch execution of CLI commands
+AI-only commands run concurrently on a bounded worker pool; everything else runs in order
+"""
+import json
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TextIO, Tuple
+
+# These only ask the AI or read an index and print, so they do not depend on each other
+CONCURRENT_PREFIXES = ("?", "!explain", "!git", "!find", "!grep", "!search")
+# These answer for the current directory, which an earlier cd (or any other in-order command) may change
+CWD_PREFIXES = ("!find", "!grep", "!search")
+DEFAULT_JOBS = 4
+
+
+def is_concurrent(cmd: str) -> bool:
+    """Whether cmd can run out of order on a worker thread."""
+    return cmd.startswith(CONCURRENT_PREFIXES)
+
+
+def depends_on_cwd(cmd: str) -> bool:
+    """Whether cmd reads the current directory, so it must not start before earlier in-order commands ran."""
+    return cmd.startswith(CWD_PREFIXES)
+
+
+def read_commands(source: TextIO) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, command) for each non-blank, non-comment line."""
+    for number, line in enumerate(source, 1):
+        cmd = line.strip()
+        if cmd and not cmd.startswith("#"):
+            yield number, cmd
+
+
+class BatchResult:
+    def __init__(self, line: int, command: str, output: str = "", elapsed: float = 0.0,
+                 error: Optional[str] = None):
+        self.line = line
+        self.command = command
+        self.output = output
+        self.elapsed = elapsed
+        self.error = error
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "line": self.line,
+            "command": self.command,
+            "output": self.output,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "error": self.error,
+        }, ensure_ascii=False)
+
+    def to_text(self) -> str:
+        text = f"> {self.command}\n{self.output}"
+        if self.error:
+            text += f"Error: {self.error}\n"
+        return text
+
+
+def _timed(run_one: Callable[[str], str], line: int, cmd: str) -> BatchResult:
+    started = time.perf_counter()
+    try:
+        output = run_one(cmd)
+        return BatchResult(line, cmd, output, time.perf_counter() - started)
+    except Exception as e:
+        return BatchResult(line, cmd, "", time.perf_counter() - started, str(e))
+
+
+def run_batch(commands: Iterable[Tuple[int, str]], run_one: Callable[[str], str],
+              emit: Callable[[BatchResult], None], jobs: int = DEFAULT_JOBS) -> int:
+    """
+    Run commands and emit their results in input order.
+
+    AI-only commands are submitted to the pool as soon as they are read, up to
+    a lookahead window of a few commands per worker. Other commands run on
+    the calling thread when they reach the head of the queue, so shell
+    commands, cd and sound settings keep their original order. A command
+    that reads the current directory runs in order too while an earlier
+    in-order command has yet to run, so it sees that command's cd.
+
+    Args:
+        commands: (line number, command) pairs, e.g. from read_commands
+        run_one: Executes one command and returns its captured output
+        emit: Receives each result, in input order
+        jobs: Maximum AI commands in flight
+
+    Returns:
+        Number of results that carried an error
+    """
+    jobs = max(1, jobs)
+    window = jobs * 4
+    pending = deque()
+    errors = 0
+
+    def finish_head():
+        nonlocal errors
+        line, cmd, future = pending.popleft()
+        result = future.result() if future is not None else _timed(run_one, line, cmd)
+        if result.error:
+            errors += 1
+        emit(result)
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="capybara-batch") as pool:
+        for line, cmd in commands:
+            concurrent = is_concurrent(cmd)
+            if concurrent and depends_on_cwd(cmd):
+                concurrent = all(future is not None for _, _, future in pending)
+            future = pool.submit(_timed, run_one, line, cmd) if concurrent else None
+            pending.append((line, cmd, future))
+            while len(pending) > window or (pending and pending[0][2] is not None and pending[0][2].done()):
+                finish_head()
+        while pending:
+            finish_head()
+
+    return errors
+
+
+def make_emitter(fmt: str, out: TextIO = sys.stdout) -> Callable[[BatchResult], None]:
+    """Return an emit callback writing text or JSON lines to out."""
+    def emit(result: BatchResult):
+        out.write(result.to_json() + "\n" if fmt == "jsonl" else result.to_text())
+        out.flush()
+    return emit
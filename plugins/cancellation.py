@@ -0,0 +1,44 @@
+"""
+Cooperative cancellation for commands running on worker threads
+A thread cannot be interrupted from outside, so long-running steps check the command's token and stop early
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+
+class Cancelled(Exception):
+    """Raised inside work whose command was cancelled."""
+
+    def __init__(self):
+        super().__init__("cancelled")
+
+
+_current: ContextVar[Optional[threading.Event]] = ContextVar("capybara_cancel", default=None)
+
+
+def current_token() -> Optional[threading.Event]:
+    """The running command's token, if it can be cancelled.
+
+    Context variables do not follow work handed to a thread pool, so capture
+    the token before doing that and pass it to check_cancelled explicitly.
+    """
+    return _current.get()
+
+
+@contextmanager
+def cancel_scope(token: threading.Event):
+    """Make token the current command's token for the duration of the block."""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def check_cancelled(token: Optional[threading.Event] = None):
+    """Raise Cancelled if token (default: the current one) has been set."""
+    token = token if token is not None else _current.get()
+    if token is not None and token.is_set():
+        raise Cancelled()
@@ -0,0 +1,187 @@
+"""
+Shared OpenAI client provider
+Loads configuration once and keeps a single keep-alive connection pool for every AI call
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_KEEPALIVE = 30.0
+
+
+def load_env_file():
+    """Copy settings from the .env file next to cli.py into the environment, if there is one."""
+    env_file = Path(__file__).parent.parent / ".env"
+    if env_file.exists():
+        with open(env_file) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    value = value.strip().strip('"').strip("'")
+                    os.environ[key.strip()] = value
+
+
+def load_config() -> dict:
+    """
+    Resolve the OpenAI API key.
+
+    Order: .env next to cli.py, OPENAI_API_KEY environment variable,
+    config.yaml, and finally an interactive prompt that writes config.yaml.
+    """
+    load_env_file()
+
+    if os.environ.get("OPENAI_API_KEY"):
+        return {"openai_api_key": os.environ["OPENAI_API_KEY"]}
+
+    import yaml
+    try:
+        with open("config.yaml") as f:
+            return yaml.safe_load(f)
+    except FileNotFoundError:
+        api_key = input("Enter OpenAI API Key: ").strip()
+        config = {"openai_api_key": api_key}
+        with open("config.yaml", "w") as f:
+            yaml.dump(config, f)
+        return config
+
+
+class ConnectionStats:
+    """Counts requests against freshly opened connections to show keep-alive reuse."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+        self.handshake_seconds = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def record_handshake(self, seconds: float):
+        with self._lock:
+            self.handshake_seconds += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            avg_handshake = self.handshake_seconds / self.new_connections if self.new_connections else 0.0
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused": reused,
+                "avg_handshake_ms": avg_handshake * 1000,
+                "saved_ms": reused * avg_handshake * 1000,
+            }
+
+
+def _tracing_transport(stats: ConnectionStats, **kwargs):
+    """
+    HTTP transport that reports connection setup through httpcore trace events.
+
+    httpx is imported here rather than at module load, since it is only needed
+    once the first AI request is made.
+    """
+    import httpx
+
+    class TracingTransport(httpx.HTTPTransport):
+        def handle_request(self, request: httpx.Request) -> httpx.Response:
+            started = {}
+
+            def trace(event_name, info):
+                if event_name.endswith(".started"):
+                    started[event_name[:-len(".started")]] = time.perf_counter()
+                elif event_name == "connection.connect_tcp.complete":
+                    stats.record_connect()
+                    stats.record_handshake(time.perf_counter() - started.get("connection.connect_tcp", time.perf_counter()))
+                elif event_name == "connection.start_tls.complete":
+                    stats.record_handshake(time.perf_counter() - started.get("connection.start_tls", time.perf_counter()))
+
+            request.extensions["trace"] = trace
+            stats.record_request()
+            return super().handle_request(request)
+
+    return TracingTransport(**kwargs)
+
+
+# Global instance
+_config: Optional[dict] = None
+_client: Optional["OpenAI"] = None
+_stats = ConnectionStats()
+_lock = threading.Lock()
+
+
+def get_config() -> dict:
+    """Return the resolved configuration, loading it on first use."""
+    global _config
+
+    with _lock:
+        if _config is None:
+            _config = load_config()
+        return _config
+
+
+def get_client() -> "OpenAI":
+    """
+    Return the shared OpenAI client.
+
+    The openai package takes most of a second to import, so it is loaded on
+    first use (or by the CLI's background warm-up) rather than at startup.
+
+    Pool size and timeouts come from CAPYBARA_POOL_SIZE, CAPYBARA_TIMEOUT,
+    CAPYBARA_CONNECT_TIMEOUT and CAPYBARA_KEEPALIVE.
+    """
+    global _client
+
+    config = get_config()
+    with _lock:
+        if _client is None:
+            import httpx
+            from openai import OpenAI
+
+            pool_size = int(os.getenv("CAPYBARA_POOL_SIZE", DEFAULT_POOL_SIZE))
+            limits = httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=float(os.getenv("CAPYBARA_KEEPALIVE", DEFAULT_KEEPALIVE)),
+            )
+            timeout = httpx.Timeout(
+                float(os.getenv("CAPYBARA_TIMEOUT", DEFAULT_TIMEOUT)),
+                connect=float(os.getenv("CAPYBARA_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+            )
+            http_client = httpx.Client(
+                transport=_tracing_transport(_stats, limits=limits),
+                timeout=timeout,
+                follow_redirects=True,
+            )
+            _client = OpenAI(api_key=config["openai_api_key"], http_client=http_client)
+        return _client
+
+
+def connection_stats() -> dict:
+    """Return connection reuse counters for the shared client."""
+    return _stats.snapshot()
+
+
+def format_connection_stats(stats: dict) -> str:
+    """Format connection reuse statistics for display."""
+    return "\n".join([
+        f"[bold]Requests:[/bold]         {stats['requests']}",
+        f"[bold]New connections:[/bold]  {stats['new_connections']}",
+        f"[bold]Reused:[/bold]           {stats['reused']}",
+        f"[bold]Avg handshake:[/bold]    {stats['avg_handshake_ms']:.1f} ms",
+        f"[bold]Saved (est.):[/bold]     {stats['saved_ms']:.0f} ms",
+    ])
@@ -0,0 +1,225 @@
+"""
+Tab completion for the prompt
+Directory listings are cached and checked against the directory's mtime, so a keystroke costs
+one stat and a binary search instead of re-reading the directory
+"""
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from prompt_toolkit.completion import Completer, Completion
+
+from .instrumentation import timed
+from .soundpack_manager import discover_soundpacks
+
+MAX_COMPLETIONS = 1000
+MAX_CACHED_DIRS = 64
+
+# Requests the offline git grammar answers without an AI call
+GIT_PHRASES = [
+    "status", "branches", "all branches", "diff", "unstaged changes", "staged changes",
+    "stash", "stash my changes", "pop stash", "undo last commit", "amend",
+    "add all", "commit with message \"", "push", "push new branch",
+    "pull", "pull with rebase", "fetch", "last commit", "remotes", "tags",
+    "remove untracked files", "contributors", "log",
+    "create branch ", "switch to ", "delete branch ",
+]
+_BRANCH_PHRASE = re.compile(r"(switch to|checkout|delete branch|rename to) (\S*)$", re.I)
+
+
+class DirectoryCache:
+    def __init__(self, max_dirs: int = MAX_CACHED_DIRS):
+        """
+        Initialize the listing cache.
+
+        Args:
+            max_dirs: Directories kept; the least recently completed is dropped first
+        """
+        self.max_dirs = max_dirs
+        self.hits = 0
+        self.misses = 0
+        # path -> (mtime_ns, sorted names, names that are directories)
+        self._listings: "OrderedDict[str, Tuple[int, List[str], Set[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def listing(self, path: str) -> Tuple[List[str], Set[str]]:
+        """Sorted entry names of path and the subset that are directories."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], set()
+        key = os.path.abspath(path)
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is not None and cached[0] == mtime:
+                self._listings.move_to_end(key)
+                self.hits += 1
+                return cached[1], cached[2]
+            self.misses += 1
+
+        names, dirs = [], set()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        # Uses the type from the directory entry, so no stat per file on most filesystems
+                        if entry.is_dir():
+                            dirs.add(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            return [], set()
+        names.sort()
+
+        with self._lock:
+            self._listings[key] = (mtime, names, dirs)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+        return names, dirs
+
+    def matches(self, path: str, prefix: str, limit: int = MAX_COMPLETIONS) -> List[Tuple[str, bool]]:
+        """Up to limit (name, is_dir) pairs in path starting with prefix; dotfiles only for a dot prefix."""
+        names, dirs = self.listing(path)
+        results = []
+        hidden = prefix.startswith(".")
+        for i in range(bisect_left(names, prefix), len(names)):
+            name = names[i]
+            if not name.startswith(prefix):
+                break
+            if name.startswith(".") and not hidden:
+                continue
+            results.append((name, name in dirs))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class HybridCompleter(Completer):
+    def __init__(self, commands: List[str], arguments: Optional[Dict[str, Callable[[str], Iterable[str]]]] = None,
+                 directories: Optional[DirectoryCache] = None):
+        """
+        Complete ! commands, their arguments and file paths.
+
+        Args:
+            commands: ! command names, without the !
+            arguments: Per command, a function from the typed argument to full argument candidates;
+                commands without one complete paths
+            directories: Listing cache shared across prompts
+        """
+        self.commands = commands
+        self.arguments = arguments or {}
+        self.directories = directories or DirectoryCache()
+
+    def get_completions(self, document, complete_event):
+        # prompt_toolkit drains this generator right away, so the span covers producing every completion
+        with timed("completer"):
+            yield from self._completions(document.text_before_cursor)
+
+    def _completions(self, text: str):
+        if text.startswith("?"):
+            yield Completion(
+                "ask",
+                start_position=-1,
+                display="?Ask Capybara anything"
+            )
+        elif text.startswith("!"):
+            name, sep, arg = text[1:].partition(" ")
+            if not sep:
+                for cmd in self.commands:
+                    if cmd.startswith(name):
+                        yield Completion(
+                            cmd[len(name):],
+                            start_position=-len(name),
+                            display=f"!{cmd} - AI helper"
+                        )
+            elif name in self.arguments:
+                lowered = arg.lower()
+                for candidate in self.arguments[name](arg):
+                    if candidate.lower().startswith(lowered) and candidate != arg:
+                        yield Completion(candidate, start_position=-len(arg))
+            else:
+                yield from self._paths(arg)
+        else:
+            yield from self._paths(text)
+
+    def _paths(self, text: str):
+        """Complete the last word of text as a path."""
+        word = text.rsplit(" ", 1)[-1]
+        directory, prefix = os.path.split(os.path.expanduser(word))
+        for name, is_dir in self.directories.matches(directory or ".", prefix):
+            yield Completion(name[len(prefix):], start_position=0, display=name + ("/" if is_dir else ""))
+
+
+def soundpack_names(sounds_dir: str) -> Callable[[str], List[str]]:
+    """Argument completer for !select, re-reading soundpacks only when their directories change."""
+    cache = {"stamp": None, "names": []}
+
+    def stamp():
+        stamps = []
+        for path in (sounds_dir, os.path.join(sounds_dir, "Soundpacks")):
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def complete(arg: str) -> List[str]:
+        current = stamp()
+        if cache["stamp"] != current:
+            cache["names"] = sorted(pack.name for pack in discover_soundpacks(sounds_dir))
+            cache["stamp"] = current
+        return cache["names"]
+
+    return complete
+
+
+def _git_dir(start: str) -> Optional[Path]:
+    path = Path(start).resolve()
+    for directory in (path, *path.parents):
+        candidate = directory / ".git"
+        if candidate.is_dir():
+            return candidate
+        if candidate.is_file():
+            # Worktrees and submodules point at their git directory
+            text = candidate.read_text(errors="replace").strip()
+            if text.startswith("gitdir:"):
+                return (directory / text[len("gitdir:"):].strip()).resolve()
+    return None
+
+
+def git_branches(start: str = ".") -> List[str]:
+    """Local branch names, read from the refs without running git."""
+    git_dir = _git_dir(start)
+    if git_dir is None:
+        return []
+    # A linked worktree keeps its refs in the main repository
+    common = git_dir / "commondir"
+    if common.is_file():
+        git_dir = (git_dir / common.read_text().strip()).resolve()
+    branches = set()
+    heads = git_dir / "refs" / "heads"
+    if heads.is_dir():
+        for path in heads.rglob("*"):
+            if path.is_file():
+                branches.add(path.relative_to(heads).as_posix())
+    packed = git_dir / "packed-refs"
+    if packed.is_file():
+        for line in packed.read_text(errors="replace").splitlines():
+            _, _, ref = line.partition(" ")
+            if ref.startswith("refs/heads/"):
+                branches.add(ref[len("refs/heads/"):])
+    return sorted(branches)
+
+
+def git_arguments(arg: str) -> List[str]:
+    """Argument completer for !git: requests the offline grammar knows, and branch names where one is expected."""
+    match = _BRANCH_PHRASE.match(arg)
+    if match:
+        return [f"{match.group(1)} {branch}" for branch in git_branches()]
+    return GIT_PHRASES
@@ -0,0 +1,655 @@
+"""
+Trigram index of a working tree's file contents for !grep and !search
+Every text file's distinct trigrams are kept in SQLite with a posting list of files per trigram, and a
+file is read again only when its size or mtime changed. A regex is reduced to the trigrams any match
+must contain, so a search reads, through mmap, only the files holding all of them.
+"""
+import mmap
+import os
+import re
+import sqlite3
+import stat
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from rich.markup import escape
+from rich.text import Text
+
+from .cancellation import check_cancelled, current_token
+from .file_index import create_watcher
+from .instrumentation import timed
+from .readme_manifest import content_hash
+from .repo_walker import walk_repo
+from .response_cache import DEFAULT_CACHE_DIR
+
+try:
+    from re import _parser as _sre  # Python 3.11+
+except ImportError:
+    import sre_parse as _sre
+
+DEFAULT_WORKERS = 8
+# Larger files are most likely generated, minified or data, and are not indexed or searched
+DEFAULT_MAX_FILE_KB = 1024
+# Matching lines shown at most; the search stops once it has this many
+DEFAULT_MAX_MATCHES = 500
+# A NUL byte this close to the start marks a binary file, as in grep and git
+BINARY_SNIFF = 8192
+# Files read per step of an update; a Ctrl-C keeps what earlier steps indexed
+READ_BATCH = 512
+# Posting entries buffered in memory before they are appended to the database
+FLUSH_POSTINGS = 16_000_000
+# Bump when the trigram extraction changes, so old indexes are rebuilt
+INDEX_VERSION = 1
+# Ids of changed or removed files left in the postings before they are compacted, at least this many
+# and more than this share of the indexed files
+COMPACT_MIN_DEAD = 1000
+COMPACT_DEAD_SHARE = 0.25
+
+# Strings a run of literals and small classes may stand for before the run is cut into requirements
+MAX_ALTERNATIVES = 32
+# Characters a class may have to be expanded, like [-_] or [0-9]
+MAX_CLASS = 10
+MAX_LINE_CHARS = 240
+
+_TRIGRAM = re.compile(rb"(?s)...")
+_CLASS_ITEMS = {_sre.LITERAL, _sre.RANGE}
+_GROUPS = {_sre.SUBPATTERN, getattr(_sre, "ATOMIC_GROUP", _sre.SUBPATTERN)}
+_REPEATS = {_sre.MAX_REPEAT, _sre.MIN_REPEAT, getattr(_sre, "POSSESSIVE_REPEAT", _sre.MAX_REPEAT)}
+
+
+def _trigrams(data: bytes) -> Set[bytes]:
+    """
+    Distinct trigrams of data with ASCII letters lowercased.
+
+    Only trigrams inside whitespace-separated words are kept: a word that repeats is split once,
+    which halves the time spent on source code, and queries break runs at whitespace the same way.
+    """
+    words = b"\n".join(set(data.lower().split()))
+    found = set(_TRIGRAM.findall(words))
+    found.update(_TRIGRAM.findall(words, 1))
+    found.update(_TRIGRAM.findall(words, 2))
+    # Trigrams spanning two words, across the separator
+    return {trigram for trigram in found if b"\n" not in trigram}
+
+
+def _map(path: str, max_size: Optional[int] = None) -> Optional[mmap.mmap]:
+    """The file at path mapped read-only, or None if it is missing, empty, too large or binary."""
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0 or (max_size is not None and size > max_size):
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if mapped.find(b"\0", 0, BINARY_SNIFF) != -1:
+        mapped.close()
+        return None
+    return mapped
+
+
+# ---------------------------------------------------------------------------
+# regex to trigram requirements
+# ---------------------------------------------------------------------------
+# A requirement is None (any file may match), a trigram (bytes), or ("and" | "or", [requirements])
+
+def _all(requirements: list):
+    kept = []
+    for requirement in requirements:
+        if requirement is None:
+            continue
+        if isinstance(requirement, tuple) and requirement[0] == "and":
+            kept += requirement[1]
+        elif requirement not in kept:
+            kept.append(requirement)
+    if not kept:
+        return None
+    return kept[0] if len(kept) == 1 else ("and", kept)
+
+
+def _any(requirements: list):
+    kept = []
+    for requirement in requirements:
+        if requirement is None:
+            # One alternative that needs nothing means the whole choice needs nothing
+            return None
+        alternatives = requirement[1] if isinstance(requirement, tuple) and requirement[0] == "or" else [requirement]
+        for alternative in alternatives:
+            if alternative not in kept:
+                kept.append(alternative)
+    if not kept:
+        return None
+    return kept[0] if len(kept) == 1 else ("or", kept)
+
+
+def _string_trigrams(value: bytes) -> List[bytes]:
+    return [word[i:i + 3] for word in value.lower().split() for i in range(len(word) - 2)]
+
+
+def _strings_requirement(strings: Set[bytes]):
+    """Any of strings occurs: the trigrams of one of them all occur."""
+    return _any([_all(_string_trigrams(value)) for value in strings])
+
+
+def _class_strings(items) -> Optional[Set[bytes]]:
+    """The characters a [...] class matches, lowercased, if it is small and not negated."""
+    chars = set()
+    for op, av in items:
+        if op not in _CLASS_ITEMS:
+            return None
+        low, high = (av, av) if op == _sre.LITERAL else av
+        if high - low >= MAX_CLASS:
+            return None
+        chars.update(bytes([c]).lower() for c in range(low, high + 1))
+    return chars if len(chars) <= MAX_CLASS else None
+
+
+def _item(op, av) -> Tuple[Optional[Set[bytes]], object]:
+    """(the strings it matches exactly if there are few of them, what a match requires) for one regex item."""
+    if op == _sre.LITERAL:
+        return {bytes([av]).lower()}, None
+    if op == _sre.IN:
+        return _class_strings(av), None
+    if op == _sre.AT:
+        # ^, $ and \b take no characters, so the run goes on across them
+        return {b""}, None
+    if op in _GROUPS:
+        return _sequence(av[-1] if op == _sre.SUBPATTERN else av)
+    if op == _sre.BRANCH:
+        alternatives = [_sequence(branch) for branch in av[1]]
+        if all(strings is not None for strings, _ in alternatives):
+            union = set().union(*(strings for strings, _ in alternatives))
+            if len(union) <= MAX_ALTERNATIVES:
+                return union, None
+        return None, _any([_requirement(*alternative) for alternative in alternatives])
+    if op in _REPEATS:
+        low, high, sub = av
+        if low == 0:
+            return None, None
+        strings, requirement = _sequence(sub)
+        if low == high == 1:
+            return strings, requirement
+        return None, _requirement(strings, requirement)
+    # ., \w, negated classes, backreferences and lookarounds require nothing
+    return None, None
+
+
+def _requirement(strings: Optional[Set[bytes]], requirement):
+    return _strings_requirement(strings) if strings is not None else requirement
+
+
+def _sequence(items) -> Tuple[Optional[Set[bytes]], object]:
+    """Like _item for a sequence: runs of exactly known strings are cut into their trigrams."""
+    required = []
+    run = {b""}
+    exact = True
+    for op, av in items:
+        strings, requirement = _item(op, av)
+        if strings is not None and len(run) * len(strings) <= MAX_ALTERNATIVES:
+            run = {left + right for left in run for right in strings}
+            continue
+        exact = False
+        required.append(_strings_requirement(run))
+        if strings is not None:
+            run = strings
+        else:
+            required.append(requirement)
+            run = {b""}
+    if exact:
+        return run, None
+    required.append(_strings_requirement(run))
+    return None, _all(required)
+
+
+def plan_trigrams(pattern: bytes, flags: int = 0):
+    """
+    The trigrams a match of pattern must contain, as nested and/or requirements, or None if any file may match.
+
+    Args:
+        pattern: Regex as bytes
+        flags: re flags it is compiled with; case is ignored either way, as the index lowercases ASCII
+    """
+    return _requirement(*_sequence(_sre.parse(pattern, flags)))
+
+
+def _leaves(requirement) -> Set[bytes]:
+    if requirement is None:
+        return set()
+    if isinstance(requirement, bytes):
+        return {requirement}
+    return set().union(*(_leaves(child) for child in requirement[1]))
+
+
+def _evaluate(requirement, postings: Dict[bytes, Set[int]]) -> Set[int]:
+    if isinstance(requirement, bytes):
+        return postings.get(requirement, set())
+    op, children = requirement
+    if op == "or":
+        return set().union(*(_evaluate(child, postings) for child in children))
+    # Smallest first, so the intersection shrinks fast and stops once empty
+    evaluated = sorted((_evaluate(child, postings) for child in children), key=len)
+    found = set(evaluated[0])
+    for files in evaluated[1:]:
+        if not found:
+            break
+        found &= files
+    return found
+
+
+# ---------------------------------------------------------------------------
+# index
+# ---------------------------------------------------------------------------
+
+def _stat_files(root: str, paths: List[str]) -> List[Optional[Tuple[int, int]]]:
+    sizes = []
+    for path in paths:
+        try:
+            st = os.stat(os.path.join(root, path))
+        except OSError:
+            sizes.append(None)
+            continue
+        sizes.append((st.st_size, st.st_mtime_ns) if stat.S_ISREG(st.st_mode) else None)
+    return sizes
+
+
+def _grep(path: str, regex, limit: int, max_size: Optional[int]) -> List[Tuple[int, str, Tuple[int, int]]]:
+    """(line number, line, span of the match in the line) of the first limit lines of path that match."""
+    mapped = _map(path, max_size)
+    if mapped is None:
+        return []
+    with mapped:
+        match = regex.search(mapped)
+        if match is None:
+            return []
+        # Most files read do not match; one that does is copied once, so lines are counted without copies
+        data = mapped[:]
+    hits = []
+    line = 1
+    counted = 0
+    while match is not None and len(hits) < limit:
+        start, end = match.span()
+        line += data.count(b"\n", counted, start)
+        counted = start
+        line_start = data.rfind(b"\n", 0, start) + 1
+        line_end = data.find(b"\n", start)
+        if line_end == -1:
+            line_end = len(data)
+        raw = data[line_start:line_end]
+        text = raw.decode("utf-8", errors="replace")
+        if len(text) == len(raw):
+            span = (start - line_start, min(end, line_end) - line_start)
+        else:
+            before = len(data[line_start:start].decode("utf-8", errors="replace"))
+            span = (before, before + len(data[start:min(end, line_end)].decode("utf-8", errors="replace")))
+        hits.append((line, text.rstrip("\r"), span))
+        # One hit per line, like grep: the next search starts on the next line
+        match = regex.search(data, line_end + 1)
+    return hits
+
+
+class SearchResult:
+    def __init__(self, pattern: str):
+        """Matches of one search, streamed by iterating; the counts are final once iteration ends."""
+        self.pattern = pattern
+        self.candidates: List[str] = []
+        # False when the pattern had no trigrams to narrow by, so every indexed file is read
+        self.narrowed = False
+        self.indexed = 0
+        self.files_read = 0
+        self.files_matched = 0
+        self.matches = 0
+        self.truncated = False
+        self.elapsed = 0.0
+        self.update_elapsed = 0.0
+        self.files_reindexed = 0
+        self._stream: Iterator[Tuple[str, int, str, Tuple[int, int]]] = iter(())
+
+    def __iter__(self) -> Iterator[Tuple[str, int, str, Tuple[int, int]]]:
+        """(path, line number, line, span of the match in the line) as they are found, in path order."""
+        return self._stream
+
+
+class ContentIndex:
+    def __init__(self, root: str, path: Optional[str] = None, workers: int = DEFAULT_WORKERS,
+                 max_file_kb: int = DEFAULT_MAX_FILE_KB, max_matches: int = DEFAULT_MAX_MATCHES, watch: bool = True):
+        """
+        Initialize the index. The database is opened and built on first use.
+
+        Args:
+            root: Directory indexed; what its .gitignore files exclude is left out
+            path: SQLite database file (defaults to ~/.capybara/search/<hash of root>.db)
+            workers: Threads stat'ing, reading and matching files
+            max_file_kb: Files larger than this are neither indexed nor searched
+            max_matches: Matching lines a search returns at most
+            watch: Watch the walked directories with inotify where available, so an update with no
+                event since the last one neither walks the tree nor stats its files
+        """
+        self.root = os.path.abspath(root)
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "search" / f"{content_hash(self.root)[:16]}.db"
+        self.workers = max(1, workers)
+        self.max_size = max_file_kb * 1024
+        self.max_matches = max_matches
+        self._db = None
+        # path -> (id, size, mtime_ns, indexed as text), mirroring the files table
+        self._files: Optional[Dict[str, Tuple[int, int, int, bool]]] = None
+        # Ids in the postings whose files have since changed or gone
+        self._dead = 0
+        self._lock = threading.Lock()
+        self._watcher = create_watcher() if watch else None
+        # Set until every directory of the last walk was already watched before it was listed
+        self._rewalk = True
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            # Building the index fills the WAL; without a limit it keeps that size on disk
+            db.execute(f"PRAGMA journal_size_limit={8 * 1024 * 1024}")
+        except (OSError, sqlite3.Error):
+            # Rebuilt every session, but repeated searches still read only the files that can match
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.executescript(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            # text is 0 for a binary, oversized or unreadable file, which is not searched. Ids are never
+            # reused, as postings may still hold the ids of files since changed or removed
+            "CREATE TABLE IF NOT EXISTS files ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, text INTEGER NOT NULL);"
+            # The ids of the files holding each trigram, as native unsigned ints in no particular order
+            "CREATE TABLE IF NOT EXISTS postings (trigram BLOB PRIMARY KEY, files BLOB NOT NULL) WITHOUT ROWID;"
+        )
+        settings = f"{INDEX_VERSION}:{self.max_size}"
+        row = db.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+        if row is None or row[0] != settings:
+            db.execute("DELETE FROM files")
+            db.execute("DELETE FROM postings")
+            db.execute("DELETE FROM meta")
+            db.execute("INSERT INTO meta VALUES ('settings', ?)", (settings,))
+            db.commit()
+        self._db = db
+        return db
+
+    def _load(self, db) -> Dict[str, Tuple[int, int, int, bool]]:
+        if self._files is None:
+            self._files = {path: (id_, size, mtime_ns, bool(text)) for id_, path, size, mtime_ns, text in
+                           db.execute("SELECT id, path, size, mtime_ns, text FROM files")}
+            row = db.execute("SELECT value FROM meta WHERE key = 'dead'").fetchone()
+            self._dead = int(row[0]) if row else 0
+        return self._files
+
+    def update(self, token=None) -> int:
+        """
+        Bring the index up to date, returning how many files were read.
+
+        The tree is walked and every file stat'ed; only new files and files whose size or mtime
+        changed are read again. With inotify, nothing is done while no watched directory had an event.
+        """
+        token = token if token is not None else current_token()
+        with self._lock:
+            db = self._connect()
+            try:
+                files = self._load(db)
+                watcher = self._watcher
+                if watcher is not None:
+                    events = watcher.changed()
+                    if watcher.complete and not self._rewalk and not events:
+                        return 0
+                    # Events from here on are seen by the next update
+                    watcher.complete = True
+                with timed("content index update"), ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    scan = walk_repo(self.root, self.workers)
+                    if watcher is not None:
+                        added = [path for path in scan.listings if path not in watcher.watched]
+                        for path in added:
+                            watcher.watch(self.root, path)
+                        # A directory watched only after it was listed may have changed in between
+                        self._rewalk = bool(added)
+                    paths = scan.files()
+                    # In a few large batches; a task per file costs more than the stat itself
+                    size = max(256, len(paths) // self.workers + 1)
+                    batches = pool.map(lambda batch: _stat_files(self.root, batch),
+                                       [paths[i:i + size] for i in range(0, len(paths), size)])
+                    current = {}
+                    changed = []
+                    for path, st in zip(paths, (st for batch in batches for st in batch)):
+                        if st is None:
+                            continue
+                        current[path] = st
+                        known = files.get(path)
+                        if known is None or known[1:3] != st:
+                            changed.append(path)
+                    self._remove(db, [path for path in files if path not in current] +
+                                 [path for path in changed if path in files])
+                    adds: Dict[bytes, array] = {}
+                    buffered = 0
+                    for i in range(0, len(changed), READ_BATCH):
+                        check_cancelled(token)
+                        batch = changed[i:i + READ_BATCH]
+                        for path, trigrams in zip(batch, pool.map(self._read, batch)):
+                            id_ = db.execute("INSERT INTO files (path, size, mtime_ns, text) VALUES (?, ?, ?, ?)",
+                                             (path, *current[path], trigrams is not None)).lastrowid
+                            files[path] = (id_, *current[path], trigrams is not None)
+                            for trigram in trigrams or ():
+                                ids = adds.get(trigram)
+                                if ids is None:
+                                    adds[trigram] = ids = array("I")
+                                ids.append(id_)
+                            buffered += len(trigrams or ())
+                        if buffered >= FLUSH_POSTINGS or i + READ_BATCH >= len(changed):
+                            self._append(db, adds)
+                            db.commit()
+                            adds = {}
+                            buffered = 0
+                    indexed = sum(1 for entry in files.values() if entry[3])
+                    if self._dead > max(COMPACT_MIN_DEAD, indexed * COMPACT_DEAD_SHARE):
+                        self._compact(db, token)
+                db.commit()
+                return len(changed)
+            except BaseException:
+                # Files read since the last commit are read again next time
+                db.rollback()
+                self._files = None
+                self._rewalk = True
+                raise
+
+    def _read(self, path: str) -> Optional[Set[bytes]]:
+        mapped = _map(os.path.join(self.root, path), self.max_size)
+        if mapped is None:
+            return None
+        with mapped:
+            return _trigrams(mapped[:])
+
+    def _remove(self, db, paths: List[str]):
+        """
+        Drop paths from the index.
+
+        Their ids stay in the postings, where lookups skip them, until the next compaction:
+        editing every posting list a changed file was in costs more than reading the file.
+        """
+        removed = [self._files.pop(path) for path in paths]
+        db.executemany("DELETE FROM files WHERE id = ?", [(entry[0],) for entry in removed])
+        self._dead += sum(1 for entry in removed if entry[3])
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('dead', ?)", (str(self._dead),))
+
+    @staticmethod
+    def _append(db, adds: Dict[bytes, array]):
+        db.executemany(
+            # || makes text of two blobs; the cast takes the bytes back unchanged
+            "INSERT INTO postings VALUES (?, ?) "
+            "ON CONFLICT (trigram) DO UPDATE SET files = CAST(files || excluded.files AS BLOB)",
+            ((trigram, ids.tobytes()) for trigram, ids in adds.items())
+        )
+
+    def _compact(self, db, token=None):
+        """Rewrite the posting lists without the ids of files since changed or removed."""
+        live = {id_ for id_, _, _, text in self._files.values() if text}
+        last = b""
+        with timed("content index compact"):
+            while True:
+                check_cancelled(token)
+                rows = db.execute("SELECT trigram, files FROM postings WHERE trigram > ? ORDER BY trigram LIMIT 10000",
+                                  (last,)).fetchall()
+                if not rows:
+                    break
+                last = rows[-1][0]
+                rewritten, emptied = [], []
+                for trigram, blob in rows:
+                    ids = array("I")
+                    ids.frombytes(blob)
+                    kept = live.intersection(ids)
+                    if len(kept) == len(ids):
+                        continue
+                    if kept:
+                        rewritten.append((array("I", kept).tobytes(), trigram))
+                    else:
+                        emptied.append((trigram,))
+                db.executemany("UPDATE postings SET files = ? WHERE trigram = ?", rewritten)
+                db.executemany("DELETE FROM postings WHERE trigram = ?", emptied)
+        self._dead = 0
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('dead', '0')")
+
+    def _candidates(self, requirement) -> Tuple[List[str], int]:
+        """Paths of the indexed text files that can satisfy requirement, sorted, and how many are indexed."""
+        with self._lock, timed("content index lookup"):
+            db = self._connect()
+            files = self._load(db)
+            text = {id_: path for path, (id_, _, _, is_text) in files.items() if is_text}
+            if requirement is None:
+                return sorted(text.values()), len(text)
+            postings: Dict[bytes, Set[int]] = {}
+            trigrams = sorted(_leaves(requirement))
+            for i in range(0, len(trigrams), 500):
+                chunk = trigrams[i:i + 500]
+                rows = db.execute(f"SELECT trigram, files FROM postings WHERE trigram IN ({','.join('?' * len(chunk))})",
+                                  chunk)
+                for trigram, blob in rows:
+                    ids = array("I")
+                    ids.frombytes(blob)
+                    postings[trigram] = set(ids)
+            return sorted(text[id_] for id_ in _evaluate(requirement, postings) if id_ in text), len(text)
+
+    def search(self, pattern: str, ignore_case: bool = False, max_matches: Optional[int] = None,
+               token=None) -> SearchResult:
+        """
+        Update the index and find the files that can match pattern; iterating the result reads them.
+
+        Patterns are Python regexes matched against bytes, line by line as with re.MULTILINE;
+        non-ASCII characters match their UTF-8 encoding and only ASCII letters ignore case.
+
+        Args:
+            pattern: Regular expression
+            ignore_case: Match ASCII letters regardless of case
+            max_matches: Matching lines returned at most (defaults to the index's max_matches)
+            token: Cancellation token checked between files (defaults to the current command's)
+        """
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        try:
+            regex = re.compile(pattern.encode("utf-8"), flags)
+            requirement = plan_trigrams(pattern.encode("utf-8"), flags)
+        except (re.error, RecursionError) as e:
+            raise ValueError(f"Invalid regular expression: {e}")
+        token = token if token is not None else current_token()
+        result = SearchResult(pattern)
+        started = time.perf_counter()
+        result.files_reindexed = self.update(token)
+        result.update_elapsed = time.perf_counter() - started
+        result.candidates, result.indexed = self._candidates(requirement)
+        result.narrowed = requirement is not None
+        result._stream = self._stream(result, regex, max_matches or self.max_matches, started, token)
+        return result
+
+    def _stream(self, result: SearchResult, regex, limit: int, started: float, token):
+        candidates = result.candidates
+        try:
+            with timed("content search"), ThreadPoolExecutor(max_workers=self.workers) as pool:
+                i = 0
+                # Small first steps, so the first matches show up at once; larger ones after that
+                step = self.workers
+                while i < len(candidates):
+                    check_cancelled(token)
+                    batch = candidates[i:i + step]
+                    i += step
+                    step = min(step * 2, 256)
+                    found = pool.map(lambda path: _grep(os.path.join(self.root, path), regex, limit, self.max_size),
+                                     batch)
+                    for path, hits in zip(batch, found):
+                        result.files_read += 1
+                        result.files_matched += bool(hits)
+                        for line, text, span in hits:
+                            result.matches += 1
+                            yield path, line, text, span
+                            if result.matches >= limit:
+                                result.truncated = True
+                                return
+        finally:
+            result.elapsed = time.perf_counter() - started
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            return {"files": db.execute("SELECT COUNT(*) FROM files").fetchone()[0],
+                    "text_files": db.execute("SELECT COUNT(*) FROM files WHERE text").fetchone()[0],
+                    "trigrams": db.execute("SELECT COUNT(*) FROM postings").fetchone()[0],
+                    "path": str(self.path)}
+
+
+def format_match(path: str, line: int, text: str, span: Tuple[int, int]) -> Text:
+    """One grep-style result line, path:line: text, with the match highlighted and long lines cut around it."""
+    start, end = span
+    if len(text) > MAX_LINE_CHARS:
+        cut = max(0, min(start - MAX_LINE_CHARS // 4, len(text) - MAX_LINE_CHARS))
+        prefix = "…" if cut else ""
+        suffix = "…" if cut + MAX_LINE_CHARS < len(text) else ""
+        text = prefix + text[cut:cut + MAX_LINE_CHARS] + suffix
+        start, end = start - cut + len(prefix), end - cut + len(prefix)
+    result = Text.assemble((path, "magenta"), ":", (str(line), "green"), ": ", text)
+    offset = len(result) - len(text)
+    result.stylize("bold red", offset + start, offset + min(end, len(text)))
+    return result
+
+
+def format_search_summary(result: SearchResult) -> str:
+    """Rich markup summing up a finished search: what matched and how much the index saved."""
+    if result.narrowed:
+        read = f"read {result.files_read} of {result.indexed} indexed files"
+    else:
+        read = f"no trigrams to narrow by, read {result.files_read} of {result.indexed} indexed files"
+    timing = (f"[dim]{result.elapsed * 1000:.0f} ms, {read} "
+              f"({result.files_reindexed} re-indexed in {result.update_elapsed * 1000:.0f} ms)[/dim]")
+    if not result.matches:
+        return f"No matches for [bold]{escape(result.pattern)}[/bold]\n{timing}"
+    stopped = f", stopped at the first {result.matches}" if result.truncated else ""
+    return (f"{result.matches} matching line{'s' if result.matches != 1 else ''} in {result.files_matched} "
+            f"file{'s' if result.files_matched != 1 else ''}{stopped}\n{timing}")
+
+
+# One index per directory !grep or !search was run in
+_indexes: Dict[str, ContentIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_content_index(root: str = ".") -> ContentIndex:
+    """
+    Return the content index of root.
+
+    CAPYBARA_CACHE_DIR overrides where indexes are kept, CAPYBARA_SEARCH_MAX_FILE_KB the largest
+    file indexed and CAPYBARA_SEARCH_MAX_MATCHES the matching lines shown per search.
+    """
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        if root not in _indexes:
+            cache_dir = os.getenv("CAPYBARA_CACHE_DIR")
+            path = os.path.join(cache_dir, "search", f"{content_hash(root)[:16]}.db") if cache_dir else None
+            _indexes[root] = ContentIndex(
+                root, path,
+                max_file_kb=int(os.getenv("CAPYBARA_SEARCH_MAX_FILE_KB", DEFAULT_MAX_FILE_KB)),
+                max_matches=int(os.getenv("CAPYBARA_SEARCH_MAX_MATCHES", DEFAULT_MAX_MATCHES)),
+            )
+        return _indexes[root]
@@ -0,0 +1,160 @@
+"""
+Token-budgeted prompt context packing
+Fills prompt sections by priority until a token budget is used up
+"""
+import re
+from typing import List, Optional
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in text.
+
+    Uses tiktoken when installed, otherwise a BPE-like estimate: one token per
+    punctuation mark and one per 4 characters of each word.
+    """
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_RE.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep as many whole leading lines of text as fit in max_tokens."""
+    lines = text.splitlines()
+    low, high = 0, len(lines)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens("\n".join(lines[:mid])) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return "\n".join(lines[:low])
+
+
+class Section:
+    def __init__(self, name: str, variants: List[str], priority: int, truncatable: bool = True):
+        """
+        A named block of prompt context.
+
+        Args:
+            name: Label used in the prompt header and the report
+            variants: Alternative renderings, most detailed first
+            priority: Lower numbers are packed first
+            truncatable: Whether the last variant may be cut to fit
+        """
+        self.name = name
+        self.variants = [v for v in variants if v and v.strip()]
+        self.priority = priority
+        self.truncatable = truncatable
+        self.text = ""
+        self.tokens = 0
+        self.status = "dropped"
+
+
+class ContextPacker:
+    def __init__(self, budget: int, min_section_tokens: int = 32):
+        """
+        Initialize the packer.
+
+        Args:
+            budget: Total tokens available for all sections
+            min_section_tokens: A truncated section smaller than this is dropped instead
+        """
+        self.budget = budget
+        self.min_section_tokens = min_section_tokens
+        self.sections: List[Section] = []
+
+    def add(self, name: str, content: str, priority: int, truncatable: bool = True):
+        """Add a section with a single rendering."""
+        self.add_variants(name, [content], priority, truncatable)
+
+    def add_variants(self, name: str, variants: List[str], priority: int, truncatable: bool = True):
+        """Add a section with renderings ordered from most to least detailed."""
+        self.sections.append(Section(name, variants, priority, truncatable))
+
+    def _fit(self, section: Section, available: int, variants: List[str]) -> bool:
+        """Give section the most detailed of variants that fits in available tokens."""
+        for variant in variants:
+            tokens = count_tokens(variant)
+            if tokens <= available:
+                section.text = variant
+                section.tokens = tokens
+                section.status = "full" if variant is section.variants[0] else "reduced"
+                return True
+        return False
+
+    def _place(self, section: Section, available: int, variants: List[str]) -> bool:
+        """Fit the most detailed of variants possible, truncating the smallest one as a fallback."""
+        if self._fit(section, available, variants):
+            return True
+        if section.truncatable and available >= self.min_section_tokens:
+            section.text = truncate_to_tokens(section.variants[-1], available)
+            section.tokens = count_tokens(section.text)
+            section.status = "truncated"
+            return bool(section.text)
+        return False
+
+    def pack(self) -> List[Section]:
+        """
+        Choose a rendering for each section within the budget.
+
+        Sections with several renderings first reserve their smallest one, from
+        at most half the budget, so the tree or file list is never squeezed out
+        entirely. Then every section, in priority order, takes the most
+        detailed rendering that still fits.
+        """
+        # sorted() is stable, so sections with equal priority keep insertion order
+        ordered = [s for s in sorted(self.sections, key=lambda s: s.priority) if s.variants]
+        overheads = {id(s): count_tokens(f"--- {s.name} ---\n") for s in ordered}
+        remaining = self.budget
+        reserve = self.budget // 2
+
+        for section in ordered:
+            section.text, section.tokens, section.status = "", 0, "dropped"
+            if len(section.variants) > 1 and self._place(section, reserve - overheads[id(section)], section.variants[-1:]):
+                reserve -= section.tokens + overheads[id(section)]
+                remaining -= section.tokens + overheads[id(section)]
+
+        for section in ordered:
+            if section.text:
+                # Give back the reservation, then take the best rendering that fits
+                reserved = section.tokens
+                self._fit(section, remaining + reserved, section.variants)
+                remaining -= section.tokens - reserved
+            elif self._place(section, remaining - overheads[id(section)], section.variants):
+                remaining -= section.tokens + overheads[id(section)]
+            else:
+                section.text, section.tokens, section.status = "", 0, "dropped"
+
+        return [s for s in ordered if s.text]
+
+    def render(self) -> str:
+        """Pack and return the sections as prompt text, in priority order."""
+        packed = sorted(self.pack(), key=lambda s: s.priority)
+        return "\n".join(f"--- {s.name} ---\n{s.text}\n" for s in packed)
+
+    def report(self) -> List[dict]:
+        """Return tokens used and packing outcome per section."""
+        return [
+            {"name": s.name, "tokens": s.tokens, "status": s.status, "priority": s.priority}
+            for s in sorted(self.sections, key=lambda s: s.priority)
+        ]
+
+
+def format_pack_report(report: List[dict], budget: Optional[int] = None) -> str:
+    """Format a packing report for display."""
+    used = sum(entry["tokens"] for entry in report)
+    lines = [f"Context: {used} tokens" + (f" of {budget}" if budget else "")]
+    for entry in report:
+        lines.append(f"  {entry['name']}: {entry['tokens']} ({entry['status']})")
+    return "\n".join(lines)
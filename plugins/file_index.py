@@ -0,0 +1,636 @@
+"""
+Persistent locate-style index of a working tree for !find
+Every entry's type, size, mtime and extension is kept in SQLite. Before a query, the indexed
+directories are stat'ed and only those whose mtime changed are listed again; queries on size or
+time stat the indexed files too. find expressions are compiled to SQL, so a query reads the index
+instead of walking the tree.
+"""
+import ctypes
+import os
+import shlex
+import sqlite3
+import stat
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from rich.markup import escape
+
+from .cancellation import check_cancelled
+from .instrumentation import timed
+from .readme_manifest import content_hash
+from .response_cache import DEFAULT_CACHE_DIR
+
+DEFAULT_WORKERS = 8
+# Results returned at most; the count still covers every match
+DEFAULT_LIMIT = 1000
+# Never indexed, as find would list thousands of object files nobody searches for
+PRUNED = {".git"}
+
+_TYPES = [(stat.S_ISDIR, "d"), (stat.S_ISREG, "f"), (stat.S_ISLNK, "l"), (stat.S_ISFIFO, "p"),
+          (stat.S_ISSOCK, "s"), (stat.S_ISBLK, "b"), (stat.S_ISCHR, "c")]
+_SIZE_UNITS = {"c": 1, "w": 2, "b": 512, "k": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+# Path relative to the root; the root's own entry sits in directory -1, one level above it
+_REL_SQL = "(CASE WHEN e.dir = -1 THEN '' WHEN d.path = '' THEN e.name ELSE d.path || '/' || e.name END)"
+# Paths as find prints them: the start point, or the start point and the path below it
+_PATH_SQL = f"(CASE WHEN {_REL_SQL} = :start THEN :display ELSE :display || '/' || substr({_REL_SQL}, :cut) END)"
+
+
+def _file_type(mode: int) -> str:
+    for test, letter in _TYPES:
+        if test(mode):
+            return letter
+    return "f"
+
+
+def _extension(name: str) -> str:
+    stem, dot, ext = name.rpartition(".")
+    return ext.lower() if dot and stem else ""
+
+
+def _glob(pattern: str) -> str:
+    """A find/fnmatch pattern as an SQLite GLOB: [!...] negates and backslash escapes one character."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(f"[{pattern[i]}]" if pattern[i] in "*?[" else pattern[i])
+        elif c == "[" and pattern[i + 1:i + 2] == "!":
+            out.append("[^")
+            i += 1
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+class DirectoryWatcher:
+    """inotify watches on the indexed directories (Linux), so an update re-lists only what changed."""
+
+    # Entries created, deleted, moved, written or re-attributed; the directory itself deleted or moved
+    MASK = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+    SELF_GONE = 0x400 | 0x800
+    OVERFLOW = 0x4000
+    IGNORED = 0x8000
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        # IN_NONBLOCK | IN_CLOEXEC
+        self.fd = self._libc.inotify_init1(0o4000 | 0o2000000)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: Dict[int, str] = {}
+        self.watched: Set[str] = set()
+        # False after a failed watch or a queue overflow, until every directory is stat'ed again
+        self.complete = True
+
+    def watch(self, root: str, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(root, path)), self.MASK)
+        if wd < 0:
+            # Usually fs.inotify.max_user_watches; directories past it are checked by mtime
+            self.complete = False
+            return
+        self.paths[wd] = path
+        self.watched.add(path)
+
+    def changed(self) -> Set[str]:
+        """Directories with events since the last call."""
+        dirty = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return dirty
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                offset += 16 + length
+                if mask & self.OVERFLOW:
+                    self.complete = False
+                    continue
+                path = self.paths.get(wd)
+                if path is None:
+                    continue
+                if mask & self.IGNORED:
+                    del self.paths[wd]
+                    self.watched.discard(path)
+                elif mask & self.SELF_GONE:
+                    dirty.add(path.rpartition("/")[0])
+                else:
+                    dirty.add(path)
+
+
+def create_watcher() -> Optional[DirectoryWatcher]:
+    """An inotify watcher, or None where inotify is not available."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return DirectoryWatcher()
+    except (OSError, AttributeError):
+        return None
+
+
+def too_broad(root: str) -> Optional[str]:
+    """Why indexing root would walk far more than a project (the filesystem root or a home directory), or None."""
+    root = os.path.abspath(root)
+    home = os.path.abspath(os.path.expanduser("~"))
+    if root == os.path.dirname(root):
+        return f"{root} is the filesystem root; cd into a project first"
+    if root == home:
+        return f"{root} is the home directory; cd into a project first"
+    if home.startswith(root.rstrip(os.sep) + os.sep):
+        return f"{root} contains the home directory; cd into a project first"
+    return None
+
+
+def _list(path: str) -> Optional[Tuple[os.stat_result, List[Tuple[str, str, int, float]]]]:
+    """The stat of directory path and (name, type, size, mtime) of each entry, or None if it cannot be listed."""
+    entries = []
+    try:
+        # Stat'ed first, so a change made while listing shows up as a newer mtime next time
+        own = os.stat(path)
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((entry.name, _file_type(st.st_mode), st.st_size, st.st_mtime))
+    except OSError:
+        return None
+    return own, entries
+
+
+class FindQuery:
+    def __init__(self, command: str, now: Optional[float] = None):
+        """
+        Parse a find command into an SQL condition over the index.
+
+        Args:
+            command: "find [start] [expression]", optionally piped to "wc -l"
+            now: Reference time for -mtime and -mmin (defaults to the current time)
+
+        Raises:
+            ValueError: For anything the index cannot answer, e.g. -exec or a start point outside the tree
+        """
+        self.now = time.time() if now is None else now
+        self.params: Dict[str, object] = {}
+        self.max_depth: Optional[int] = None
+        self.min_depth = 0
+        # Set when the expression looks at sizes or mtimes, which a file edited in place changes
+        self.stats = False
+        command, pipe, rest = command.partition("|")
+        self.count = bool(pipe)
+        if pipe and rest.split() != ["wc", "-l"]:
+            raise ValueError(f"| {rest.strip()} is not supported")
+        try:
+            tokens = shlex.split(command)
+        except ValueError as e:
+            raise ValueError(f"cannot parse the command: {e}")
+        if not tokens or tokens[0] != "find":
+            raise ValueError("not a find command")
+        tokens = tokens[1:]
+        start = "."
+        if tokens and not tokens[0].startswith("-") and tokens[0] not in ("(", "!"):
+            start = tokens.pop(0)
+        if tokens and not tokens[0].startswith("-") and tokens[0] not in ("(", "!", ")"):
+            raise ValueError("only one start point is supported")
+        self.display = start.rstrip("/") or "/"
+        start = os.path.normpath(start).replace(os.sep, "/")
+        if os.path.isabs(start) or start == ".." or start.startswith("../"):
+            raise ValueError("the start point must be inside the current directory")
+        self.start = "" if start == "." else start
+        self.tokens = tokens
+        self.pos = 0
+        self.where = self._or() if tokens else "1"
+        if self.pos < len(tokens):
+            raise ValueError(f"unexpected {tokens[self.pos]}")
+
+    def _param(self, value) -> str:
+        name = f"p{len(self.params)}"
+        self.params[name] = value
+        return f":{name}"
+
+    def _peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self, what: str) -> str:
+        if self.pos >= len(self.tokens):
+            raise ValueError(f"{what} needs an argument")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def _or(self) -> str:
+        parts = [self._and()]
+        while self._peek() in ("-o", "-or"):
+            self.pos += 1
+            parts.append(self._and())
+        return parts[0] if len(parts) == 1 else "(" + " OR ".join(parts) + ")"
+
+    def _and(self) -> str:
+        parts = [self._not()]
+        while self._peek() is not None and self._peek() not in ("-o", "-or", ")"):
+            if self._peek() in ("-a", "-and"):
+                self.pos += 1
+            parts.append(self._not())
+        return parts[0] if len(parts) == 1 else "(" + " AND ".join(parts) + ")"
+
+    def _not(self) -> str:
+        if self._peek() in ("!", "-not"):
+            self.pos += 1
+            return f"(NOT {self._not()})"
+        return self._primary()
+
+    def _primary(self) -> str:
+        token = self._next("expression")
+        if token == "(":
+            inner = self._or()
+            if self._next("(") != ")":
+                raise ValueError("missing )")
+            return inner
+        if token in ("-name", "-iname"):
+            pattern = self._next(token)
+            ext = pattern[2:]
+            sql = f"name GLOB {self._param(_glob(pattern))}" if token == "-name" else \
+                f"lower(name) GLOB {self._param(_glob(pattern).lower())}"
+            if pattern.startswith("*.") and ext and not any(c in ext for c in "*?[\\."):
+                # Lets SQLite use the extension index instead of matching every name
+                sql = f"(ext = {self._param(ext.lower())} AND {sql})"
+            return sql
+        if token in ("-path", "-wholename", "-ipath", "-iwholename"):
+            pattern = _glob(self._next(token))
+            if token.startswith("-i"):
+                return f"lower({_PATH_SQL}) GLOB {self._param(pattern.lower())}"
+            return f"{_PATH_SQL} GLOB {self._param(pattern)}"
+        if token == "-type":
+            letters = self._next(token).split(",")
+            if not all(letter in "fdlpsbc" and len(letter) == 1 for letter in letters):
+                raise ValueError(f"unknown -type {','.join(letters)}")
+            return "type IN (" + ", ".join(self._param(letter) for letter in letters) + ")"
+        if token == "-size":
+            self.stats = True
+            value = self._next(token)
+            sign, number, unit = value[:1] if value[:1] in "+-" else "", value.lstrip("+-"), "b"
+            if number[-1:] in _SIZE_UNITS:
+                number, unit = number[:-1], number[-1]
+            if not number.isdigit():
+                raise ValueError(f"bad -size {value}")
+            # Sizes round up to whole units, as in find: -size -1M only matches empty files
+            blocks = f"((size + {_SIZE_UNITS[unit] - 1}) / {_SIZE_UNITS[unit]})"
+            return f"{blocks} {'>' if sign == '+' else '<' if sign == '-' else '='} {self._param(int(number))}"
+        if token in ("-mtime", "-mmin"):
+            self.stats = True
+            value = self._next(token)
+            sign, number = value[:1] if value[:1] in "+-" else "", value.lstrip("+-")
+            if not number.isdigit():
+                raise ValueError(f"bad {token} {value}")
+            unit = 86400 if token == "-mtime" else 60
+            age = f"CAST(({self._param(self.now)} - mtime) / {unit} AS INTEGER)"
+            return f"{age} {'>' if sign == '+' else '<' if sign == '-' else '='} {self._param(int(number))}"
+        if token == "-newer":
+            self.stats = True
+            reference = self._next(token)
+            try:
+                return f"mtime > {self._param(os.stat(reference).st_mtime)}"
+            except OSError:
+                raise ValueError(f"-newer {reference}: no such file")
+        if token == "-empty":
+            self.stats = True
+            return "((type = 'f' AND size = 0) OR (type = 'd' AND children = 0))"
+        if token in ("-maxdepth", "-mindepth"):
+            value = self._next(token)
+            if not value.isdigit():
+                raise ValueError(f"bad {token} {value}")
+            if token == "-maxdepth":
+                self.max_depth = int(value)
+            else:
+                self.min_depth = int(value)
+            return "1"
+        if token in ("-print", "-true"):
+            return "1"
+        if token == "-false":
+            return "0"
+        raise ValueError(f"{token} is not supported")
+
+
+class FindResult:
+    def __init__(self, command: str):
+        self.command = command
+        self.paths: List[str] = []
+        self.count = 0
+        self.counting = False
+        self.elapsed = 0.0
+        self.update_elapsed = 0.0
+        self.dirs_relisted = 0
+        self.files_restated = 0
+
+
+class FileIndex:
+    def __init__(self, root: str, path: Optional[str] = None, workers: int = DEFAULT_WORKERS, watch: bool = True):
+        """
+        Initialize the index. The database is opened and built on first use.
+
+        Args:
+            root: Directory indexed
+            path: SQLite database file (defaults to ~/.capybara/index/<hash of root>.db)
+            workers: Threads listing and stat'ing directories
+            watch: Watch the indexed directories with inotify where available, instead of
+                stat'ing every one of them on each update
+        """
+        self.root = os.path.abspath(root)
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "index" / f"{content_hash(self.root)[:16]}.db"
+        self.workers = max(1, workers)
+        self._db = None
+        self._lock = threading.Lock()
+        self._watcher = create_watcher() if watch else None
+        # Set once every indexed file was stat'ed while its directory was already watched
+        self._restated = False
+        self.files_restated = 0
+        self._build: Optional[threading.Thread] = None
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+        except (OSError, sqlite3.Error):
+            # Rebuilt every session, but queries still avoid walking the tree each time
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.executescript(
+            # path is relative to the root ("" for the root itself); mtime_ns tells when to list it again
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            "id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, depth INTEGER NOT NULL, mtime_ns INTEGER NOT NULL);"
+            # One row per entry, in the directory that holds it; children is the entry count of directories
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "dir INTEGER NOT NULL, name TEXT NOT NULL, type TEXT NOT NULL, size INTEGER NOT NULL, "
+            "mtime REAL NOT NULL, ext TEXT NOT NULL, children INTEGER, PRIMARY KEY (dir, name)) WITHOUT ROWID;"
+            # Extension and name lookups, e.g. -name "*.py" and -name "package.json" or "test_*", use
+            # these instead of matching every name; type and size make the common -type f -size +1M covered
+            "CREATE INDEX IF NOT EXISTS entries_ext ON entries(ext, type, size);"
+            "CREATE INDEX IF NOT EXISTS entries_name ON entries(name);"
+        )
+        self._db = db
+        return db
+
+    def ready(self) -> bool:
+        """
+        Whether a complete index exists, so a query returns without a long first walk.
+
+        If not, the index is built on a background thread, and later calls return True once it is done.
+        """
+        if self._build is not None and self._build.is_alive():
+            return False
+        with self._lock:
+            db = self._connect()
+            # Directories found but not listed yet keep mtime 0, e.g. after an interrupted build
+            built = db.execute("SELECT 1 FROM dirs").fetchone() and \
+                not db.execute("SELECT 1 FROM dirs WHERE mtime_ns = 0 LIMIT 1").fetchone()
+        if not built:
+            self._build = threading.Thread(target=self.update, name="file-index-build", daemon=True)
+            self._build.start()
+        return bool(built)
+
+    def update(self, token=None, restat: bool = False) -> int:
+        """
+        Bring the index up to date, returning how many directories were listed.
+
+        With inotify, only directories with events are listed again. Otherwise directories whose
+        mtime is unchanged keep their entries, so a file rewritten in place keeps its old size
+        and mtime until something is added to or removed from its directory.
+
+        Args:
+            token: Cancellation token checked between levels of directories
+            restat: Stat the indexed files as well, so in-place edits show in sizes and mtimes.
+                With inotify this is needed once per session, since events cover later edits;
+                without it, or after lost events, on every call
+        """
+        with self._lock:
+            db = self._connect()
+            try:
+                known = dict(db.execute("SELECT path, mtime_ns FROM dirs"))
+                if not known:
+                    # The root's own entry, as find lists the start point too
+                    db.execute("INSERT OR REPLACE INTO entries VALUES (-1, '.', 'd', 0, 0, '', 0)")
+
+                def stat_dirs(paths: List[str]) -> List[Optional[int]]:
+                    mtimes = []
+                    for path in paths:
+                        try:
+                            st = os.stat(os.path.join(self.root, path), follow_symlinks=False)
+                        except OSError:
+                            mtimes.append(None)
+                            continue
+                        mtimes.append(st.st_mtime_ns if stat.S_ISDIR(st.st_mode) else None)
+                    return mtimes
+
+                watcher = self._watcher
+                with timed("find index update"), ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    fully_watched = bool(watcher and watcher.complete and known and watcher.watched.issuperset(known))
+                    if watcher and not fully_watched:
+                        # Watched before they are stat'ed, so nothing changing in between is missed
+                        for path in known.keys() - watcher.watched:
+                            watcher.watch(self.root, path)
+                    dirty = watcher.changed() if watcher else set()
+                    if fully_watched and watcher.complete:
+                        # Everything indexed is watched and no event was lost: the events say what changed
+                        paths = [path for path in dirty if path in known]
+                    else:
+                        paths = list(known) or [""]
+                        # Edits made while a directory was unwatched raised no event
+                        self._restated = False
+                        if watcher:
+                            watcher.complete = True
+                    # In a few large batches; a task per directory costs more than the stat itself
+                    size = max(256, len(paths) // self.workers + 1)
+                    batches = pool.map(stat_dirs, [paths[i:i + size] for i in range(0, len(paths), size)])
+                    changed = []
+                    for path, mtime_ns in zip(paths, (mtime for batch in batches for mtime in batch)):
+                        if mtime_ns is None:
+                            self._remove(db, path)
+                        elif known.get(path) != mtime_ns or path in dirty:
+                            changed.append(path)
+                    listed = 0
+                    # A level at a time: new subdirectories found in one level are listed in the next
+                    while changed:
+                        check_cancelled(token)
+                        if watcher:
+                            # As above, watched before listing
+                            for path in changed:
+                                if path not in watcher.watched:
+                                    watcher.watch(self.root, path)
+                        listings = list(pool.map(lambda p: _list(os.path.join(self.root, p)), changed))
+                        added = []
+                        for path, listing in zip(changed, listings):
+                            listed += 1
+                            if listing is None:
+                                self._remove(db, path)
+                            else:
+                                added += self._replace(db, path, *listing)
+                        changed = added
+                    self.files_restated = 0
+                    if restat and not (watcher and self._restated):
+                        self.files_restated = self._restat(db, pool, token)
+                        self._restated = bool(watcher and watcher.complete)
+                return listed
+            finally:
+                # Directories listed before a Ctrl-C are kept; the rest are still marked for listing
+                db.commit()
+
+    def _restat(self, db, pool, token) -> int:
+        """Stat every indexed file again and store the sizes and mtimes that changed; returns how many did."""
+        rows = db.execute("SELECT e.dir, d.path, e.name, e.size, e.mtime FROM entries e JOIN dirs d ON d.id = e.dir "
+                          "WHERE e.type <> 'd'").fetchall()
+
+        def stat_entries(batch: List[Tuple[int, str, str, int, float]]) -> List[Tuple[int, float, int, str]]:
+            changed = []
+            for dir_id, path, name, size, mtime in batch:
+                try:
+                    st = os.stat(os.path.join(self.root, path, name), follow_symlinks=False)
+                except OSError:
+                    # Removed since: its directory's new mtime gets it dropped on the next update
+                    continue
+                if st.st_size != size or st.st_mtime != mtime:
+                    changed.append((st.st_size, st.st_mtime, dir_id, name))
+            return changed
+
+        size = max(256, len(rows) // self.workers + 1)
+        restated = 0
+        for changed in pool.map(stat_entries, [rows[i:i + size] for i in range(0, len(rows), size)]):
+            check_cancelled(token)
+            db.executemany("UPDATE entries SET size = ?, mtime = ? WHERE dir = ? AND name = ?", changed)
+            restated += len(changed)
+        return restated
+
+    def _dir_id(self, db, path: str, mtime_ns: int = 0) -> int:
+        row = db.execute("SELECT id FROM dirs WHERE path = ?", (path,)).fetchone()
+        if row:
+            db.execute("UPDATE dirs SET mtime_ns = ? WHERE id = ?", (mtime_ns, row[0]))
+            return row[0]
+        depth = path.count("/") + 1 if path else 0
+        return db.execute("INSERT INTO dirs (path, depth, mtime_ns) VALUES (?, ?, ?)", (path, depth, mtime_ns)).lastrowid
+
+    def _replace(self, db, path: str, own: os.stat_result, entries: List[Tuple[str, str, int, float]]) -> List[str]:
+        """Store a fresh listing of path; returns its subdirectories that were not indexed yet."""
+        dir_id = self._dir_id(db, path, own.st_mtime_ns)
+        prefix = path + "/" if path else ""
+        counts = dict(db.execute("SELECT name, children FROM entries WHERE dir = ? AND type = 'd'", (dir_id,)))
+        kept = [entry for entry in entries if not (entry[1] == "d" and entry[0] in PRUNED)]
+        now = {name for name, kind, _, _ in kept if kind == "d"}
+        for name in counts.keys() - now:
+            self._remove(db, prefix + name)
+        added = sorted(now - counts.keys())
+        for name in added:
+            # mtime 0 marks it for listing, even if this update is interrupted before it gets there
+            self._dir_id(db, prefix + name)
+        db.execute("DELETE FROM entries WHERE dir = ?", (dir_id,))
+        db.executemany(
+            "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(dir_id, name, kind, size, mtime, _extension(name), counts.get(name, 0) if kind == "d" else None)
+             for name, kind, size, mtime in kept]
+        )
+        # The directory's own entry, in its parent, records how many entries it has for -empty
+        parent, _, name = path.rpartition("/")
+        row = db.execute("SELECT id FROM dirs WHERE path = ?", (parent,)).fetchone() if path else (-1,)
+        if row:
+            db.execute("UPDATE entries SET children = ?, size = ?, mtime = ? WHERE dir = ? AND name = ?",
+                       (len(kept), own.st_size, own.st_mtime, row[0], name if path else "."))
+        return [prefix + name for name in added]
+
+    def _remove(self, db, path: str):
+        """Drop path and everything indexed below it."""
+        if path:
+            rows = db.execute("SELECT id FROM dirs WHERE path = ? OR (path > ? AND path < ?)",
+                              (path, path + "/", path + "0")).fetchall()
+        else:
+            rows = db.execute("SELECT id FROM dirs").fetchall()
+        for id_, in rows:
+            db.execute("DELETE FROM entries WHERE dir = ?", (id_,))
+            db.execute("DELETE FROM dirs WHERE id = ?", (id_,))
+
+    def query(self, command: str, limit: int = DEFAULT_LIMIT, token=None) -> FindResult:
+        """Run a find command against the index, updating it first."""
+        parsed = FindQuery(command)
+        result = FindResult(command)
+        result.counting = parsed.count
+        started = time.perf_counter()
+        result.dirs_relisted = self.update(token, restat=parsed.stats)
+        result.files_restated = self.files_restated
+        result.update_elapsed = time.perf_counter() - started
+
+        params = dict(parsed.params, start=parsed.start, display=parsed.display,
+                      cut=len(parsed.start) + 2 if parsed.start else 1)
+        conditions = [parsed.where]
+        if parsed.start:
+            params.update(below=parsed.start + "/", after=parsed.start + "0")
+            conditions.append(f"({_REL_SQL} = :start OR ({_REL_SQL} > :below AND {_REL_SQL} < :after))")
+        if parsed.min_depth or parsed.max_depth is not None:
+            params["start_depth"] = parsed.start.count("/") + 1 if parsed.start else 0
+            depth = "(COALESCE(d.depth, -1) + 1 - :start_depth)"
+            conditions.append(f"{depth} >= {parsed.min_depth}")
+            if parsed.max_depth is not None:
+                conditions.append(f"{depth} <= {parsed.max_depth}")
+        # Conditions name entries' columns directly; dirs has none of the same names
+        condition = " AND ".join(conditions)
+        where = f"FROM entries e LEFT JOIN dirs d ON d.id = e.dir WHERE {condition}"
+        # Counting needs no paths, so it skips the join unless a condition looks at them
+        count = f"SELECT COUNT(*) {where}" if "d." in condition else f"SELECT COUNT(*) FROM entries e WHERE {condition}"
+        with self._lock, timed("find index query"):
+            db = self._connect()
+            if parsed.count:
+                result.count = db.execute(count, params).fetchone()[0]
+            else:
+                # Directory by directory in index order, like find, rather than sorting every match
+                rows = db.execute(f"SELECT {_PATH_SQL} {where} LIMIT {int(limit) + 1}", params).fetchall()
+                result.paths = [row[0] for row in rows[:limit]]
+                result.count = len(rows) if len(rows) <= limit else db.execute(count, params).fetchone()[0]
+        result.elapsed = time.perf_counter() - started
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            return {"entries": db.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                    "dirs": db.execute("SELECT COUNT(*) FROM dirs").fetchone()[0],
+                    "path": str(self.path)}
+
+
+def format_find_result(result: FindResult, shown: int = 200) -> str:
+    """Rich markup listing the matches of an indexed find, or their count."""
+    timing = (f"[dim]{result.elapsed * 1000:.0f} ms from the index "
+              f"({result.dirs_relisted} directories re-listed"
+              + (f", {result.files_restated} changed files re-stat'ed" if result.files_restated else "")
+              + f" in {result.update_elapsed * 1000:.0f} ms)[/dim]")
+    if result.counting:
+        return f"[bold]{result.count}[/bold]\n{timing}"
+    if not result.paths:
+        return f"No matches\n{timing}"
+    lines = [escape(path) for path in result.paths[:shown]]
+    if result.count > shown:
+        lines.append(f"[dim]... and {result.count - shown} more[/dim]")
+    lines.append(f"{result.count} match{'es' if result.count != 1 else ''}, {timing}")
+    return "\n".join(lines)
+
+
+# One index per directory !find was run in
+_indexes: Dict[str, FileIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_file_index(root: str = ".") -> FileIndex:
+    """Return the index of root; CAPYBARA_CACHE_DIR overrides where indexes are kept."""
+    root = os.path.abspath(root)
+    with _indexes_lock:
+        if root not in _indexes:
+            cache_dir = os.getenv("CAPYBARA_CACHE_DIR")
+            path = os.path.join(cache_dir, "index", f"{content_hash(root)[:16]}.db") if cache_dir else None
+            _indexes[root] = FileIndex(root, path)
+        return _indexes[root]
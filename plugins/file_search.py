@@ -1,4 +1,6 @@
 from .ai_utils import generate_content
+from .fuzzy_cache import get_fuzzy_cache
+from .intent_resolver import Resolution, resolve_find, resolve_search, try_local
 import re
 
 
@@ -15,8 +17,19 @@ def handle_find(query: str) -> str:
         "python or javascript files": r'find . -type f \( -name "*.py" -o -name "*.js" \)',
     }
 
-    if clean_query in simple_cases:
-        return simple_cases[clean_query]
+    def resolve():
+        if clean_query in simple_cases:
+            return Resolution(simple_cases[clean_query], 1.0, clean_query)
+        return resolve_find(query)
+
+    command = try_local("find", resolve)
+    if command:
+        return command
+
+    fuzzy = get_fuzzy_cache()
+    command = fuzzy.lookup("find", clean_query)
+    if command:
+        return command
 
     prompt = f"""
     Generate a SINGLE LINE, executable UNIX find command for:
@@ -47,6 +60,7 @@ def handle_find(query: str) -> str:
         if not command.startswith("find . "):
             raise ValueError("Command must start with 'find .'")
 
+        fuzzy.add("find", clean_query, command)
         return command
     except Exception as e:
         print(f"AI error: {str(e)}")
@@ -79,6 +93,56 @@ def _basic_find_handler(query: str) -> str:
     return f"find . {' '.join(terms)}" if terms else "find . -type f"
 
 
+def handle_search(query: str) -> str:
+    """
+    Turn a natural-language content search into a Python regular expression
+    Returns a pattern that compiles; quoted text and code names resolve locally
+    """
+    clean_query = " ".join(query.strip().split())
+
+    pattern = try_local("search", lambda: resolve_search(clean_query))
+    if pattern:
+        return pattern
+
+    fuzzy = get_fuzzy_cache()
+    pattern = fuzzy.lookup("search", clean_query.lower())
+    if pattern:
+        return pattern
+
+    prompt = f"""
+    Write a SINGLE Python regular expression that matches the lines of source code or text for:
+    "{query}"
+
+    REQUIREMENTS:
+    1. It is matched line by line against file contents, like grep
+    2. Prefer literal words and identifiers that must appear on a matching line
+    3. Use (?i) only if case should not matter
+    4. No surrounding slashes, quotes or backticks
+
+    ONLY OUTPUT THE REGULAR EXPRESSION ITSELF, no explanations.
+    Regex:"""
+
+    try:
+        pattern = generate_content(prompt).strip().split("\n")[0].strip()
+        pattern = re.sub(r"^(?:regex:\s*)", "", pattern, flags=re.I)
+        if len(pattern) > 2 and pattern[0] == pattern[-1] and pattern[0] in "`'\"/":
+            pattern = pattern[1:-1]
+        if not pattern:
+            raise ValueError("Empty pattern")
+        re.compile(pattern)
+        fuzzy.add("search", clean_query.lower(), pattern)
+        return pattern
+    except Exception as e:
+        print(f"AI error: {str(e)}")
+        return _basic_search_handler(clean_query)
+
+
+def _basic_search_handler(query: str) -> str:
+    """Fallback: lines mentioning any of the query's longer words, ignoring case"""
+    words = [word for word in re.findall(r"\w+", query.lower()) if len(word) > 3]
+    return "(?i)" + "|".join(re.escape(word) for word in words) if words else re.escape(query)
+
+
 if __name__ == "__main__":
     test_queries = [
         "!find .sh files",
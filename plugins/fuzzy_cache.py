@@ -0,0 +1,380 @@
+"""
+Fuzzy query cache for near-identical natural-language requests
+MinHash signatures over word and character n-grams with LSH banding, scoped per command type
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .response_cache import DEFAULT_CACHE_DIR
+
+NUM_PERM = 64
+# 8 bands of 8 rows put the LSH collision threshold near a Jaccard similarity of 0.77
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+# Candidates sharing the most bands are verified exactly, the rest are skipped
+MAX_CANDIDATES = 32
+DEFAULT_MAX_ENTRIES = 50000
+
+# Shell commands differ by a flag or a path, so explain needs a much closer match
+DEFAULT_THRESHOLDS = {"explain": 0.9, "git": 0.75, "find": 0.75}
+FALLBACK_THRESHOLD = 0.8
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x6361707962)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_SYNONYMS = {
+    "py": "python", "python3": "python", ".py": "python",
+    "js": "javascript", ".js": "javascript", "node": "javascript",
+    "ts": "typescript", ".ts": "typescript",
+    "sh": "shell", ".sh": "shell", "bash": "shell", "zsh": "shell",
+    "md": "markdown", ".md": "markdown",
+    "yml": "yaml", ".yml": "yaml", ".yaml": "yaml",
+    "txt": "text", ".txt": "text",
+    "dir": "directory", "folder": "directory",
+    "big": "large", "huge": "large", "bigger": "larger",
+    "locate": "find", "search": "find", "list": "find", "show": "find", "display": "find", "get": "find",
+    "remove": "delete", "rm": "delete",
+    "modified": "changed", "edited": "changed", "updated": "changed", "latest": "last",
+}
+
+_STOPWORDS = {
+    "a", "an", "the", "all", "any", "me", "my", "please", "find", "of", "for", "that", "which", "are",
+    "is", "to", "i", "want", "can", "you", "could", "would", "every", "some", "here", "there", "this",
+}
+
+_NEGATIONS = {"not", "no", "without", "except", "excluding", "never"}
+# Counts and positions in words, which change the answer as much as digits do ("into one" vs "into two")
+_NUMBER_WORDS = {
+    "zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+    "twenty", "hundred", "dozen", "half", "single", "both", "couple", "few", "several", "once", "twice",
+    "first", "second", "third", "fourth", "fifth", "tenth", "last", "next", "previous",
+}
+_WORD_RE = re.compile(r"\.?[\w+-]+(?:[./][\w+-]+)*|[\"'][^\"']*[\"']")
+# camelCase and PascalCase names, kept in their case so _salient can tell them from prose
+_MIXED_CASE = re.compile(r"[a-z][A-Z]")
+# Commit hashes and other hex ids, which differ by a single character
+_HEX = re.compile(r"[0-9a-f]{6,}")
+
+
+def normalize(text: str, scope: str = "") -> List[str]:
+    """Lowercase, canonicalize synonyms, drop filler words and plural endings."""
+    if scope == "explain":
+        # Commands are literal: keep every token, only normalize spacing and case
+        return text.strip().lower().split()
+
+    tokens = []
+    for original in _WORD_RE.findall(text):
+        word = original.lower()
+        if word[:1] in "\"'":
+            # Keep quoted phrases as one token so the normalized key splits back the same way
+            tokens.append(word.replace(" ", "_"))
+            continue
+        # "JavaScript" is vocabulary, not an identifier
+        if _MIXED_CASE.search(original) and word not in _SYNONYMS and word not in _SYNONYMS.values():
+            tokens.append(original)
+            continue
+        word = _SYNONYMS.get(word, word)
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss") and "/" not in word:
+            word = word[:-1]
+        word = _SYNONYMS.get(word, word)
+        if word not in _STOPWORDS:
+            tokens.append(word)
+    return tokens
+
+
+def _salient(tokens: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Tokens that must match exactly: numbers (in digits or words), paths, quoted strings, identifiers, hex ids, and negations."""
+    literal = {t for t in tokens if any(c.isdigit() for c in t) or "/" in t or "." in t or t[:1] in "\"'"
+               or "_" in t or "-" in t or t != t.lower() or _HEX.fullmatch(t) or t in _NUMBER_WORDS}
+    return literal, {t for t in tokens if t in _NEGATIONS}
+
+
+def shingles(tokens: List[str]) -> Set[str]:
+    """Word tokens, word bigrams and character trigrams; bigrams keep "a onto b" apart from "b onto a"."""
+    joined = " ".join(tokens)
+    grams = {joined[i:i + 3] for i in range(max(1, len(joined) - 2))}
+    bigrams = {f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])}
+    return {"w:" + t for t in tokens} | bigrams | {"c:" + g for g in grams}
+
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(features: Set[str]) -> List[int]:
+    hashes = [_hash(f) for f in features] or [0]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("scope", "query", "answer", "key", "signature", "created", "_features", "_salient")
+
+    def __init__(self, scope, query, answer, key, signature, created):
+        self.scope = scope
+        self.query = query
+        self.answer = answer
+        self.key = key
+        self.signature = signature
+        self.created = created
+        self._features = None
+        self._salient = None
+
+    # Computed on first verification so loading a large index stays cheap
+    @property
+    def features(self) -> Set[str]:
+        if self._features is None:
+            self._features = shingles(self.key.split())
+        return self._features
+
+    @property
+    def salient(self):
+        if self._salient is None:
+            self._salient = _salient(self.key.split())
+        return self._salient
+
+    def bands(self):
+        for band in range(BANDS):
+            yield (self.scope, band, tuple(self.signature[band * ROWS:(band + 1) * ROWS]))
+
+
+class FuzzyCache:
+    def __init__(self, path: Optional[str] = None, thresholds: Optional[Dict[str, float]] = None,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, enabled: bool = True):
+        """
+        Initialize the fuzzy cache.
+
+        Args:
+            path: JSON lines file the index is persisted to (defaults to ~/.capybara/fuzzy_cache.jsonl)
+            thresholds: Minimum Jaccard similarity per scope for a hit
+            max_entries: Oldest entries are dropped beyond this many
+            enabled: When False every lookup misses and nothing is stored
+        """
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "fuzzy_cache.jsonl"
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: Dict[int, _Entry] = {}
+        self._exact: Dict[Tuple[str, str], int] = {}
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+        self.lookups: Dict[str, int] = {}
+        self.hits: Dict[str, int] = {}
+        self._latencies = deque(maxlen=1000)
+
+    def warm(self):
+        """Load the persisted index in the background so the first lookup does not wait for it."""
+        if self.enabled and not self._loaded:
+            threading.Thread(target=self._warm, daemon=True).start()
+
+    def _warm(self):
+        with self._lock:
+            self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        """Read the persisted index on first use."""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._insert(record["scope"], record["query"], record["answer"], record.get("key"),
+                                     record.get("signature"), record.get("created", 0.0))
+                    except (ValueError, KeyError):
+                        continue
+        except OSError as e:
+            print(f"Warning: could not read fuzzy cache: {e}")
+
+    def _insert(self, scope: str, query: str, answer: str, key: Optional[str] = None,
+                signature: Optional[List[int]] = None, created: Optional[float] = None) -> _Entry:
+        if key is None:
+            key = " ".join(normalize(query, scope))
+        if (scope, key) in self._exact:
+            self._remove(self._exact[(scope, key)])
+
+        entry = _Entry(scope, query, answer, key, signature, created or time.time())
+        if not signature or len(signature) != NUM_PERM:
+            entry.signature = minhash(entry.features)
+
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = entry
+        self._exact[(scope, key)] = entry_id
+        for band_key in entry.bands():
+            self._buckets.setdefault(band_key, set()).add(entry_id)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+        return entry
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._exact.pop((entry.scope, entry.key), None)
+        for band_key in entry.bands():
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def lookup(self, scope: str, query: str) -> Optional[str]:
+        """Return the stored answer of the most similar past query in scope, if similar enough."""
+        if not self.enabled:
+            return None
+        started = time.perf_counter()
+        with self._lock:
+            self._ensure_loaded()
+            self.lookups[scope] = self.lookups.get(scope, 0) + 1
+            answer = self._find(scope, query)
+            if answer is not None:
+                self.hits[scope] = self.hits.get(scope, 0) + 1
+        self._latencies.append(time.perf_counter() - started)
+        return answer
+
+    def _find(self, scope: str, query: str) -> Optional[str]:
+        tokens = normalize(query, scope)
+        if not tokens:
+            return None
+
+        exact = self._exact.get((scope, " ".join(tokens)))
+        if exact is not None:
+            return self._entries[exact].answer
+
+        features = shingles(tokens)
+        signature = minhash(features)
+        shared: Dict[int, int] = {}
+        for band in range(BANDS):
+            for entry_id in self._buckets.get((scope, band, tuple(signature[band * ROWS:(band + 1) * ROWS])), ()):
+                shared[entry_id] = shared.get(entry_id, 0) + 1
+        candidates = sorted(shared, key=shared.get, reverse=True)[:MAX_CANDIDATES]
+
+        threshold = self.thresholds.get(scope, FALLBACK_THRESHOLD)
+        salient = _salient(tokens)
+        best, best_score = None, threshold
+        for entry_id in candidates:
+            entry = self._entries[entry_id]
+            if entry.salient != salient:
+                continue
+            score = jaccard(features, entry.features)
+            if score >= best_score:
+                best, best_score = entry, score
+        return best.answer if best else None
+
+    def add(self, scope: str, query: str, answer: str):
+        """Remember the answer to a query and persist it."""
+        if not self.enabled or not answer:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._insert(scope, query, answer)
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                if self._next_id > 2 * self.max_entries:
+                    self._compact()
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(self._record(entry)) + "\n")
+            except OSError as e:
+                print(f"Warning: could not write fuzzy cache: {e}")
+
+    @staticmethod
+    def _record(entry: _Entry) -> dict:
+        return {"scope": entry.scope, "query": entry.query, "answer": entry.answer, "key": entry.key,
+                "signature": entry.signature, "created": entry.created}
+
+    def _compact(self):
+        """Rewrite the file with only live entries."""
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(self._record(entry)) + "\n")
+        os.replace(tmp, self.path)
+
+    def clear(self) -> int:
+        """Remove all entries and return how many were dropped."""
+        with self._lock:
+            self._ensure_loaded()
+            count = len(self._entries)
+            self._entries.clear()
+            self._exact.clear()
+            self._buckets.clear()
+            self.lookups.clear()
+            self.hits.clear()
+            self._latencies.clear()
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        return count
+
+    def stats(self) -> dict:
+        """Return entry count, per-scope hit rates and lookup latency."""
+        latencies = sorted(self._latencies)
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "scopes": {
+                    scope: {"lookups": total, "hits": self.hits.get(scope, 0),
+                            "hit_rate": self.hits.get(scope, 0) / total}
+                    for scope, total in self.lookups.items()
+                },
+                "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+                "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+            }
+
+
+def format_fuzzy_stats(stats: dict) -> str:
+    """Format fuzzy cache statistics for display."""
+    if not stats["enabled"]:
+        return "[dim]Fuzzy cache: disabled[/dim]"
+    lines = [f"[bold]Fuzzy cache:[/bold] {stats['entries']} queries "
+             f"[dim](lookup p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms)[/dim]"]
+    for scope, entry in sorted(stats["scopes"].items()):
+        lines.append(f"  {scope}: {entry['hit_rate'] * 100:.0f}% [dim]({entry['hits']}/{entry['lookups']})[/dim]")
+    return "\n".join(lines)
+
+
+# Global instance
+_global_fuzzy: Optional[FuzzyCache] = None
+_global_lock = threading.Lock()
+
+
+def get_fuzzy_cache() -> FuzzyCache:
+    """Return the shared fuzzy cache, configured from CAPYBARA_FUZZY* environment variables."""
+    global _global_fuzzy
+
+    with _global_lock:
+        if _global_fuzzy is None:
+            cache_dir = os.getenv("CAPYBARA_CACHE_DIR")
+            threshold = os.getenv("CAPYBARA_FUZZY_THRESHOLD")
+            _global_fuzzy = FuzzyCache(
+                path=os.path.join(cache_dir, "fuzzy_cache.jsonl") if cache_dir else None,
+                thresholds={scope: float(threshold) for scope in DEFAULT_THRESHOLDS} if threshold else None,
+                max_entries=int(os.getenv("CAPYBARA_FUZZY_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                enabled=os.getenv("CAPYBARA_FUZZY", "on").lower() not in ("0", "off", "false", "no"),
+            )
+        return _global_fuzzy
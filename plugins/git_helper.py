@@ -1,10 +1,12 @@
 from typing import List
 from .ai_utils import generate_content
+from .fuzzy_cache import get_fuzzy_cache
+from .intent_resolver import Resolution, resolve_git, try_local
 
 
 def handle_git(args: List[str]) -> str:
     """
-    Generate precise Git commands using OpenAI.
+    Generate precise Git commands, locally when the request is understood, else using OpenAI.
     Returns ONLY the executable Git command without explanations.
     """
     if not args:
@@ -18,21 +20,34 @@ def handle_git(args: List[str]) -> str:
         "diff": "git diff --cached",
     }
 
-    if args[0] in simple_commands:
-        return simple_commands[args[0]]
+    def resolve():
+        if len(args) == 1 and args[0] in simple_commands:
+            return Resolution(simple_commands[args[0]], 1.0, args[0])
+        return resolve_git(args)
+
+    command = try_local("git", resolve)
+    if command:
+        return command
+
+    request = " ".join(args)
+    fuzzy = get_fuzzy_cache()
+    command = fuzzy.lookup("git", request)
+    if command:
+        return command
 
     prompt = f"""
     Convert this natural language Git request to a SINGLE executable Git command.
     Return ONLY the command without any explanations or formatting.
 
-    Request: git {' '.join(args)}
+    Request: git {request}
 
     Command: git """
 
     try:
         full_command = generate_content(prompt)
-        if full_command.startswith("git "):
-            return full_command
-        return f"git {full_command}"
+        if not full_command.startswith("git "):
+            full_command = f"git {full_command}"
+        fuzzy.add("git", request, full_command)
+        return full_command
     except Exception:
-        return f"git {' '.join(args)}"
+        return f"git {request}"
@@ -0,0 +1,308 @@
+"""
+Command history in SQLite
+Keeps the ordered log for up-arrow and search, plus per-command and per-directory use counts
+so suggestions are an indexed prefix lookup ranked by frecency
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prompt_toolkit.auto_suggest import AutoSuggest, Suggestion
+from prompt_toolkit.history import History
+
+from .instrumentation import timed
+from .response_cache import DEFAULT_CACHE_DIR
+
+LEGACY_FILE = ".capybara_history"
+LOAD_LIMIT = 10000
+MAX_ENTRIES = 100000
+# A use counts half as much after this long
+HALF_LIFE = 7 * 24 * 3600
+# Uses in the current directory count this many times more than uses elsewhere
+CWD_WEIGHT = 4.0
+# Best candidates fetched from each index before ranking exactly
+CANDIDATES = 20
+# Prefixes matching more commands than this are searched from the top ranks down instead of sorted
+DENSE_PREFIX = 2000
+
+
+def use_rank(when: float) -> float:
+    """log2 of the weight of one use at time when.
+
+    Every weight decays at the same rate, so ranks can be compared, summed and
+    indexed without knowing the current time.
+    """
+    return when / HALF_LIFE
+
+
+def add_ranks(a: float, b: float) -> float:
+    """log2(2**a + 2**b), without overflowing."""
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def parse_file_history(data: str) -> List[Tuple[str, Optional[float]]]:
+    """Parse prompt_toolkit FileHistory text into (command, timestamp) pairs, oldest first."""
+    entries = []
+    lines: List[str] = []
+    when: Optional[float] = None
+
+    def add():
+        if lines:
+            entries.append(("".join(lines)[:-1], when))
+
+    for line in data.splitlines(keepends=True):
+        if line.startswith("+"):
+            lines.append(line[1:])
+            continue
+        add()
+        lines = []
+        if line.startswith("# "):
+            try:
+                when = datetime.fromisoformat(line[2:].strip()).timestamp()
+            except ValueError:
+                pass
+    add()
+    return entries
+
+
+class HistoryStore:
+    def __init__(self, path: Optional[str] = None, legacy_files: Optional[List[Path]] = None):
+        """
+        Initialize the store. The database is opened on first use.
+
+        Args:
+            path: SQLite database file (defaults to ~/.capybara/history.db)
+            legacy_files: FileHistory files to import; already imported parts are skipped
+        """
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "history.db"
+        self.legacy_files = legacy_files or []
+        self.imported = 0
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is not None:
+            return self._db
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(str(self.path), check_same_thread=False)
+            db.execute("SELECT 1 FROM sqlite_master").fetchall()
+        except (OSError, sqlite3.Error) as e:
+            # History for this session only, rather than none
+            print(f"Warning: history not saved: {e}")
+            db = sqlite3.connect(":memory:", check_same_thread=False)
+        db.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY, command TEXT NOT NULL, cwd TEXT NOT NULL, used REAL NOT NULL);"
+            # rank: log2 of the sum of each use's decayed weight (see use_rank)
+            "CREATE TABLE IF NOT EXISTS commands ("
+            "command TEXT PRIMARY KEY, count INTEGER NOT NULL, last_used REAL NOT NULL, rank REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS commands_rank ON commands(rank);"
+            "CREATE TABLE IF NOT EXISTS command_dirs ("
+            "command TEXT NOT NULL, cwd TEXT NOT NULL, count INTEGER NOT NULL, last_used REAL NOT NULL, "
+            "rank REAL NOT NULL, PRIMARY KEY (command, cwd));"
+            "CREATE INDEX IF NOT EXISTS command_dirs_cwd ON command_dirs(cwd, command);"
+            "CREATE INDEX IF NOT EXISTS command_dirs_rank ON command_dirs(cwd, rank);"
+            "CREATE TABLE IF NOT EXISTS imports (path TEXT PRIMARY KEY, offset INTEGER NOT NULL);"
+        )
+        db.create_function("add_ranks", 2, add_ranks, deterministic=True)
+        self._db = db
+        for path in self.legacy_files:
+            self._import(path)
+        # The ordered log only serves up-arrow and search; counts keep the full picture
+        db.execute("DELETE FROM entries WHERE id <= (SELECT MAX(id) FROM entries) - ?", (MAX_ENTRIES,))
+        db.commit()
+        return db
+
+    def _import(self, path: Path):
+        """Import whatever part of a FileHistory file has not been imported yet."""
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        key = str(path.resolve())
+        row = self._db.execute("SELECT offset FROM imports WHERE path = ?", (key,)).fetchone()
+        offset = row[0] if row else 0
+        if offset == size:
+            return
+        if offset > size:
+            # Rewritten rather than appended to; its old entries are already counted
+            offset = size
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read().decode("utf-8", errors="replace")
+            fallback = path.stat().st_mtime
+            # FileHistory was written to the directory the CLI started in, so credit that directory
+            cwd = str(path.resolve().parent)
+            entries = parse_file_history(data)
+            self._record([(command, cwd, when or fallback) for command, when in entries])
+            self.imported += len(entries)
+        self._db.execute(
+            "INSERT INTO imports (path, offset) VALUES (?, ?) ON CONFLICT(path) DO UPDATE SET offset = excluded.offset",
+            (key, size),
+        )
+
+    def _record(self, rows: List[Tuple[str, str, float]]):
+        rows = [row for row in rows if row[0].strip()]
+        # Only the newest entries would survive pruning anyway
+        self._db.executemany("INSERT INTO entries (command, cwd, used) VALUES (?, ?, ?)", rows[-MAX_ENTRIES:])
+        # Fold repeats together first, so an import costs one upsert per distinct command
+        overall: Dict[str, list] = {}
+        here: Dict[Tuple[str, str], list] = {}
+        for command, cwd, used in rows:
+            for totals, key in ((overall, command), (here, (command, cwd))):
+                total = totals.get(key)
+                if total is None:
+                    totals[key] = [1, used, use_rank(used)]
+                else:
+                    total[0] += 1
+                    total[1] = max(total[1], used)
+                    total[2] = add_ranks(total[2], use_rank(used))
+        self._db.executemany(
+            "INSERT INTO commands (command, count, last_used, rank) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(command) DO UPDATE SET count = count + excluded.count, "
+            "last_used = max(last_used, excluded.last_used), rank = add_ranks(rank, excluded.rank)",
+            [(command, *total) for command, total in overall.items()],
+        )
+        self._db.executemany(
+            "INSERT INTO command_dirs (command, cwd, count, last_used, rank) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(command, cwd) DO UPDATE SET count = count + excluded.count, "
+            "last_used = max(last_used, excluded.last_used), rank = add_ranks(rank, excluded.rank)",
+            [(command, cwd, *total) for (command, cwd), total in here.items()],
+        )
+
+    def add(self, command: str, cwd: Optional[str] = None):
+        with self._lock:
+            db = self._connect()
+            self._record([(command, cwd or os.getcwd(), time.time())])
+            db.commit()
+
+    def recent(self, limit: int = LOAD_LIMIT) -> Iterator[str]:
+        """Most recent commands first, skipping immediate repeats."""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT command FROM entries ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        previous = None
+        for (command,) in rows:
+            if command != previous:
+                yield command
+            previous = command
+
+    def suggest(self, prefix: str, cwd: Optional[str] = None) -> Optional[str]:
+        """The highest-ranked command that extends prefix, by frecency with a bonus for this directory."""
+        if not prefix.strip():
+            return None
+        # Every command that starts with the prefix, except the prefix itself
+        bounds = {"cwd": cwd or os.getcwd(), "prefix": prefix, "upper": prefix + "\U0010ffff", "limit": CANDIDATES}
+        with self._lock:
+            db = self._connect()
+            overall = self._top(db, "commands", "sqlite_autoindex_commands_1", "commands_rank", "", bounds)
+            here = self._top(db, "command_dirs", "command_dirs_cwd", "command_dirs_rank", "cwd = :cwd AND ", bounds)
+            # Complete both sides for the candidates only one query found
+            missing = [c for c in overall if c not in here]
+            if missing:
+                here.update(db.execute(
+                    f"SELECT command, rank FROM command_dirs WHERE cwd = ? AND command IN ({','.join('?' * len(missing))})",
+                    [bounds["cwd"], *missing]).fetchall())
+            missing = [c for c in here if c not in overall]
+            if missing:
+                overall.update(db.execute(
+                    f"SELECT command, rank FROM commands WHERE command IN ({','.join('?' * len(missing))})",
+                    missing).fetchall())
+        if not overall:
+            return None
+        top = max(overall.values())
+
+        def score(command: str) -> float:
+            total = 2 ** (overall[command] - top)
+            if command in here:
+                total += CWD_WEIGHT * 2 ** (here[command] - top)
+            return total
+
+        return max(overall, key=score)
+
+    @staticmethod
+    def _top(db, table: str, by_command: str, by_rank: str, scope: str, bounds: dict) -> dict:
+        """
+        Best-ranked commands in the prefix range, as {command: rank}.
+
+        A short prefix can match most of the table, so sorting every match would be
+        slow; then walking the rank index down finds matches almost immediately. A
+        long prefix is faster the other way round, so probe which case this is first.
+        """
+        where = f"{scope}command > :prefix AND command < :upper"
+        dense = db.execute(
+            f"SELECT 1 FROM {table} INDEXED BY {by_command} WHERE {where} LIMIT 1 OFFSET {DENSE_PREFIX}", bounds
+        ).fetchone()
+        return dict(db.execute(
+            f"SELECT command, rank FROM {table} INDEXED BY {by_rank if dense else by_command} "
+            f"WHERE {where} ORDER BY rank DESC LIMIT :limit", bounds
+        ).fetchall())
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._connect()
+            return {
+                "entries": db.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "commands": db.execute("SELECT COUNT(*) FROM commands").fetchone()[0],
+            }
+
+
+class StoreHistory(History):
+    """prompt_toolkit history backed by a HistoryStore; loads only the most recent entries."""
+
+    def __init__(self, store: HistoryStore, limit: int = LOAD_LIMIT):
+        super().__init__()
+        self.store = store
+        self.limit = limit
+
+    def load_history_strings(self):
+        yield from self.store.recent(self.limit)
+
+    def store_string(self, string: str):
+        self.store.add(string)
+
+
+class FrecencyAutoSuggest(AutoSuggest):
+    """Suggest the completion of the current line that is used most, most recently and in this directory."""
+
+    def __init__(self, store: HistoryStore):
+        self.store = store
+
+    def get_suggestion(self, buffer, document) -> Optional[Suggestion]:
+        text = document.text.rsplit("\n", 1)[-1]
+        with timed("history suggest"):
+            command = self.store.suggest(text)
+        return Suggestion(command[len(text):]) if command else None
+
+
+def legacy_history_files() -> List[Path]:
+    """FileHistory files earlier versions wrote: in the directory the CLI was started from, beside cli.py, and in ~."""
+    seen, files = set(), []
+    for directory in (Path.cwd(), Path(__file__).parent.parent, Path.home()):
+        path = directory / LEGACY_FILE
+        if path.is_file() and path.resolve() not in seen:
+            seen.add(path.resolve())
+            files.append(path)
+    return files
+
+
+# Global instance
+_global_store: Optional[HistoryStore] = None
+
+
+def get_history_store() -> HistoryStore:
+    """Return the shared history store; CAPYBARA_HISTORY_FILE overrides its location."""
+    global _global_store
+
+    if _global_store is None:
+        _global_store = HistoryStore(os.getenv("CAPYBARA_HISTORY_FILE"), legacy_files=legacy_history_files())
+    return _global_store
@@ -0,0 +1,189 @@
+"""
+Lightweight latency instrumentation
+Streaming log-bucket histograms per operation, plus a bounded span log for Chrome trace export
+"""
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from rich.markup import escape
+
+# Buckets grow by 5%, so percentiles are within about 2.5% of the true value
+BUCKET_BASE = 1.05
+_LOG_BASE = math.log(BUCKET_BASE)
+MAX_SPANS = 20000
+# Trace timestamps count from here, so spans that began before the registry existed stay positive
+_STARTED = time.perf_counter()
+
+
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        index = math.floor(math.log(seconds) / _LOG_BASE) if seconds > 0 else -1000
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100 * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Geometric middle of the bucket, clamped to what was actually observed
+                return min(self.max, max(self.min, BUCKET_BASE ** (index + 0.5)))
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p95_ms": self.percentile(95) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True, max_spans: int = MAX_SPANS):
+        """
+        Initialize the metrics registry.
+
+        Args:
+            enabled: When False, timing is skipped entirely
+            max_spans: Most recent timed spans kept for trace export
+        """
+        self.enabled = enabled
+        self.histograms: Dict[str, Histogram] = {}
+        self.spans = deque(maxlen=max_spans)
+        self.origin = _STARTED
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, start: Optional[float] = None):
+        """Add one observation; start (a perf_counter value) also logs it as a span."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+            if start is not None:
+                self.spans.append((name, start, seconds, threading.get_ident()))
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.spans.clear()
+            self.origin = time.perf_counter()
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def export_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"operations": self.snapshot()}, f, indent=2)
+
+    def export_trace(self, path: str):
+        """Write spans in Chrome trace event format (chrome://tracing, Perfetto)."""
+        with self._lock:
+            spans = list(self.spans)
+            origin = self.origin
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "cat": name.split(" ", 1)[0],
+                "ph": "X",
+                "ts": (start - origin) * 1e6,
+                "dur": seconds * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, start, seconds, tid in spans
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class timed:
+    """Time a block (with timed(name): ...) or every call of a function (@timed(name))."""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        get_metrics().record(self.name, time.perf_counter() - self.start, self.start)
+        return False
+
+    def __call__(self, fn):
+        name = self.name
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                get_metrics().record(name, time.perf_counter() - start, start)
+        return wrapper
+
+
+def format_stats(snapshot: Dict[str, dict]) -> str:
+    """Format histogram summaries as a table."""
+    if not snapshot:
+        return "[dim]Nothing measured yet[/dim]"
+    width = max(len("operation"), max(len(name) for name in snapshot))
+    lines = [f"[bold]{'operation':<{width}} {'count':>7} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}[/bold]"]
+    for name, s in snapshot.items():
+        lines.append(
+            f"{escape(name):<{width}} {s['count']:>7} {s['p50_ms']:>8.2f}ms {s['p95_ms']:>8.2f}ms "
+            f"{s['p99_ms']:>8.2f}ms {s['max_ms']:>8.2f}ms"
+        )
+    return "\n".join(lines)
+
+
+# Global instance
+_global_metrics: Optional[Metrics] = None
+_global_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """Return the shared metrics registry; CAPYBARA_STATS=off disables recording."""
+    global _global_metrics
+
+    if _global_metrics is None:
+        with _global_lock:
+            if _global_metrics is None:
+                _global_metrics = Metrics(
+                    enabled=os.getenv("CAPYBARA_STATS", "on").lower() not in ("0", "off", "false", "no")
+                )
+    return _global_metrics
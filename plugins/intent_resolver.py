@@ -0,0 +1,520 @@
+"""
+Local rule-based resolver for !git, !find and !search requests
+Turns common natural-language requests into commands without a network call
+"""
+import os
+import re
+import shlex
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CONFIDENCE = 0.8
+
+# Words that carry no meaning for either grammar
+FILLER = {
+    "a", "all", "an", "and", "any", "are", "can", "could", "every", "for", "get", "give", "i", "is", "it",
+    "just", "let", "list", "me", "my", "of", "only", "please", "see", "show", "that", "the", "them",
+    "there", "to", "want", "what", "which", "with", "you", "display", "print", "view", "current",
+}
+
+
+class Resolution:
+    def __init__(self, command: str, confidence: float, rule: str):
+        """A locally resolved command and how sure the grammar is about it."""
+        self.command = command
+        self.confidence = confidence
+        self.rule = rule
+
+    def __repr__(self):
+        return f"Resolution({self.command!r}, confidence={self.confidence:.2f}, rule={self.rule!r})"
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _confidence(recognized: int, leftover: List[str]) -> float:
+    """Share of meaningful words the grammar understood."""
+    unknown = [w for w in leftover if w not in FILLER]
+    if recognized == 0:
+        return 0.0
+    return recognized / (recognized + len(unknown))
+
+
+# ---------------------------------------------------------------------------
+# git
+# ---------------------------------------------------------------------------
+
+_TIME_WORDS = {
+    "today": "midnight",
+    "yesterday": "yesterday",
+    "this week": "1 week ago",
+    "last week": "1 week ago",
+    "past week": "1 week ago",
+    "this month": "1 month ago",
+    "last month": "1 month ago",
+    "past month": "1 month ago",
+}
+
+_REF = r"([\w./-]+)"
+
+# (rule name, pattern matched against the whole request, command template, confidence)
+_GIT_RULES: List[Tuple[str, str, str, float]] = [
+    ("status", r"(?:git )?status|what changed|what'?s changed|changes", "git status", 1.0),
+    ("branch-list", r"branch(?:es)?|local branches", "git branch -vv", 1.0),
+    ("branch-all", r"(?:all|remote) branch(?:es)?|branch(?:es)? (?:including|with) remotes?", "git branch -a", 1.0),
+    ("branch-create", r"(?:create|new|make|start)(?: a)?(?: new)? branch (?:called |named )?" + _REF,
+     "git checkout -b {0}", 0.95),
+    ("branch-switch", r"(?:switch|checkout)(?: to)?(?: (?:the )?branch)? " + _REF, "git switch {0}", 0.9),
+    # "change"/"go" only with an explicit branch: "change the README" and "go back" are not switches
+    ("branch-switch-to", r"(?:change|go|move)(?: over)? to (?:the )?branch " + _REF, "git switch {0}", 0.9),
+    ("branch-delete", r"(?:delete|remove)(?: the)? branch " + _REF, "git branch -d {0}", 0.95),
+    ("branch-rename", r"rename(?: current| this)?(?: branch)? to " + _REF, "git branch -m {0}", 0.95),
+    ("diff", r"diff", "git diff --cached", 1.0),
+    ("diff-unstaged", r"(?:unstaged|working tree|working) (?:diff|changes)|diff (?:unstaged|working tree)", "git diff", 1.0),
+    ("diff-staged", r"(?:staged|cached) (?:diff|changes)|diff (?:staged|cached)", "git diff --cached", 1.0),
+    ("diff-file", r"diff (?:of |for |in )?(?:file )?" + _REF, "git diff {0}", 0.9),
+    ("stash-list", r"stash(?:es)?|stash list|list stash(?:es)?", "git stash list", 1.0),
+    ("stash-push", r"stash (?:my |current |all )?(?:changes|work|everything)|save (?:my )?(?:changes|work) (?:in|to) (?:the )?stash",
+     "git stash push", 0.95),
+    ("stash-pop", r"(?:pop|apply|restore)(?: the)?(?: last| latest)? stash|stash (?:pop|apply)", "git stash pop", 0.95),
+    ("undo-commit", r"undo(?: the)? (?:last|latest|previous) commit(?: (?:but )?keep(?:ing)?(?: the| my)? changes)?",
+     "git reset --soft HEAD~1", 0.95),
+    ("amend", r"amend(?: the)?(?: last| latest)?(?: commit)?(?: without changing(?: the)? message)?",
+     "git commit --amend --no-edit", 0.9),
+    ("add-all", r"(?:add|stage)(?: all| everything)(?: changes| files)?", "git add -A", 1.0),
+    ("add-file", r"(?:add|stage)(?: file)? " + _REF, "git add {0}", 0.9),
+    ("unstage", r"unstage(?: file)? " + _REF, "git restore --staged {0}", 0.95),
+    ("unstage-all", r"unstage(?: all| everything)?", "git restore --staged .", 0.95),
+    ("discard-file", r"(?:discard|revert)(?: (?:changes|edits))?(?: (?:in|to))?(?: file)? " + _REF,
+     "git restore {0}", 0.85),
+    ("commit-msg", r"commit(?: (?:everything|all))?(?: with)?(?: (?:message|msg|-m))? [\"'](.+)[\"']", "git commit -m {0!q}", 0.95),
+    ("push", r"push", "git push", 1.0),
+    ("push-new", r"push(?: (?:new|this|current))? branch(?: to origin)?|push (?:and )?set upstream",
+     "git push -u origin HEAD", 0.95),
+    ("pull", r"pull", "git pull", 1.0),
+    ("pull-rebase", r"pull(?: with)? rebase|pull --rebase", "git pull --rebase", 1.0),
+    ("fetch", r"fetch(?: all| everything)?(?: remotes)?", "git fetch --all --prune", 1.0),
+    ("show-last", r"(?:show )?(?:the )?(?:last|latest|previous) commit(?: details)?|show head", "git show HEAD", 0.95),
+    ("blame", r"(?:blame|who (?:changed|edited|wrote|modified))(?: file)? " + _REF, "git blame {0}", 0.9),
+    ("remotes", r"remotes?|remote urls?|show remotes?", "git remote -v", 1.0),
+    ("tags", r"tags?|list tags?", "git tag --list", 1.0),
+    ("clean-preview", r"(?:clean|remove|delete) untracked(?: files)?", "git clean -n", 0.85),
+    ("contributors", r"(?:contributors|authors|who contributed)", "git shortlog -sn", 0.95),
+]
+
+_GIT_RULES_COMPILED = [(name, re.compile(pattern, re.I), template, conf) for name, pattern, template, conf in _GIT_RULES]
+# Words a ref placeholder can swallow that are never the branch or file meant ("switch branch", "switch back")
+_NOT_REFS = FILLER | {"back", "branch", "branches", "new", "other", "previous", "last", "this", "here", "file", "files"}
+
+
+def _match_git(pattern: re.Pattern, template: str, text: str) -> Optional[re.Match]:
+    """Full match of a rule whose unquoted placeholders hold no filler or keyword."""
+    match = pattern.fullmatch(text)
+    if match and "{0}" in template and (match.group(1) or "").lower() in _NOT_REFS:
+        return None
+    return match
+
+
+def _format_git(template: str, groups: Tuple[str, ...]) -> str:
+    result = template
+    for i, group in enumerate(groups):
+        result = result.replace("{%d!q}" % i, _quote(group))
+        result = result.replace("{%d}" % i, shlex.quote(group))
+    return result
+
+
+def _resolve_git_log(text: str) -> Optional[Resolution]:
+    """Handle log requests with count, author, time range and path modifiers."""
+    remaining = " " + text.lower() + " "
+    options = []
+    recognized = 0
+
+    def take(pattern: str) -> Optional[re.Match]:
+        nonlocal remaining, recognized
+        match = re.search(pattern, remaining, re.I)
+        if match:
+            recognized += len(match.group(0).split())
+            remaining = remaining[:match.start()] + " " + remaining[match.end():]
+        return match
+
+    count_word = r"(?:(last|latest|recent|newest|past|first|oldest|earliest) )"
+    # "5 commits" and "last 5 commits" are counts; taken before "commits" is, which they look ahead to
+    count = take(rf"\b{count_word}?(\d+)(?= (?:\w+ )?commits?\b)")
+
+    if not take(r"\b(?:log|history|commits?|git log)\b"):
+        return None
+    # A second mention ("commit history") is part of the same verb
+    take(r"\b(?:log|history|commits?)\b")
+
+    author = take(r"\b(?:by|from|author|authored by|made by) ([\w.@-]+)")
+    if author:
+        original = re.search(re.escape(author.group(1)), text, re.I)
+        options.append(f"--author={_quote(original.group(0) if original else author.group(1))}")
+
+    since = take(r"\b(?:since |from |in the )?(today|yesterday|(?:this|last|past) (?:week|month))\b")
+    if since:
+        options.append(f"--since={_quote(_TIME_WORDS[since.group(1)])}")
+    else:
+        days = take(r"\b(?:in the |since |from )?(?:last|past) (\d+) (day|week|month)s?\b")
+        if days:
+            options.append(f"--since={_quote(f'{days.group(1)} {days.group(2)}s ago')}")
+
+    if not count:
+        # Only next to a count word: a bare number ("log 2024") is left over for the AI
+        count = take(rf"\b{count_word}(\d+)\b")
+    oldest = None
+    if count and count.group(1) in ("first", "oldest", "earliest"):
+        # -n keeps the newest commits even with --reverse, so the oldest are cut with head
+        oldest = count.group(2)
+    elif count:
+        options.insert(0, f"-n {count.group(2)}")
+
+    graph = take(r"\b(?:graph|tree|visual)\b")
+    if graph:
+        options.insert(0, "--graph --all")
+
+    path = take(r"\b(?:for|of|in|on|touching) (?:file |the file |path )?([\w./-]+\.[\w]+|[\w-]+/[\w./-]*)")
+    branch = None if path else take(r"\b(?:on|of) (?:branch )?([\w./-]+) branch\b|\bon branch ([\w./-]+)")
+
+    if graph and oldest:
+        # git refuses --graph with --reverse
+        return None
+
+    command = "git log --oneline"
+    if oldest:
+        command += " --reverse"
+    if options:
+        command += " " + " ".join(options)
+    elif not graph and not oldest:
+        command += " -n 10"
+    if branch:
+        command += " " + shlex.quote(branch.group(1) or branch.group(2))
+    if path:
+        command += " -- " + shlex.quote(path.group(1))
+    if oldest:
+        command += f" | head -n {oldest}"
+
+    leftover = remaining.split()
+    confidence = _confidence(recognized, leftover)
+    return Resolution(command, confidence, "log")
+
+
+def resolve_git(args: List[str]) -> Optional[Resolution]:
+    """Resolve a !git request; returns None if no rule applies."""
+    text = " ".join(args).strip()
+    if text.lower().startswith("git "):
+        text = text[4:]
+    text = text.rstrip("?.! ")
+    if not text:
+        return Resolution("git status", 1.0, "status")
+
+    best: Optional[Resolution] = None
+    for name, pattern, template, conf in _GIT_RULES_COMPILED:
+        match = _match_git(pattern, template, text)
+        if match:
+            candidate = Resolution(_format_git(template, match.groups()), conf, name)
+            if best is None or candidate.confidence > best.confidence:
+                best = candidate
+
+    # Allow a polite or padded phrasing around a full-match rule ("please show the status")
+    if best is None:
+        stripped = " ".join(w for w in text.split() if w.lower() not in FILLER)
+        for name, pattern, template, conf in _GIT_RULES_COMPILED:
+            match = _match_git(pattern, template, stripped)
+            if match:
+                best = Resolution(_format_git(template, match.groups()), conf * 0.95, name)
+                break
+
+    if best is None or best.rule in ("status",):
+        log = _resolve_git_log(text)
+        if log and (best is None or log.confidence > best.confidence):
+            best = log
+    return best
+
+
+# ---------------------------------------------------------------------------
+# find
+# ---------------------------------------------------------------------------
+
+_TYPE_ALIASES = {
+    "py": ["py"], "python": ["py"],
+    "js": ["js"], "javascript": ["js"], "node": ["js"],
+    "ts": ["ts"], "typescript": ["ts"], "tsx": ["tsx"], "jsx": ["jsx"],
+    "sh": ["sh"], "shell": ["sh"], "bash": ["sh"], "script": ["sh"], "scripts": ["sh"],
+    "md": ["md"], "markdown": ["md"],
+    "json": ["json"], "yaml": ["yaml", "yml"], "yml": ["yml"], "toml": ["toml"],
+    "txt": ["txt"], "text": ["txt"],
+    "log": ["log"], "logs": ["log"], "csv": ["csv"],
+    "go": ["go"], "golang": ["go"], "rust": ["rs"], "rs": ["rs"],
+    "java": ["java"], "c": ["c"], "cpp": ["cpp"], "c++": ["cpp"], "h": ["h"],
+    "html": ["html"], "css": ["css"], "sql": ["sql"], "xml": ["xml"],
+    "image": ["png", "jpg", "jpeg", "gif"], "images": ["png", "jpg", "jpeg", "gif"],
+    "png": ["png"], "jpg": ["jpg"], "jpeg": ["jpeg"], "gif": ["gif"], "svg": ["svg"],
+    "pdf": ["pdf"], "zip": ["zip"], "ogg": ["ogg"], "wav": ["wav"], "mp3": ["mp3"],
+    "audio": ["ogg", "wav", "mp3"], "sound": ["ogg", "wav", "mp3"], "sounds": ["ogg", "wav", "mp3"],
+}
+
+_SIZE_UNITS = {"b": "c", "byte": "c", "bytes": "c", "k": "k", "kb": "k", "kib": "k",
+               "m": "M", "mb": "M", "mib": "M", "meg": "M", "megs": "M", "g": "G", "gb": "G", "gib": "G"}
+
+_KIND_WORDS = {
+    "file": "f", "files": "f",
+    "directory": "d", "directories": "d", "dir": "d", "dirs": "d", "folder": "d", "folders": "d",
+    "symlink": "l", "symlinks": "l", "link": "l", "links": "l",
+}
+
+_FIND_FILLER = FILLER | {"find", "locate", "search", "look", "where", "files?", "named?", "or", "in", "here",
+                         "this", "directory", "folder", "tree", "repo", "repository", "project", "than", "have",
+                         "has", "were", "was", "be", "been", "modified", "changed"}
+
+
+def resolve_find(query: str) -> Optional[Resolution]:
+    """Resolve a !find request; returns None if nothing recognizable is asked for."""
+    text = " " + " ".join(query.strip().split()).rstrip("?.!") + " "
+    lowered = text.lower()
+    recognized = 0
+    count = False
+
+    def take(pattern: str) -> Optional[re.Match]:
+        nonlocal lowered, text, recognized
+        match = re.search(pattern, lowered)
+        if match:
+            recognized += len(match.group(0).split())
+            # Keep both copies aligned so quoted names retain their case
+            text = text[:match.start()] + " " * (match.end() - match.start()) + text[match.end():]
+            lowered = lowered[:match.start()] + " " * (match.end() - match.start()) + lowered[match.end():]
+        return match
+
+    if take(r"\b(?:count(?: of)?|how many|number of|total number of)\b"):
+        count = True
+
+    empty = take(r"\bempty\b")
+
+    # Name predicates
+    name_predicates = []
+    named = take(r"\b(?:named|called|name(?:d)? is) [\"']?([\w.*?-]+)[\"']?")
+    if named:
+        name_predicates.append(f"-name {_quote(named.group(1))}")
+    contains = take(r"\b(?:containing|contains|with) [\"']?([\w.-]+)[\"']? in (?:the |their |its )?name\b|\bname(?:s)? (?:containing|contains|with|like) [\"']?([\w.-]+)[\"']?")
+    if contains:
+        name_predicates.append(f"-name {_quote('*' + (contains.group(1) or contains.group(2)) + '*')}")
+    starts = take(r"\b(?:starting|beginning|that start|that begin|start|begin)s? with [\"']?([\w.-]+)[\"']?")
+    if starts:
+        name_predicates.append(f"-name {_quote(starts.group(1) + '*')}")
+    ends = take(r"\b(?:ending|that end|end)s? with [\"']?([\w.-]+)[\"']?")
+    if ends:
+        name_predicates.append(f"-name {_quote('*' + ends.group(1))}")
+
+    # Size predicates
+    size_predicates = []
+    for match in list(re.finditer(r"\b(larger|bigger|greater|more|over|above|smaller|less|under|below|at least|at most)(?: than)? (\d+(?:\.\d+)?) ?(bytes?|b|kib|kb|k|mib|mb|megs?|m|gib|gb|g)\b", lowered)):
+        take(re.escape(match.group(0)))
+        number = match.group(2)
+        unit = _SIZE_UNITS[match.group(3)]
+        if "." in number:
+            # find only takes whole units, so express fractions in the next smaller unit
+            smaller = {"G": "M", "M": "k", "k": "c", "c": "c"}[unit]
+            number = str(int(float(number) * (1024 if unit != "c" else 1)))
+            unit = smaller
+        sign = "-" if match.group(1) in ("smaller", "less", "under", "below", "at most") else "+"
+        size_predicates.append(f"-size {sign}{number}{unit}")
+    if not size_predicates:
+        if take(r"\b(?:large|big|huge)\b"):
+            size_predicates.append("-size +10M")
+        elif take(r"\b(?:small|tiny)\b"):
+            size_predicates.append("-size -10k")
+
+    # Time predicates
+    time_predicates = []
+    verb = r"(?:(?:modified|changed|edited|updated|touched|created)(?: in| within| during| since)?(?: the)? )?"
+    recent = take(r"\b" + verb + r"(today|yesterday|this week|last week|past week|this month|last month|past month|this year)\b")
+    if recent:
+        days = {"today": "-1", "yesterday": "-2", "this week": "-7", "last week": "-7", "past week": "-7",
+                "this month": "-30", "last month": "-30", "past month": "-30", "this year": "-365"}[recent.group(1)]
+        time_predicates.append(f"-mtime {days}")
+    else:
+        within = take(r"\b" + verb + r"(?:in the |within the |during the )?(?:last|past) (\d+) (day|week|month)s?\b")
+        if within:
+            days = int(within.group(1)) * {"day": 1, "week": 7, "month": 30}[within.group(2)]
+            time_predicates.append(f"-mtime -{days}")
+        else:
+            older = take(r"\b(?:not (?:modified|changed|touched) (?:in|for) (?:the )?(?:last )?|older than |more than )(\d+) (day|week|month)s?(?: old| ago)?\b")
+            if older:
+                days = int(older.group(1)) * {"day": 1, "week": 7, "month": 30}[older.group(2)]
+                time_predicates.append(f"-mtime +{days}")
+
+    location = take(r"\b(?:in|under|inside|within) (?:the )?(?:directory |folder |dir )?((?:\./)?[\w.-]+/[\w./-]*|(?:\./)?(?!the\b|last\b|past\b|\d+\b)[\w-]+/?)(?= )")
+    path_predicate = None
+    if location:
+        folder = location.group(1).strip("./") if location.group(1) not in (".", "./") else ""
+        if folder and not re.fullmatch(r"(?:this|here|current|[0-9]+)", folder):
+            path_predicate = f"-path {_quote('./' + folder + '/*')}"
+        elif not folder:
+            path_predicate = None
+
+    # Extensions and languages
+    extensions: List[str] = []
+    for match in list(re.finditer(r"(?<![\w*])\.([a-z0-9]{1,8})\b|\b([a-z+]+)\b", lowered)):
+        word = match.group(1) or match.group(2)
+        if match.group(1) or word in _TYPE_ALIASES:
+            for ext in _TYPE_ALIASES.get(word, [word]):
+                if ext not in extensions:
+                    extensions.append(ext)
+            take(r"(?<![\w*])" + re.escape(match.group(0)) + r"(?![\w])")
+
+    kind = None
+    for match in re.finditer(r"\b(files?|director(?:y|ies)|dirs?|folders?|symlinks?|links?)\b", lowered):
+        kind = kind or _KIND_WORDS[match.group(1)]
+        take(r"\b" + re.escape(match.group(1)) + r"\b")
+    if kind is None and (extensions or size_predicates or name_predicates):
+        kind = "f" if extensions or size_predicates else None
+
+    leftover = lowered.split()
+    # A number no predicate used ("files in 2023") is something the grammar missed, not filler
+    unknown = [w for w in leftover if w not in _FIND_FILLER]
+    if recognized == 0 or not (extensions or size_predicates or time_predicates or name_predicates or empty or kind):
+        return None
+
+    parts = ["find ."]
+    if path_predicate:
+        parts.append(path_predicate)
+    if kind:
+        parts.append(f"-type {kind}")
+    if len(extensions) == 1:
+        parts.append(f"-name {_quote('*.' + extensions[0])}")
+    elif extensions:
+        alternatives = " -o ".join(f"-name {_quote('*.' + ext)}" for ext in extensions)
+        parts.append(f"\\( {alternatives} \\)")
+    parts.extend(name_predicates)
+    parts.extend(size_predicates)
+    parts.extend(time_predicates)
+    if empty:
+        parts.append("-empty")
+
+    command = " ".join(parts)
+    if count:
+        command += " | wc -l"
+    confidence = recognized / (recognized + len(unknown))
+    return Resolution(command, confidence, "find")
+
+
+# ---------------------------------------------------------------------------
+# search
+# ---------------------------------------------------------------------------
+
+_SEARCH_FILLER = FILLER | {"search", "find", "grep", "look", "where", "is", "are", "does", "do", "in", "code",
+                           "file", "files", "line", "lines", "containing", "contains", "mention", "mentions",
+                           "mentioning", "occurrence", "occurrences", "usage", "usages", "use", "uses", "used",
+                           "call", "calls", "called", "reference", "references", "referenced", "text", "string",
+                           "word", "this", "repo", "repository", "project", "here", "or", "of", "who"}
+# Names a person would not type in prose: snake_case, camelCase, dotted.names, calls() and CONSTANTS
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)*(?:\(\))?")
+
+
+def _code_like(word: str) -> bool:
+    name = word[:-2] if word.endswith("()") else word
+    return ("_" in name or "." in name or word.endswith("()") or bool(re.search(r"[a-z][A-Z]", name))
+            or (len(name) > 1 and name.isupper()))
+
+
+def resolve_search(query: str) -> Optional[Resolution]:
+    """Resolve a !search request to a Python regex; returns None unless it names what to look for."""
+    text = " ".join(query.strip().split()).rstrip("?.!")
+    quoted = re.findall(r'"([^"]+)"|\'([^\']+)\'|`([^`]+)`', text)
+    if quoted:
+        literals = [next(group for group in groups if group) for groups in quoted]
+        pattern = "|".join(re.escape(literal) for literal in literals)
+        return Resolution(pattern, 1.0 if len(literals) == 1 else 0.9, "quoted")
+
+    lowered = text.lower()
+    if re.fullmatch(r"(?:all |the )?(?:todos?|fixmes?|todo comments|todos and fixmes)", lowered):
+        return Resolution(r"\b(?:TODO|FIXME|XXX|HACK)\b", 1.0, "todo")
+
+    words = text.split()
+    names = [word for word in words if _IDENTIFIER.fullmatch(word) and _code_like(word)]
+    if not names:
+        return None
+    leftover = [word.lower() for word in words if word not in names]
+    unknown = [word for word in leftover if word not in _SEARCH_FILLER]
+    escaped = [re.escape(name[:-2] if name.endswith("()") else name) for name in names]
+    if re.search(r"\b(?:defin(?:ed|ition|es?)|declar(?:ed|ation|es?))\b", lowered) and len(names) == 1:
+        unknown = [word for word in unknown if not re.fullmatch(r"defin\w*|declar\w*", word)]
+        pattern = rf"\b(?:def|class|function|func|fn|const|let|var|type|interface)\s+{escaped[0]}\b"
+        rule = "definition"
+    elif re.search(r"\bimport(?:s|ed)?\b", lowered) and len(names) == 1:
+        unknown = [word for word in unknown if not re.fullmatch(r"imports?|imported", word)]
+        pattern = rf"\b(?:import|from|require)\b.*\b{escaped[0]}\b"
+        rule = "import"
+    else:
+        body = escaped[0] if len(escaped) == 1 else "(?:" + "|".join(escaped) + ")"
+        # A trailing () asks for calls
+        pattern = rf"\b{body}\(" if names[0].endswith("()") and len(names) == 1 else rf"\b{body}\b"
+        rule = "identifier"
+    return Resolution(pattern, len(names) / (len(names) + len(unknown)), rule)
+
+
+# ---------------------------------------------------------------------------
+# statistics
+# ---------------------------------------------------------------------------
+
+class ResolverStats:
+    def __init__(self):
+        """Counts local hits per command type and time spent resolving."""
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.local: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def record(self, kind: str, local: bool, seconds: float):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.local[kind] = self.local.get(kind, 0) + (1 if local else 0)
+            self.seconds[kind] = self.seconds.get(kind, 0.0) + seconds
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                kind: {
+                    "requests": total,
+                    "local": self.local[kind],
+                    "hit_rate": self.local[kind] / total,
+                    "avg_ms": self.seconds[kind] / total * 1000,
+                }
+                for kind, total in self.requests.items()
+            }
+
+
+_stats = ResolverStats()
+
+
+def confidence_threshold() -> float:
+    return float(os.getenv("CAPYBARA_LOCAL_CONFIDENCE", DEFAULT_CONFIDENCE))
+
+
+def try_local(kind: str, resolve: Callable[[], Optional[Resolution]]) -> Optional[str]:
+    """Run a resolver, record the outcome, and return the command if it is confident enough."""
+    started = time.perf_counter()
+    resolution = resolve()
+    hit = resolution is not None and resolution.confidence >= confidence_threshold()
+    _stats.record(kind, hit, time.perf_counter() - started)
+    return resolution.command if hit else None
+
+
+def resolver_stats() -> Dict[str, dict]:
+    """Return local hit rate and average resolve time per command type."""
+    return _stats.snapshot()
+
+
+def format_resolver_stats(stats: Dict[str, dict]) -> str:
+    """Format resolver statistics for display."""
+    if not stats:
+        return "[dim]Local resolver: no !git / !find / !search requests yet[/dim]"
+    lines = ["[bold]Local resolver:[/bold]"]
+    for kind, entry in sorted(stats.items()):
+        lines.append(
+            f"  !{kind}: {entry['hit_rate'] * 100:.0f}% local "
+            f"[dim]({entry['local']}/{entry['requests']}, {entry['avg_ms']:.2f} ms avg)[/dim]"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,217 @@
+"""
+Background jobs for long-running shell commands
+Each job runs under a supervisor thread that keeps the end of its output in a bounded buffer
+"""
+import atexit
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from rich.markup import escape
+
+from .shell_exec import CHUNK_SIZE, TailBuffer, format_size
+
+JOB_BUFFER_BYTES = 256 * 1024
+MAX_FINISHED_JOBS = 20
+
+
+class Job:
+    def __init__(self, job_id: int, command: str, proc: subprocess.Popen, buffer_bytes: int):
+        self.id = job_id
+        self.command = command
+        self.proc = proc
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.returncode: Optional[int] = None
+        self.output = TailBuffer(buffer_bytes)
+        self.output_bytes = 0
+        self.killed = False
+        self.done = threading.Event()
+        # Set while the job is in the foreground; receives each chunk as it arrives
+        self.follower: Optional[Callable[[bytes], None]] = None
+
+    @property
+    def running(self) -> bool:
+        return self.returncode is None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def dropped_bytes(self) -> int:
+        return self.output_bytes - self.output.size
+
+    def status(self) -> str:
+        if self.running:
+            return "running"
+        if self.killed:
+            return "killed"
+        return "done" if self.returncode == 0 else f"exit {self.returncode}"
+
+
+class JobTable:
+    def __init__(self, notify: Optional[Callable[[Job], None]] = None, buffer_bytes: int = JOB_BUFFER_BYTES,
+                 max_finished: int = MAX_FINISHED_JOBS):
+        """
+        Initialize the job table.
+
+        Args:
+            notify: Called from the supervisor thread when a job finishes
+            buffer_bytes: Output kept per job; older output is dropped first
+            max_finished: Finished jobs kept for !jobs and !fg before the oldest are forgotten
+        """
+        self.notify = notify
+        self.buffer_bytes = buffer_bytes
+        self.max_finished = max_finished
+        self._jobs: Dict[int, Job] = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def start(self, command: str, cwd: Optional[str] = None) -> Job:
+        """Start command in the background and return its job."""
+        proc = subprocess.Popen(
+            command, shell=True, cwd=cwd,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0,
+            # Own process group: Ctrl-C at the prompt must not reach it, and !kill reaches all of it
+            start_new_session=True,
+        )
+        with self._lock:
+            job = Job(self._next_id, command, proc, self.buffer_bytes)
+            self._jobs[job.id] = job
+            self._next_id += 1
+            self._prune()
+        threading.Thread(target=self._supervise, args=(job,), daemon=True, name=f"capybara-job-{job.id}").start()
+        return job
+
+    def _supervise(self, job: Job):
+        fd = job.proc.stdout.fileno()
+        while True:
+            data = os.read(fd, CHUNK_SIZE)
+            if not data:
+                break
+            with self._lock:
+                job.output.append(data)
+                job.output_bytes += len(data)
+                follower = job.follower
+            if follower is not None:
+                follower(data)
+        job.proc.stdout.close()
+        job.returncode = job.proc.wait()
+        job.finished = time.monotonic()
+        job.done.set()
+        if self.notify is not None and job.follower is None and not job.killed:
+            try:
+                self.notify(job)
+            except Exception:
+                pass
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if not j.running]
+        for job in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job.id]
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def signal(self, job: Job, sig: int = signal.SIGTERM) -> bool:
+        """Send sig to the job's whole process group. Returns False if it had already finished."""
+        if not job.running:
+            return False
+        try:
+            if os.name == "posix":
+                os.killpg(job.proc.pid, sig)
+            else:
+                job.proc.terminate()
+        except ProcessLookupError:
+            return False
+        return True
+
+    def kill(self, job_id: int) -> Optional[Job]:
+        """Terminate a job, escalating to SIGKILL if it does not stop within a second."""
+        job = self.get(job_id)
+        if job is None or not job.running:
+            return job
+        # Flag first, so the supervisor does not announce a job the user just stopped
+        job.killed = True
+        if not self.signal(job):
+            job.killed = False
+            return job
+        if not job.done.wait(1) and os.name == "posix":
+            self.signal(job, signal.SIGKILL)
+        return job
+
+    def foreground(self, job_id: int, write: Callable[[bytes], None]) -> Optional[Job]:
+        """
+        Bring a job to the foreground: replay its buffered output, then follow it until it exits.
+
+        Ctrl-C interrupts the job, like a foreground command. The finished job
+        leaves the table once its output has been shown.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self._lock:
+            backlog = job.output.data()
+            job.follower = write
+        try:
+            if backlog:
+                write(backlog)
+            while not job.done.is_set():
+                try:
+                    job.done.wait(0.1)
+                except KeyboardInterrupt:
+                    self.signal(job, signal.SIGINT)
+        finally:
+            job.follower = None
+        with self._lock:
+            self._jobs.pop(job.id, None)
+        return job
+
+    def kill_all(self):
+        for job in self.jobs():
+            if job.running:
+                self.signal(job)
+
+
+def format_job(job: Job) -> str:
+    return f"[{job.id}] {job.status()} ({job.elapsed:.1f}s): {escape(job.command)}"
+
+
+def format_jobs(jobs: List[Job]) -> str:
+    """Format the job table for display."""
+    if not jobs:
+        return "[dim]No background jobs. End a command with & to run it in the background.[/dim]"
+    lines = []
+    for job in jobs:
+        color = "yellow" if job.running else ("green" if job.returncode == 0 else "red")
+        dropped = f", {format_size(job.dropped_bytes)} dropped" if job.dropped_bytes else ""
+        lines.append(f"[{color}]{job.id:>3}  {job.status():<9}[/{color}] {job.elapsed:>7.1f}s "
+                     f"[dim]{format_size(job.output_bytes):>8}{dropped}[/dim]  {escape(job.command)}")
+    return "\n".join(lines)
+
+
+# Global instance
+_global_jobs: Optional[JobTable] = None
+
+
+def get_job_table(notify: Optional[Callable[[Job], None]] = None) -> JobTable:
+    """Return the shared job table; notify is only used when it is first created."""
+    global _global_jobs
+
+    if _global_jobs is None:
+        _global_jobs = JobTable(
+            notify,
+            buffer_bytes=int(float(os.getenv("CAPYBARA_JOB_BUFFER_KB", JOB_BUFFER_BYTES // 1024)) * 1024),
+        )
+        # Like a shell hanging up: jobs do not outlive the session
+        atexit.register(_global_jobs.kill_all)
+    return _global_jobs
@@ -11,23 +11,53 @@ from pathlib import Path
 from typing import Optional, Dict
 import time
 
-try:
-    from pynput import keyboard
-    PYNPUT_AVAILABLE = True
-except ImportError:
-    PYNPUT_AVAILABLE = False
+from .instrumentation import get_metrics, timed
 
-# Use pygame-ce for audio (supports OGG, WAV, MP3)
-try:
-    import pygame
-    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
-    pygame.mixer.set_num_channels(32)
-    PYGAME_AVAILABLE = True
-except ImportError:
-    PYGAME_AVAILABLE = False
-except Exception as e:
-    print(f"Warning: pygame mixer init failed: {e}")
-    PYGAME_AVAILABLE = False
+# pynput and pygame-ce are imported on first use: importing pygame and opening the
+# audio device costs more than the rest of startup, and most sessions never play a sound
+keyboard = None
+pygame = None
+_audio_ready: Optional[bool] = None
+_audio_lock = threading.Lock()
+
+
+def _init_audio() -> bool:
+    """Import pygame-ce and open the mixer, once. Returns whether audio is available."""
+    global pygame, _audio_ready
+
+    with _audio_lock:
+        if _audio_ready is None:
+            # Use pygame-ce for audio (supports OGG, WAV, MP3)
+            try:
+                import pygame as _pygame
+                _pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+                _pygame.mixer.set_num_channels(32)
+                pygame = _pygame
+                _audio_ready = True
+            except ImportError:
+                _audio_ready = False
+            except Exception as e:
+                print(f"Warning: pygame mixer init failed: {e}")
+                _audio_ready = False
+        return _audio_ready
+
+
+def _init_listener() -> bool:
+    """Import pynput on first use. Returns whether keyboard listening is available."""
+    global keyboard
+
+    if keyboard is None:
+        try:
+            from pynput import keyboard as _keyboard
+        except ImportError:
+            return False
+        keyboard = _keyboard
+    return True
+
+
+def warm_up():
+    """Open the audio device in the background, so the first !sounds does not wait for it."""
+    threading.Thread(target=_init_audio, daemon=True, name="capybara-audio-warmup").start()
 
 
 class KeyboardSoundPlayer:
@@ -56,7 +86,7 @@ class KeyboardSoundPlayer:
     
     def _load_sounds(self):
         """Load sound files from the soundpack directory."""
-        if not PYGAME_AVAILABLE:
+        if not _init_audio():
             print("⚠️  pygame-ce not available. Install with: pip install pygame-ce")
             return
         
@@ -105,8 +135,8 @@ class KeyboardSoundPlayer:
         """Worker thread that plays sounds from the queue."""
         while self.is_active:
             try:
-                sound_info = self.sound_queue.get(timeout=0.5)
-                if sound_info and PYGAME_AVAILABLE:
+                sound_info, pressed_at = self.sound_queue.get(timeout=0.5)
+                if sound_info and pygame is not None:
                     keycode = sound_info if isinstance(sound_info, int) else None
                     
                     # Try keycode-specific sound first
@@ -119,9 +149,12 @@ class KeyboardSoundPlayer:
                     
                     # Play with pygame
                     try:
-                        sound.play()
+                        with timed("sound play"):
+                            sound.play()
                     except Exception:
                         pass
+                    # Keypress to sound, including time spent waiting in the queue
+                    get_metrics().record("sound latency", time.perf_counter() - pressed_at)
             except queue.Empty:
                 continue
             except Exception:
@@ -145,7 +178,7 @@ class KeyboardSoundPlayer:
             if key_id not in self.pressed_keys:
                 self.pressed_keys.add(key_id)
                 try:
-                    self.sound_queue.put_nowait(keycode if keycode else True)
+                    self.sound_queue.put_nowait((keycode if keycode else True, time.perf_counter()))
                 except queue.Full:
                     pass
         except Exception:
@@ -167,11 +200,11 @@ class KeyboardSoundPlayer:
     
     def start(self):
         """Start listening for keyboard events."""
-        if not PYNPUT_AVAILABLE:
+        if not _init_listener():
             print("⚠️  pynput not available. Install with: pip install pynput")
             return False
         
-        if not PYGAME_AVAILABLE:
+        if not _init_audio():
             print("⚠️  pygame-ce not available. Install with: pip install pygame-ce")
             return False
         
@@ -0,0 +1,286 @@
+"""
+Latency-aware model fallback
+Per-attempt deadlines, hedged requests and a per-model circuit breaker
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from .cancellation import Cancelled
+
+DEFAULT_ATTEMPT_TIMEOUT = 20.0
+DEFAULT_HEDGE_DELAY = 3.0
+MIN_HEDGE_DELAY = 0.25
+DEFAULT_BREAKER_FAILURES = 3
+DEFAULT_BREAKER_COOLDOWN = 30.0
+# How often call() looks again at attempts still queued for a worker thread
+QUEUE_POLL = 0.05
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 50, min_samples: int = 5):
+        """Rolling window of successful call latencies for one model."""
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def p95(self) -> Optional[float]:
+        """Return the 95th percentile, or None until enough samples are collected."""
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = DEFAULT_BREAKER_FAILURES, cooldown: float = DEFAULT_BREAKER_COOLDOWN):
+        """Opens after failure_threshold consecutive failures and retries one call after cooldown."""
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                # Let a single trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class _Attempt:
+    def __init__(self, model: str):
+        """One call to one model; its clock starts when a worker thread picks it up, not when it is queued."""
+        self.model = model
+        self.started: Optional[float] = None
+        self.settled = False
+        self._lock = threading.Lock()
+
+    def settle(self) -> bool:
+        """Return True only the first time, so an attempt's outcome is recorded once."""
+        with self._lock:
+            if self.settled:
+                return False
+            self.settled = True
+            return True
+
+
+class ModelRouter:
+    def __init__(self, attempt_timeout: float = DEFAULT_ATTEMPT_TIMEOUT, hedge_delay: float = DEFAULT_HEDGE_DELAY,
+                 failure_threshold: int = DEFAULT_BREAKER_FAILURES, cooldown: float = DEFAULT_BREAKER_COOLDOWN,
+                 max_workers: int = 8):
+        """
+        Initialize the router.
+
+        Args:
+            attempt_timeout: Deadline in seconds for a single model attempt
+            hedge_delay: Hedge threshold used until a model has enough latency samples
+            failure_threshold: Consecutive failures before a model's breaker opens
+            cooldown: Seconds an open breaker skips its model
+            max_workers: Threads available for concurrent attempts
+        """
+        self.attempt_timeout = attempt_timeout
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-router")
+
+    def _tracker(self, model: str) -> LatencyTracker:
+        with self._lock:
+            if model not in self.latency:
+                self.latency[model] = LatencyTracker()
+            return self.latency[model]
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self.breakers:
+                self.breakers[model] = CircuitBreaker(self.failure_threshold, self.cooldown)
+            return self.breakers[model]
+
+    def hedge_threshold(self, model: str) -> float:
+        """How long to wait on model before hedging to the next one."""
+        p95 = self._tracker(model).p95()
+        if p95 is None:
+            return self.hedge_delay
+        return min(self.attempt_timeout, max(MIN_HEDGE_DELAY, p95))
+
+    def _attempt(self, attempt: _Attempt, call_fn: Callable[[str, float], str]) -> str:
+        attempt.started = time.monotonic()
+        try:
+            result = call_fn(attempt.model, self.attempt_timeout)
+        except Cancelled:
+            # The user gave up on the request; that says nothing about the model
+            raise
+        except Exception:
+            # An attempt abandoned at its deadline was already counted as a failure
+            if attempt.settle():
+                self._breaker(attempt.model).record_failure()
+            raise
+        self._tracker(attempt.model).record(time.monotonic() - attempt.started)
+        if attempt.settle():
+            self._breaker(attempt.model).record_success()
+        return result
+
+    def call(self, models: List[str], call_fn: Callable[[str, float], str], hedge: bool = True,
+             enforce_deadline: bool = True) -> str:
+        """
+        Run call_fn(model, timeout) against models in order until one succeeds.
+
+        Models with an open breaker are skipped. With hedge=True, the next model
+        is started when the current one runs past its p95 latency, and whichever
+        answers first wins. Streaming callers pass hedge=False so two responses
+        never write to the same output, and enforce_deadline=False so a long but
+        healthy stream is not abandoned; call_fn still receives the timeout.
+        """
+        candidates = [m for m in models if self._breaker(m).allow()]
+        if not candidates:
+            # Every breaker is open; trying anyway beats failing without a request
+            candidates = list(models)
+
+        pending: Dict[object, _Attempt] = {}
+        last_error: Optional[BaseException] = None
+        queue = deque(candidates)
+
+        def launch() -> _Attempt:
+            attempt = _Attempt(queue.popleft())
+            pending[self._executor.submit(self._attempt, attempt, call_fn)] = attempt
+            return attempt
+
+        def expired(attempt: _Attempt, now: float) -> bool:
+            return enforce_deadline and attempt.started is not None and now >= attempt.started + self.attempt_timeout
+
+        def hedge_due(now: float) -> bool:
+            return current.started is not None and now >= current.started + self.hedge_threshold(current.model)
+
+        current = launch()
+        try:
+            while pending:
+                now = time.monotonic()
+                wait_for = float("inf")
+                for attempt in pending.values():
+                    if attempt.started is None:
+                        # Waiting behind other calls' attempts; its deadline starts once it runs
+                        wait_for = min(wait_for, QUEUE_POLL)
+                    elif enforce_deadline:
+                        wait_for = min(wait_for, attempt.started + self.attempt_timeout - now)
+                if hedge and queue and current.started is not None:
+                    wait_for = min(wait_for, current.started + self.hedge_threshold(current.model) - now)
+                timeout = max(0.0, wait_for) if wait_for != float("inf") else None
+                done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                failed = False
+                for future in done:
+                    pending.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        return future.result()
+                    if isinstance(error, Cancelled):
+                        raise error
+                    last_error = error
+                    failed = True
+
+                now = time.monotonic()
+                for future, attempt in list(pending.items()):
+                    if expired(attempt, now):
+                        pending.pop(future)
+                        if attempt.settle():
+                            self._breaker(attempt.model).record_failure()
+                        last_error = TimeoutError(f"{attempt.model} did not answer within {self.attempt_timeout:.0f}s")
+                        failed = True
+
+                if not queue:
+                    continue
+                if failed or not pending:
+                    current = launch()
+                elif hedge and hedge_due(now):
+                    self.hedges += 1
+                    current = launch()
+        finally:
+            # Hedges still queued behind other calls are no longer needed
+            for future in pending:
+                future.cancel()
+
+        raise RuntimeError(f"All OpenAI models failed. Last error: {last_error}")
+
+    def status(self) -> List[dict]:
+        """Return breaker state and latency per model seen so far."""
+        with self._lock:
+            models = list(self.breakers)
+        return [
+            {
+                "model": model,
+                "state": self._breaker(model).state,
+                "failures": self._breaker(model).failures,
+                "p95": self._tracker(model).p95(),
+            }
+            for model in models
+        ]
+
+
+def format_router_status(status: List[dict], hedges: int) -> str:
+    """Format router state for display."""
+    if not status:
+        return "[dim]No model calls yet[/dim]"
+
+    colors = {CircuitBreaker.CLOSED: "green", CircuitBreaker.HALF_OPEN: "yellow", CircuitBreaker.OPEN: "red"}
+    lines = []
+    for entry in status:
+        p95 = f"{entry['p95'] * 1000:.0f} ms" if entry["p95"] is not None else "-"
+        color = colors[entry["state"]]
+        lines.append(f"[bold]{entry['model']}[/bold]  [{color}]{entry['state']}[/{color}]  [dim]p95 {p95}[/dim]")
+    lines.append(f"[dim]Hedged requests: {hedges}[/dim]")
+    return "\n".join(lines)
+
+
+# Global instance
+_global_router: Optional[ModelRouter] = None
+_global_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """Return the shared router, configured from CAPYBARA_* environment variables."""
+    global _global_router
+
+    with _global_lock:
+        if _global_router is None:
+            _global_router = ModelRouter(
+                attempt_timeout=float(os.getenv("CAPYBARA_ATTEMPT_TIMEOUT", DEFAULT_ATTEMPT_TIMEOUT)),
+                hedge_delay=float(os.getenv("CAPYBARA_HEDGE_DELAY", DEFAULT_HEDGE_DELAY)),
+                failure_threshold=int(os.getenv("CAPYBARA_BREAKER_FAILURES", DEFAULT_BREAKER_FAILURES)),
+                cooldown=float(os.getenv("CAPYBARA_BREAKER_COOLDOWN", DEFAULT_BREAKER_COOLDOWN)),
+            )
+        return _global_router
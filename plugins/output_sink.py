@@ -0,0 +1,289 @@
+"""
+Size-aware display of shell command output
+Small output is styled with Rich, larger output is written to the terminal in bulk, and
+output past the pager threshold is also spilled to disk and opens in a lazily rendered pager
+once the command ends
+"""
+import asyncio
+import codecs
+import locale
+import os
+import tempfile
+import threading
+from typing import BinaryIO, List, Optional
+
+from rich.text import Text
+
+RICH_LIMIT = 64 * 1024
+PAGER_LIMIT = 8 * 1024 * 1024
+SPILL_LIMIT = 1024 * 1024 * 1024
+
+
+def _loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class OutputSink:
+    def __init__(self, console, raw: Optional[BinaryIO] = None, rich_limit: int = RICH_LIMIT,
+                 pager_limit: int = PAGER_LIMIT, spill_limit: int = SPILL_LIMIT, page: bool = True,
+                 encoding: Optional[str] = None):
+        """
+        Initialize the sink for one command.
+
+        Args:
+            console: Rich console for styled output; its file receives text in bulk mode
+            raw: Binary stream behind the console file (e.g. sys.stdout.buffer) for undecoded bulk writes
+            rich_limit: Output up to this many bytes is printed through Rich
+            pager_limit: Past this many bytes the output also opens in the pager when the command ends
+            spill_limit: Most bytes kept in the spill file; the rest is still shown, but not kept for the pager
+            page: Whether to spill and page at all (False when nobody is looking at a terminal)
+        """
+        self.console = console
+        self.raw = raw
+        self.rich_limit = rich_limit
+        self.pager_limit = pager_limit
+        self.spill_limit = spill_limit
+        self.page = page
+        self.mode = "rich"
+        self.total = 0
+        self.dropped = 0
+        self.paged = False
+        self.spill_path: Optional[str] = None
+        self.needs_newline = False
+        encoding = encoding or locale.getpreferredencoding(False) or "utf-8"
+        self._decoders = {
+            False: codecs.getincrementaldecoder(encoding)(errors="replace"),
+            True: codecs.getincrementaldecoder(encoding)(errors="replace"),
+        }
+        self._head = bytearray()
+        self._spill = None
+        self._spilled = 0
+        self._lock = threading.Lock()
+
+    def stdout(self, data: bytes):
+        self._write(data, False)
+
+    def stderr(self, data: bytes):
+        self._write(data, True)
+
+    def _write(self, data: bytes, is_err: bool):
+        with self._lock:
+            self.total += len(data)
+            if self.mode == "rich" and self.total > self.rich_limit:
+                self._enter_bulk()
+
+            if self.mode == "rich":
+                if self.page:
+                    self._head += data
+                self._print_rich(self._decoders[is_err].decode(data), is_err)
+                return
+
+            dropped = self.dropped
+            if self._spill is not None:
+                self._spill_write(data)
+            if self.mode == "bulk" and self._spill is not None and self.total > self.pager_limit:
+                # The screen keeps going, so endless output (yes, tail -f) stays visible
+                self.mode = "paged"
+                self.paged = True
+            self._write_bulk(data, is_err)
+            if self.dropped and not dropped:
+                self._notice(f"… output past {self.spill_limit / 1024 / 1024:.0f} MB is shown but not kept for the pager")
+
+    def _enter_bulk(self):
+        """Switch from Rich to bulk writes, keeping what was printed so far for the pager."""
+        self.mode = "bulk"
+        if self.page:
+            fd, self.spill_path = tempfile.mkstemp(prefix="capybara-output-", suffix=".log")
+            self._spill = os.fdopen(fd, "wb")
+            self._spill_write(bytes(self._head))
+        self._head = bytearray()
+
+    def _spill_write(self, data: bytes):
+        room = self.spill_limit - self._spilled
+        if room <= 0:
+            self.dropped += len(data)
+            return
+        self._spill.write(data[:room])
+        self._spilled += min(room, len(data))
+        self.dropped += max(0, len(data) - room)
+
+    def _print_rich(self, text: str, is_err: bool):
+        if not text:
+            return
+        # markup=False: brackets in command output are text, not Rich tags
+        self.console.print(Text(text, style="red") if is_err else text, markup=False, end="", soft_wrap=True)
+        self.needs_newline = not text.endswith("\n")
+
+    def _notice(self, message: str):
+        if self.needs_newline:
+            self._write_text("\n")
+        self.console.print(Text(message, style="dim"))
+        self.needs_newline = False
+
+    def _write_text(self, text: str):
+        self.console.file.write(text)
+        self.console.file.flush()
+
+    def _write_bulk(self, data: bytes, is_err: bool):
+        if self.raw is not None:
+            # Hand over undecoded bytes; anything still inside the decoder goes first
+            pending, _ = self._decoders[is_err].getstate()
+            self._decoders[is_err].reset()
+            self.console.file.flush()
+            self.raw.write(pending + data)
+            self.raw.flush()
+            tail = data or pending
+            self.needs_newline = bool(tail) and not tail.endswith(b"\n")
+        else:
+            text = self._decoders[is_err].decode(data)
+            if text:
+                self._write_text(text)
+                self.needs_newline = not text.endswith("\n")
+
+    def flush(self):
+        """Finish the command: flush decoders and close the spill file."""
+        with self._lock:
+            for is_err, decoder in self._decoders.items():
+                text = decoder.decode(b"", final=True)
+                if text:
+                    if self.mode == "rich":
+                        self._print_rich(text, is_err)
+                    else:
+                        self._write_text(text)
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def discard(self):
+        """Delete the spill file, if any."""
+        if self.spill_path:
+            try:
+                os.unlink(self.spill_path)
+            except OSError:
+                pass
+            self.spill_path = None
+
+
+class Pager:
+    BLOCK = 64 * 1024
+
+    def __init__(self, path: str, title: str = "", dropped: int = 0):
+        """
+        Scroll through a file without loading it.
+
+        The view is a byte offset into the file; moving reads only the blocks
+        around it, so a 1 GB spill file pages as quickly as a small one.
+        """
+        self.path = path
+        self.title = title
+        self.dropped = dropped
+        self.size = os.path.getsize(path)
+        self.top = 0
+        self._file = open(path, "rb")
+
+    def close(self):
+        self._file.close()
+
+    def _read(self, start: int, length: int) -> bytes:
+        self._file.seek(start)
+        return self._file.read(length)
+
+    def lines_from(self, offset: int, count: int) -> List[str]:
+        data = self._read(offset, max(self.BLOCK, count * 1024))
+        return [line.decode("utf-8", errors="replace") for line in data.split(b"\n")[:count]]
+
+    def next_line(self, offset: int) -> int:
+        """Offset of the line after the one starting at offset, or offset if it is the last."""
+        position = offset
+        while position < self.size:
+            data = self._read(position, self.BLOCK)
+            index = data.find(b"\n")
+            if index >= 0:
+                start = position + index + 1
+                return start if start < self.size else offset
+            position += len(data)
+        return offset
+
+    def previous_line(self, offset: int) -> int:
+        """Offset of the line before the one starting at offset."""
+        end = offset - 1
+        while end > 0:
+            start = max(0, end - self.BLOCK)
+            index = self._read(start, end - start).rfind(b"\n")
+            if index >= 0:
+                return start + index + 1
+            end = start
+        return 0
+
+    def forward(self, offset: int, count: int, height: int) -> int:
+        last = self.last_page(height)
+        for _ in range(count):
+            if offset >= last:
+                return last
+            offset = self.next_line(offset)
+        return offset
+
+    def backward(self, offset: int, count: int) -> int:
+        for _ in range(count):
+            if offset == 0:
+                break
+            offset = self.previous_line(offset)
+        return offset
+
+    def last_page(self, height: int) -> int:
+        return self.backward(self.size, height)
+
+    def run(self):
+        """Show the pager full screen until q is pressed."""
+        from prompt_toolkit.application import Application
+        from prompt_toolkit.key_binding import KeyBindings
+        from prompt_toolkit.layout import HSplit, Layout, Window
+        from prompt_toolkit.layout.controls import FormattedTextControl
+
+        bindings = KeyBindings()
+
+        def height() -> int:
+            return max(1, app.output.get_size().rows - 1)
+
+        def move(to):
+            self.top = to
+
+        @bindings.add("q")
+        @bindings.add("escape")
+        @bindings.add("c-c")
+        def _(event):
+            event.app.exit()
+
+        bindings.add("down")(lambda e: move(self.forward(self.top, 1, height())))
+        bindings.add("j")(lambda e: move(self.forward(self.top, 1, height())))
+        bindings.add("enter")(lambda e: move(self.forward(self.top, 1, height())))
+        bindings.add("up")(lambda e: move(self.backward(self.top, 1)))
+        bindings.add("k")(lambda e: move(self.backward(self.top, 1)))
+        bindings.add("space")(lambda e: move(self.forward(self.top, height(), height())))
+        bindings.add("pagedown")(lambda e: move(self.forward(self.top, height(), height())))
+        bindings.add("f")(lambda e: move(self.forward(self.top, height(), height())))
+        bindings.add("b")(lambda e: move(self.backward(self.top, height())))
+        bindings.add("pageup")(lambda e: move(self.backward(self.top, height())))
+        bindings.add("g")(lambda e: move(0))
+        bindings.add("home")(lambda e: move(0))
+        bindings.add("G")(lambda e: move(self.last_page(height())))
+        bindings.add("end")(lambda e: move(self.last_page(height())))
+
+        def status():
+            percent = 100 * self.top // self.size if self.size else 100
+            note = f", {self.dropped / 1024 / 1024:.0f} MB not kept" if self.dropped else ""
+            return [("reverse", f" {self.title} {percent}% of {self.size / 1024 / 1024:.1f} MB{note}"
+                                "  q quit, space/b page, j/k line, g/G top/bottom ")]
+
+        body = Window(FormattedTextControl(lambda: "\n".join(self.lines_from(self.top, height()))), wrap_lines=False)
+        footer = Window(FormattedTextControl(status), height=1)
+        app = Application(layout=Layout(HSplit([body, footer])), key_bindings=bindings, full_screen=True)
+        try:
+            # The REPL's event loop is already running on this thread, and one thread runs one loop
+            app.run(in_thread=_loop_running())
+        finally:
+            self.close()
@@ -1,130 +1,335 @@
 import os
 import pathlib
-from typing import List
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
 from .ai_utils import generate_content
+from .cancellation import cancel_scope
+from .context_packer import ContextPacker, count_tokens
+from .readme_manifest import MANIFEST_VERSION, ReadmeManifest, content_hash
+from .repo_summarizer import DEFAULT_WORKERS, RepoSummarizer, create_summarizer
+from .repo_walker import RepoScan, format_tree, walk_repo
+from .source_ranker import SourceIndex
 
+DEFAULT_TOKEN_BUDGET = 6000
+HEAD_CHARS = 16 * 1024
 
-def get_directory_structure(path: str, max_depth: int = 3, current_depth: int = 0) -> str:
+MANIFEST_FILES = ['package.json', 'requirements.txt', 'pyproject.toml', 'setup.py', 'setup.cfg',
+                  'Cargo.toml', 'go.mod', 'pom.xml']
+DOC_FILES = ['README.md', 'LICENSE']
+KEY_FILES = ['package.json', 'requirements.txt', 'setup.py', 'Cargo.toml', 'go.mod', 'pom.xml',
+             'README.md', 'LICENSE']
+SOURCE_EXTENSIONS = ['.py', '.js', '.ts', '.go', '.rs', '.java', '.cpp']
+ENTRY_POINTS = ['main.py', 'cli.py', 'app.py', '__main__.py', 'manage.py', 'index.js', 'main.js',
+                'src/index.ts', 'src/index.js', 'main.go', 'cmd/main.go', 'src/main.rs', 'src/lib.rs']
+# Entry points found by the source index (bin scripts, console_scripts, __main__ checks) added to the above
+MAX_DETECTED_ENTRY_POINTS = 4
+SOURCE_HEADS = 20
+SOURCE_HEAD_CHARS = 4096
+# Characters of source heads read for the prompts in total
+SOURCE_HEADS_BUDGET = 48 * 1024
+# Lines of each source head a prompt shows
+SOURCE_HEAD_LINES = 40
+# Share of a section's token budget the source heads may take before summaries replace them
+DIRECT_SOURCES_SHARE = 0.5
+
+# README sections in document order: (title, what to write, context groups it is written from).
+# Sections only regenerate when one of their groups changes.
+README_SECTIONS = [
+    ("Overview", "the project title and a brief description",
+     ["manifests", "entry points", "docs", "summaries", "source heads"]),
+    ("Features", "the features, as bullet points", ["entry points", "docs", "summaries", "source files", "source heads"]),
+    ("Installation", "installation instructions", ["manifests", "docs"]),
+    ("Usage", "usage examples", ["entry points", "docs", "manifests", "summaries"]),
+    ("Project Structure", "an overview of the project structure", ["tree", "summaries", "source files"]),
+    ("Dependencies", "the dependencies", ["manifests"]),
+    ("Contributing", "how to contribute, if the repository says anything about it", ["docs", "manifests"]),
+    ("License", "the license, based on the LICENSE file if present", ["license"]),
+]
+CONTEXT_GROUPS = ["manifests", "entry points", "tree", "docs", "license", "summaries", "source files", "source heads"]
+SECTION_MAX_TOKENS = 600
+# Share of the token budget one section's prompt may use; most sections need far less
+SECTION_BUDGET_SHARE = 0.5
+
+# Packing report and manifest reuse of the most recent generate_readme call
+_last_context_report: List[dict] = []
+_last_reuse_report: Optional[dict] = None
+
+
+def get_directory_structure(path: str, max_depth: int = 3, scan: Optional[RepoScan] = None) -> str:
     """Generate a tree-like directory structure"""
-    if current_depth >= max_depth:
-        return ""
-    
-    lines = []
-    try:
-        items = sorted(os.listdir(path))
-        for item in items:
-            if item.startswith('.') or item in ['node_modules', '__pycache__', 'venv', '.git']:
-                continue
-            
-            item_path = os.path.join(path, item)
-            indent = "  " * current_depth
-            
-            if os.path.isdir(item_path):
-                lines.append(f"{indent}{item}/")
-                lines.append(get_directory_structure(item_path, max_depth, current_depth + 1))
-            else:
-                lines.append(f"{indent}{item}")
-    except PermissionError:
-        pass
-    
-    return '\n'.join(filter(None, lines))
+    return format_tree(scan or walk_repo(path), max_depth)
 
 
-def read_key_files(path: str) -> dict:
+def read_key_files(path: str, scan: Optional[RepoScan] = None) -> dict:
     """Read important files for context"""
-    key_files = {
-        'package.json': None,
-        'requirements.txt': None,
-        'setup.py': None,
-        'Cargo.toml': None,
-        'go.mod': None,
-        'pom.xml': None,
-        'README.md': None,
-        'LICENSE': None,
-    }
-    
-    for filename in key_files.keys():
-        file_path = os.path.join(path, filename)
-        if os.path.exists(file_path):
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    # Limit file size to avoid token overflow
-                    key_files[filename] = content[:2000] if len(content) > 2000 else content
-            except Exception:
-                pass
-    
-    return {k: v for k, v in key_files.items() if v is not None}
+    scan = scan or walk_repo(path)
+    names = [name for name in KEY_FILES if scan.is_file(name)]
+    # Limit file size to avoid token overflow
+    return scan.read_heads(names, max_chars=2000)
+
 
+def scan_source_files(path: str, extensions: List[str] = SOURCE_EXTENSIONS, max_files: int = 50,
+                      scan: Optional[RepoScan] = None) -> str:
+    """List the most informative source files, best first"""
+    scan = scan or walk_repo(path)
+    suffixes = tuple(extensions)
+    return '\n'.join(SourceIndex(scan, [f for f in scan.files() if f.endswith(suffixes)]).ranked()[:max_files])
 
-def scan_source_files(path: str, extensions: List[str] = ['.py', '.js', '.ts', '.go', '.rs', '.java', '.cpp']) -> str:
-    """Scan and summarize source files"""
-    file_list = []
+
+def read_head(file_path: str, max_chars: int = HEAD_CHARS) -> Optional[str]:
+    """Read at most max_chars from the start of a file"""
     try:
-        for root, dirs, files in os.walk(path):
-            # Skip common ignored directories
-            dirs[:] = [d for d in dirs if d not in ['.git', 'node_modules', '__pycache__', 'venv', 'dist', 'build']]
-            
-            for file in files:
-                if any(file.endswith(ext) for ext in extensions):
-                    rel_path = os.path.relpath(os.path.join(root, file), path)
-                    file_list.append(rel_path)
-            
-            # Limit to 50 files to avoid overwhelming the context
-            if len(file_list) > 50:
-                break
-    except Exception:
-        pass
-    
-    return '\n'.join(file_list)
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            return f.read(max_chars)
+    except OSError:
+        return None
 
 
-def generate_readme(path: str = '.') -> str:
-    """Generate a comprehensive README for the repository"""
-    
-    # Gather repository information
-    dir_structure = get_directory_structure(path, max_depth=3)
-    key_files = read_key_files(path)
-    source_files = scan_source_files(path)
-    
-    # Construct the prompt for OpenAI
-    prompt = f"""Analyze this repository and generate a comprehensive README.md file.
+def _head_lines(text: str, count: int) -> str:
+    return '\n'.join(text.splitlines()[:count])
 
-DIRECTORY STRUCTURE:
-{dir_structure}
 
-SOURCE FILES:
-{source_files}
+def collect_readme_context(path: str, manifest: Optional[ReadmeManifest] = None,
+                           summarizer: Optional[RepoSummarizer] = None,
+                           token: Optional[threading.Event] = None,
+                           token_budget: Optional[int] = None) -> Dict[str, List[tuple]]:
+    """
+    Collect repository context for the README prompts.
 
-KEY FILES CONTENT:
-"""
-    
-    for filename, content in key_files.items():
-        prompt += f"\n--- {filename} ---\n{content}\n"
-    
-    prompt += """
-
-Generate a well-structured README.md with the following sections:
-1. Project Title and Brief Description
-2. Features (bullet points)
-3. Installation Instructions
-4. Usage Examples
-5. Project Structure Overview
-6. Dependencies
-7. Contributing (if applicable)
-8. License (based on LICENSE file if present)
-
-Make it professional, clear, and concise. Use proper markdown formatting.
+    Returns (name, variants, priority) sections per context group; README_SECTIONS
+    says which groups each README section is written from. With a summarizer, source
+    files are summarized and merged per directory, and the summaries replace file heads,
+    unless the heads already show every source file within token_budget.
+    """
+    manifest = manifest or ReadmeManifest(path, enabled=False)
+    # One walk feeds the tree, the source list and every file read below
+    scan = walk_repo(path)
+    groups: Dict[str, List[tuple]] = {group: [] for group in CONTEXT_GROUPS}
+
+    # Source files most informative first: entry points, then what the import graph says the rest depends on
+    index = SourceIndex(scan, [f for f in scan.files() if f.endswith(tuple(SOURCE_EXTENSIONS))])
+    ranked = index.ranked()
+    entry_points = [name for name in ENTRY_POINTS if scan.is_file(name)]
+    entry_points += [f for f in ranked if f in index.entry_points and f not in entry_points][:MAX_DETECTED_ENTRY_POINTS]
+    source_files = ranked[:500]
+    heads = [f for f in index.select(SOURCE_HEADS + len(entry_points), SOURCE_HEADS_BUDGET, SOURCE_HEAD_CHARS)
+             if f not in entry_points][:SOURCE_HEADS]
+    top_level = [name for name in MANIFEST_FILES + DOC_FILES if scan.is_file(name)]
+    contents = manifest.read_heads(scan, top_level + entry_points, HEAD_CHARS)
+    contents.update(manifest.read_heads(scan, heads, max_chars=SOURCE_HEAD_CHARS))
+    manifest.forget_missing(scan)
+
+    for filename in MANIFEST_FILES:
+        content = contents.get(filename)
+        if content:
+            groups["manifests"].append((filename, [content], 0))
+
+    for name in entry_points:
+        content = contents.get(name)
+        if content:
+            groups["entry points"].append((name, [_head_lines(content, n) for n in (200, 60, 20)], 1))
+
+    groups["tree"].append(("DIRECTORY STRUCTURE", [format_tree(scan, max_depth=depth) for depth in (4, 3, 2, 1)], 2))
+
+    for filename in DOC_FILES:
+        content = contents.get(filename)
+        if content:
+            group = "license" if filename == "LICENSE" else "docs"
+            groups[group].append((filename, [content, _head_lines(content, 20)], 3))
+
+    # Shorter variants keep the most informative files, listed in walk order so the list reads like a tree
+    order = {f: i for i, f in enumerate(scan.files())}
+    groups["source files"].append((
+        "SOURCE FILES",
+        ['\n'.join(sorted(source_files[:n], key=order.get)) for n in (500, 100, 30)],
+        4
+    ))
+
+    if summarizer and _heads_suffice(ranked, entry_points, heads, contents, token_budget):
+        # A small repository: its heads say more than summaries would, without the extra requests
+        summarizer = None
+    if summarizer:
+        files, directories = summarizer.run(scan, source_files, token)
+        if directories.get(""):
+            groups["summaries"].append(("REPOSITORY SUMMARY", [directories[""]], 1))
+        lines = [(d.count("/"), f"{d}/: {summary}") for d, summary in sorted(directories.items()) if d]
+        groups["summaries"].append((
+            "DIRECTORY SUMMARIES",
+            ['\n'.join(line for _, line in lines), '\n'.join(line for depth, line in lines if depth == 0)],
+            2
+        ))
+        groups["summaries"].append(("FILE SUMMARIES", ['\n'.join(f"{f}: {s}" for f, s in files.items())], 5))
+        if files:
+            return groups
+
+    for rel_path in heads:
+        content = contents.get(rel_path)
+        if content:
+            groups["source heads"].append((rel_path, [_head_lines(content, SOURCE_HEAD_LINES)], 5))
+
+    return groups
+
+
+def _heads_suffice(ranked: List[str], entry_points: List[str], heads: List[str], contents: Dict[str, str],
+                   token_budget: Optional[int]) -> bool:
+    """Whether every source file is an entry point or has a head, and the heads fit their share of token_budget."""
+    if not set(ranked) <= set(heads) | set(entry_points):
+        return False
+    if token_budget is None:
+        return True
+    tokens = sum(count_tokens(_head_lines(contents[f], SOURCE_HEAD_LINES)) for f in heads if contents.get(f))
+    return tokens <= token_budget * DIRECT_SOURCES_SHARE
+
+
+def build_readme_context(path: str, token_budget: int, groups: Optional[List[str]] = None,
+                         context: Optional[Dict[str, List[tuple]]] = None) -> ContextPacker:
+    """Pack repository context, all of it or the given groups, as prioritized sections for a README prompt"""
+    context = context if context is not None else collect_readme_context(path)
+    packer = ContextPacker(token_budget)
+    for group in groups or CONTEXT_GROUPS:
+        for name, variants, priority in context[group]:
+            packer.add_variants(name, variants, priority=priority)
+    return packer
+
+
+def get_last_context_report() -> List[dict]:
+    """Return the per-section token report of the last generated README"""
+    return _last_context_report
+
+
+def get_last_reuse_report() -> Optional[dict]:
+    """Return what the last generated README reused from its manifest, or None"""
+    return _last_reuse_report
+
+
+class _OrderedStream:
+    """Forward deltas of sections generated at once in document order: the first unfinished section streams live"""
+
+    def __init__(self, count: int, on_delta: Callable[[str], None]):
+        self.on_delta = on_delta
+        self.held: List[List[str]] = [[] for _ in range(count)]
+        self.finished = [False] * count
+        self.started = [False] * count
+        self.current = 0
+        self._lock = threading.Lock()
+
+    def _forward(self, index: int, text: str):
+        if not text:
+            return
+        if not self.started[index] and any(self.started):
+            text = "\n\n" + text
+        self.started[index] = True
+        self.on_delta(text)
+
+    def emit(self, index: int, delta: str):
+        with self._lock:
+            if index == self.current:
+                self._forward(index, delta)
+            else:
+                self.held[index].append(delta)
+
+    def finish(self, index: int):
+        with self._lock:
+            self.finished[index] = True
+            while self.current < len(self.finished) and self.finished[self.current]:
+                self.current += 1
+                if self.current < len(self.finished):
+                    self._forward(self.current, "".join(self.held[self.current]))
+                    self.held[self.current] = []
+
+
+def _section_prompt(title: str, instruction: str, context: str) -> str:
+    heading = "a single # heading with the project name" if title == README_SECTIONS[0][0] else f'a "## {title}" heading'
+    return f"""Write one section of a README.md for this repository: {instruction}.
+Start with {heading} and output only that section, in markdown.
+Long context sections may have been shortened to fit.
+
+{context}
 """
 
+
+def generate_readme(path: str = '.', on_delta: Optional[Callable[[str], None]] = None,
+                    token_budget: Optional[int] = None) -> str:
+    """
+    Generate a comprehensive README for the repository, streaming to on_delta if given.
+
+    Source files of larger repositories are summarized and merged per directory first
+    (map-reduce); small ones are described by their file heads. Each README
+    section is then written from the context groups it needs. Summaries and sections whose
+    inputs have not changed since the last run are taken from the repository's manifest.
+    """
+    global _last_context_report, _last_reuse_report
+
+    if token_budget is None:
+        token_budget = int(os.getenv("CAPYBARA_README_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    incremental = os.getenv("CAPYBARA_README_INCREMENTAL", "on").lower() not in ("0", "off", "false", "no")
+    summaries = os.getenv("CAPYBARA_README_SUMMARIES", "on").lower() not in ("0", "off", "false", "no")
+    section_tokens = int(os.getenv("CAPYBARA_README_SECTION_TOKENS", SECTION_MAX_TOKENS))
+    manifest = ReadmeManifest(path, os.getenv("CAPYBARA_CACHE_DIR"), enabled=incremental)
+    summarizer = create_summarizer(manifest) if summaries else None
+    workers = summarizer.workers if summarizer else int(os.getenv("CAPYBARA_README_WORKERS", DEFAULT_WORKERS))
+
+    stream = _OrderedStream(len(README_SECTIONS), on_delta) if on_delta else None
+    report: List[Optional[dict]] = [None] * len(README_SECTIONS)
+    section_budget = int(token_budget * SECTION_BUDGET_SHARE)
+    context: Dict[str, List[tuple]] = {}
+
+    def write(index: int) -> str:
+        title, instruction, groups = README_SECTIONS[index]
+        if not any(context[group] for group in groups):
+            # Nothing to write it from, e.g. no LICENSE file
+            if stream:
+                stream.finish(index)
+            return ""
+        # Everything the prompt is built from, so an unchanged key means an unchanged prompt
+        key = content_hash(str(MANIFEST_VERSION), title, instruction, str(section_budget), str(section_tokens),
+                           *(f"{name}\0{variants[0]}" for group in groups for name, variants, _ in context[group]))
+        text = manifest.lookup(title, key)
+        if text is not None:
+            entry = manifest.entry(title)
+            report[index] = {"name": title, "tokens": entry["prompt_tokens"], "status": "reused", "priority": index}
+            if stream:
+                stream.emit(index, text)
+        else:
+            prompt = _section_prompt(title, instruction, build_readme_context(path, section_budget, groups, context).render())
+            text = generate_content(prompt, max_tokens=section_tokens,
+                                    on_delta=(lambda delta: stream.emit(index, delta)) if stream else None)
+            prompt_tokens = count_tokens(prompt)
+            manifest.store(title, key, text, prompt_tokens, count_tokens(text))
+            report[index] = {"name": title, "tokens": prompt_tokens, "status": "generated", "priority": index}
+        if stream:
+            stream.finish(index)
+        return text
+
+    # Set when a section fails or Ctrl-C interrupts the run, so the remaining summaries and sections stop
+    token = threading.Event()
+
+    def run(index: int) -> str:
+        with cancel_scope(token):
+            return write(index)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(README_SECTIONS))))
     try:
-        readme_content = generate_content(prompt, max_tokens=2000)
-        return readme_content
+        # Gather repository information once; each section packs its share within the token budget
+        context.update(collect_readme_context(path, manifest, summarizer, token, section_budget))
+        futures = [pool.submit(run, i) for i in range(len(README_SECTIONS))]
+        sections = [future.result() for future in futures]
+        readme_content = "\n\n".join(section for section in sections if section)
     except Exception as e:
-        return f"Error generating README: {str(e)}"
+        readme_content = f"Error generating README: {str(e)}"
+    finally:
+        token.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        # Summaries and sections that did finish are kept even when something else failed
+        manifest.prune([title for title, _, _ in README_SECTIONS] + (summarizer.names if summarizer else []))
+        manifest.save()
+        _last_context_report = [entry for entry in report if entry]
+        _last_reuse_report = {**manifest.stats, **(summarizer.stats if summarizer else {})}
+    return readme_content
 
 
-def handle_readme_generation(args: List[str]) -> str:
+def handle_readme_generation(args: List[str], on_delta: Optional[Callable[[str], None]] = None) -> str:
     """Handle the !readme command"""
     
     if not args:
@@ -138,4 +343,4 @@ def handle_readme_generation(args: List[str]) -> str:
     if not os.path.isdir(path):
         return f"Error: '{path}' is not a directory"
     
-    return generate_readme(path)
+    return generate_readme(path, on_delta=on_delta)
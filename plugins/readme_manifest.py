@@ -0,0 +1,161 @@
+"""
+Manifest of what the last !readme run of a repository read and generated
+File heads are kept with their size, mtime and content hash, and generated sections with a hash
+of their inputs, so a re-run only reads changed files and regenerates the sections they feed
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .repo_walker import RepoScan
+from .response_cache import DEFAULT_CACHE_DIR
+
+# Bump when the prompts or the section layout change, so old sections are not reused
+MANIFEST_VERSION = 2
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8", errors="replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ReadmeManifest:
+    def __init__(self, root: str, cache_dir: Optional[str] = None, enabled: bool = True):
+        """
+        Load the manifest of a repository, or start an empty one.
+
+        Args:
+            root: Repository directory
+            cache_dir: Directory holding readme/<hash of the absolute root>.json (defaults to ~/.capybara)
+            enabled: When False nothing is loaded or saved, so every run starts from scratch
+        """
+        self.root = os.path.abspath(root)
+        self.path = Path(cache_dir or DEFAULT_CACHE_DIR) / "readme" / f"{content_hash(self.root)[:16]}.json"
+        self.enabled = enabled
+        self.files: Dict[str, dict] = {}
+        self.entries: Dict[str, dict] = {}
+        self.stats = {"files_reused": 0, "files_read": 0, "reused": 0, "generated": 0,
+                      "tokens_reused": 0, "tokens_spent": 0}
+        # Sections are generated on several threads at once
+        self._lock = threading.Lock()
+        if enabled:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION and data.get("root") == self.root:
+            self.files = data.get("files", {})
+            self.entries = data.get("entries", {})
+
+    def save(self):
+        if not self.enabled:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            # A section abandoned after a failure may still be storing its result
+            with self._lock, open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "root": self.root,
+                           "files": self.files, "entries": self.entries}, f)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def read_heads(self, scan: RepoScan, paths: List[str], max_chars: int) -> Dict[str, str]:
+        """Heads of paths like RepoScan.read_heads, reading only files whose size or mtime changed."""
+        self._refresh(scan, paths, max_chars, keep_heads=True)
+        entries = {path: self.files.get(f"{max_chars}:{path}") for path in paths}
+        return {path: entry["head"] for path, entry in entries.items() if entry is not None}
+
+    def read_changed(self, scan: RepoScan, paths: List[str], max_chars: int) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Content hashes of the heads of paths, and the heads of the files that had to be read.
+
+        Heads are not kept, so this suits files whose text is only needed when it changed.
+        """
+        read = self._refresh(scan, paths, max_chars, keep_heads=False)
+        entries = {path: self.files.get(f"{max_chars}:{path}") for path in paths}
+        return {path: entry["hash"] for path, entry in entries.items() if entry is not None}, read
+
+    def _refresh(self, scan: RepoScan, paths: List[str], max_chars: int, keep_heads: bool) -> Dict[str, str]:
+        """Re-read the files among paths whose size or mtime changed, returning what was read."""
+        def stat(path: str):
+            try:
+                return os.stat(os.path.join(scan.root, path))
+            except OSError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=scan.workers) as pool:
+            stats = dict(zip(paths, pool.map(stat, paths)))
+        changed = []
+        for path, st in stats.items():
+            key = f"{max_chars}:{path}"
+            known = self.files.get(key)
+            if st is None:
+                self.files.pop(key, None)
+            elif known and (known["size"], known["mtime_ns"]) == (st.st_size, st.st_mtime_ns) \
+                    and ("head" in known or not keep_heads):
+                self.stats["files_reused"] += 1
+            else:
+                changed.append(path)
+        read = scan.read_heads(changed, max_chars)
+        for path, head in read.items():
+            st = stats[path]
+            entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": content_hash(head)}
+            if keep_heads:
+                entry["head"] = head
+            self.files[f"{max_chars}:{path}"] = entry
+            self.stats["files_read"] += 1
+        return read
+
+    def forget_missing(self, scan: RepoScan):
+        """Drop files the scan does not list any more."""
+        self.files = {key: entry for key, entry in self.files.items() if scan.is_file(key.partition(":")[2])}
+
+    def entry(self, name: str) -> Optional[dict]:
+        return self.entries.get(name)
+
+    def lookup(self, name: str, key: str) -> Optional[str]:
+        """The text generated for name from inputs hashing to key, if still current."""
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None or entry["key"] != key:
+                return None
+            self.stats["reused"] += 1
+            self.stats["tokens_reused"] += entry["prompt_tokens"] + entry["output_tokens"]
+            return entry["text"]
+
+    def store(self, name: str, key: str, text: str, prompt_tokens: int, output_tokens: int):
+        with self._lock:
+            self.entries[name] = {"key": key, "text": text, "prompt_tokens": prompt_tokens, "output_tokens": output_tokens}
+            self.stats["generated"] += 1
+            self.stats["tokens_spent"] += prompt_tokens + output_tokens
+
+    def prune(self, names: List[str]):
+        """Keep only the generated entries in names."""
+        with self._lock:
+            self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+
+
+def format_reuse_report(stats: dict) -> str:
+    """Summarize what a README run reused from its manifest versus read or generated anew."""
+    files = stats["files_reused"] + stats["files_read"]
+    generated = stats["reused"] + stats["generated"]
+    lines = [f"Reused {stats['reused']} of {generated} summaries and sections and {stats['files_reused']} of {files} "
+             f"file reads; {stats['tokens_reused']} tokens reused, {stats['tokens_spent']} spent"]
+    if "files_summarized" in stats:
+        cut = f", {stats['cut_off']} cut off" if stats["cut_off"] else ""
+        lines.append(f"Summarized {stats['files_summarized']} files ({stats['chunks']} chunks sent{cut}); "
+                     f"map {stats['map_s']:.1f}s, reduce {stats['reduce_s']:.1f}s")
+    return "\n".join(lines)
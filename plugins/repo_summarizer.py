@@ -0,0 +1,243 @@
+"""
+Map-reduce summaries of a repository's source files for the README generator
+Files are split into chunks that are summarized on a bounded worker pool, then merged bottom-up
+per directory, so wall-clock time follows the number of rounds rather than the number of files
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .ai_utils import generate_content
+from .cancellation import cancel_scope
+from .context_packer import count_tokens, truncate_to_tokens
+from .readme_manifest import ReadmeManifest, content_hash
+from .repo_walker import RepoScan
+
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_FILES = 60
+DEFAULT_MAX_INPUT_TOKENS = 100_000
+DEFAULT_MAP_TOKENS = 120
+DEFAULT_REDUCE_TOKENS = 250
+DEFAULT_DEADLINE = 60.0
+MAX_FILE_CHARS = 24 * 1024
+CHUNK_TOKENS = 1500
+REDUCE_INPUT_TOKENS = 3000
+
+MAP_PROMPT = """Summarize what this part of {path} does in two or three sentences, for someone writing the project's README.
+Name the commands, classes or functions a user of the project would need.
+
+{text}
+"""
+REDUCE_PROMPT = """These are summaries of the files and subdirectories in {path}.
+Combine them into one short paragraph describing what this directory does and how its parts fit together.
+
+{text}
+"""
+
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """Split text into runs of whole lines of at most max_tokens each (a longer line is cut)."""
+    chunks, lines, size = [], [], 0
+    for line in text.splitlines():
+        tokens = count_tokens(line) + 1
+        if lines and size + tokens > max_tokens:
+            chunks.append("\n".join(lines))
+            lines, size = [], 0
+        if tokens > max_tokens:
+            line, tokens = truncate_to_tokens(line, max_tokens), max_tokens
+        lines.append(line)
+        size += tokens
+    if lines:
+        chunks.append("\n".join(lines))
+    return chunks
+
+
+def _parent(path: str) -> str:
+    return path.rpartition("/")[0]
+
+
+class RepoSummarizer:
+    def __init__(self, manifest: ReadmeManifest, workers: int = DEFAULT_WORKERS, max_files: int = DEFAULT_MAX_FILES,
+                 max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS, map_tokens: int = DEFAULT_MAP_TOKENS,
+                 reduce_tokens: int = DEFAULT_REDUCE_TOKENS, deadline: float = DEFAULT_DEADLINE,
+                 summarize: Optional[Callable[[str, int], str]] = None):
+        """
+        Initialize the summarizer.
+
+        Args:
+            manifest: Where summaries are kept between runs, keyed by the content they summarize
+            workers: Summaries requested at once
+            max_files: Files summarized; the rest of the list is cut off
+            max_input_tokens: Source tokens sent to the map stage in total; files past it are cut off
+            map_tokens: Longest summary of one chunk
+            reduce_tokens: Longest summary of one directory
+            deadline: Seconds after which no more summaries are requested; what is missing by then
+                is left out (files) or stitched together from its parts (directories)
+            summarize: Function from prompt and max tokens to text (defaults to generate_content)
+        """
+        self.manifest = manifest
+        self.workers = max(1, workers)
+        self.max_files = max_files
+        self.max_input_tokens = max_input_tokens
+        self.map_tokens = map_tokens
+        self.reduce_tokens = reduce_tokens
+        self.deadline = deadline
+        self.summarize = summarize or (lambda prompt, max_tokens: generate_content(prompt, max_tokens=max_tokens))
+        # Manifest entries this run used, so older ones can be pruned
+        self.names: List[str] = []
+        self.stats = {"files_summarized": 0, "chunks": 0, "cut_off": 0, "map_s": 0.0, "reduce_s": 0.0}
+
+    def _ask(self, name: str, key: str, prompt: str, max_tokens: int) -> str:
+        text = self.summarize(prompt, max_tokens)
+        self.manifest.store(name, key, text, count_tokens(prompt), count_tokens(text))
+        return text
+
+    def _run(self, pool: ThreadPoolExecutor, tasks: Dict[str, tuple], token: threading.Event,
+             stop_at: float) -> Dict[str, str]:
+        """Run (fn, *args) tasks on pool until all finish or stop_at passes; returns the finished results."""
+        def run(fn, *args):
+            with cancel_scope(token):
+                return fn(*args)
+
+        pending = {pool.submit(run, *task): name for name, task in tasks.items()}
+        results = {}
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, stop_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                for future in pending:
+                    future.cancel()
+                break
+            for future in done:
+                name = pending.pop(future)
+                # A failed summary is left out, like one past the deadline
+                if future.exception() is None:
+                    results[name] = future.result()
+        return results
+
+    def run(self, scan: RepoScan, files: List[str], token: Optional[threading.Event] = None) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Summarize files, most important first, then every directory above them.
+
+        Returns (file summaries, directory summaries); the repository root is "".
+        """
+        token = token or threading.Event()
+        stop_at = time.monotonic() + self.deadline
+        self.stats["cut_off"] = max(0, len(files) - self.max_files)
+        files = files[:self.max_files]
+
+        # Map: reuse the summary of any file whose content is unchanged, summarize the rest chunk by chunk
+        started = time.monotonic()
+        hashes, texts = self.manifest.read_changed(scan, files, MAX_FILE_CHARS)
+        keys = {path: content_hash(MAP_PROMPT, str(self.map_tokens), str(CHUNK_TOKENS), hashes[path])
+                for path in files if path in hashes}
+        summaries: Dict[str, str] = {}
+        missing = []
+        for path, key in keys.items():
+            self.names.append(f"file:{path}")
+            cached = self.manifest.lookup(f"file:{path}", key)
+            if cached is not None:
+                summaries[path] = cached
+            elif path not in texts:
+                missing.append(path)
+        # Unchanged files whose summary is missing, e.g. cut off last time, were not read yet
+        texts.update(scan.read_heads(missing, MAX_FILE_CHARS))
+
+        tasks, chunk_counts, prompt_tokens, budget = {}, {}, {}, self.max_input_tokens
+        for path in files:
+            if path in summaries or path not in texts:
+                continue
+            chunks = chunk_text(texts[path])
+            size = sum(count_tokens(chunk) for chunk in chunks)
+            if size > budget:
+                self.stats["cut_off"] += 1
+                continue
+            budget -= size
+            chunk_counts[path] = len(chunks)
+            prompt_tokens[path] = 0
+            for i, chunk in enumerate(chunks):
+                label = f"{path} (part {i + 1} of {len(chunks)})" if len(chunks) > 1 else path
+                prompt = MAP_PROMPT.format(path=label, text=chunk)
+                prompt_tokens[path] += count_tokens(prompt)
+                tasks[f"{path}#{i}"] = (self.summarize, prompt, self.map_tokens)
+        self.stats["chunks"] = len(tasks)
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            results = self._run(pool, tasks, token, stop_at)
+            for path, count in chunk_counts.items():
+                parts = [results.get(f"{path}#{i}") for i in range(count)]
+                if None in parts:
+                    self.stats["cut_off"] += 1
+                    continue
+                summaries[path] = "\n".join(part.strip() for part in parts)
+                self.manifest.store(f"file:{path}", keys[path], summaries[path], prompt_tokens[path],
+                                    count_tokens(summaries[path]))
+            self.stats["files_summarized"] = len(summaries)
+            self.stats["map_s"] = time.monotonic() - started
+
+            # Reduce: merge directories bottom-up, every directory at one depth at once
+            started = time.monotonic()
+            inputs: Dict[str, List[Tuple[str, str]]] = {}
+            for path in files:
+                if path in summaries:
+                    inputs.setdefault(_parent(path), []).append((path, summaries[path]))
+            for directory in sorted(inputs, key=lambda d: d.count("/") if d else -1):
+                # Every ancestor needs a summary too, even with no files of its own
+                while directory:
+                    directory = _parent(directory)
+                    inputs.setdefault(directory, [])
+            directories: Dict[str, str] = {}
+            by_depth: Dict[int, List[str]] = {}
+            for directory in inputs:
+                by_depth.setdefault(directory.count("/") + 1 if directory else 0, []).append(directory)
+            for depth in sorted(by_depth, reverse=True):
+                tasks, keys_by_dir = {}, {}
+                for directory in sorted(by_depth[depth]):
+                    parts = sorted(inputs[directory])
+                    if not parts:
+                        continue
+                    if len(parts) == 1:
+                        # A directory holding a single file or subdirectory says nothing new
+                        directories[directory] = parts[0][1]
+                    else:
+                        text = truncate_to_tokens("\n\n".join(f"{name}: {summary}" for name, summary in parts),
+                                                  REDUCE_INPUT_TOKENS)
+                        name = f"dir:{directory}"
+                        key = content_hash(REDUCE_PROMPT, str(self.reduce_tokens), text)
+                        self.names.append(name)
+                        cached = self.manifest.lookup(name, key)
+                        if cached is not None:
+                            directories[directory] = cached
+                        else:
+                            keys_by_dir[directory] = text
+                            tasks[directory] = (self._ask, name, key,
+                                                REDUCE_PROMPT.format(path=f"{directory or '.'}/", text=text),
+                                                self.reduce_tokens)
+                results = self._run(pool, tasks, token, stop_at) if tasks else {}
+                for directory, text in keys_by_dir.items():
+                    # Past the deadline, the parts stand in for the merged summary
+                    directories[directory] = results.get(directory) or truncate_to_tokens(text, self.reduce_tokens)
+                if depth:
+                    for directory in by_depth[depth]:
+                        if directory in directories:
+                            inputs[_parent(directory)].append((directory, directories[directory]))
+            self.stats["reduce_s"] = time.monotonic() - started
+        finally:
+            # Interrupted or not, nothing waits for summaries still being written
+            pool.shutdown(wait=False, cancel_futures=True)
+        return summaries, directories
+
+
+def create_summarizer(manifest: ReadmeManifest) -> RepoSummarizer:
+    """Build a RepoSummarizer configured from CAPYBARA_README_* environment variables."""
+    return RepoSummarizer(
+        manifest,
+        workers=int(os.getenv("CAPYBARA_README_WORKERS", DEFAULT_WORKERS)),
+        max_files=int(os.getenv("CAPYBARA_README_MAX_FILES", DEFAULT_MAX_FILES)),
+        max_input_tokens=int(os.getenv("CAPYBARA_README_MAX_INPUT_TOKENS", DEFAULT_MAX_INPUT_TOKENS)),
+        map_tokens=int(os.getenv("CAPYBARA_README_MAP_TOKENS", DEFAULT_MAP_TOKENS)),
+        reduce_tokens=int(os.getenv("CAPYBARA_README_REDUCE_TOKENS", DEFAULT_REDUCE_TOKENS)),
+        deadline=float(os.getenv("CAPYBARA_README_DEADLINE", DEFAULT_DEADLINE)),
+    )
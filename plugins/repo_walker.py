@@ -0,0 +1,293 @@
+"""
+Single-pass repository walk for the README generator
+Lists each directory once with os.scandir, prunes what .gitignore excludes, and spreads
+directory listings and file reads over a thread pool while keeping output order fixed
+"""
+import os
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .instrumentation import timed
+
+DEFAULT_WORKERS = 8
+# Skipped even without a .gitignore; a repository's own "!build/" can bring one back
+DEFAULT_IGNORES = [".git/", "node_modules/", "__pycache__/", "venv/", ".venv/", "dist/", "build/"]
+
+
+def _translate(pattern: str) -> str:
+    """Regex for one gitignore glob, matched against a whole path relative to the rule's directory."""
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            i += 3
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif c == "[":
+            end = pattern.find("]", i + 2 if pattern[i + 1:i + 2] in ("!", "^") else i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                if body[:1] in ("!", "^"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str, base: str = "") -> List[Tuple[str, bool, bool, bool]]:
+    """
+    Parse .gitignore text into (regex, negated, directories_only, anchored) rules.
+
+    An anchored rule's regex matches the path relative to the repository root; any other
+    rule's matches the entry name alone, since it applies at every depth below base.
+
+    Args:
+        text: File contents
+        base: Directory of the file, relative to the repository root ("" for the root)
+    """
+    rules = []
+    prefix = re.escape(base + "/") if base else ""
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        # Trailing spaces are ignored unless escaped
+        line = re.sub(r"(?<!\\) +$", "", line)
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith("\\!") or line.startswith("\\#"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        # A slash anywhere but the end ties the pattern to this directory; otherwise it matches at any depth
+        anchored = "/" in line
+        body = _translate(line.lstrip("/"))
+        rules.append((prefix + body if anchored else body, negated, dir_only, anchored))
+    return rules
+
+
+class IgnoreRules:
+    def __init__(self, rules: Optional[List[Tuple[str, bool, bool, bool]]] = None):
+        """
+        Gitignore rules in effect for one directory, its parents' rules first.
+
+        Args:
+            rules: As from parse_gitignore, in file order; the last match decides
+        """
+        self.rules = rules or []
+        self.negated = any(rule[1] for rule in self.rules)
+        # Without negations any match ignores, so the rules fold into one regex per entry type and target
+        self._combined = {
+            (is_dir, anchored): self._combine(
+                r for r, _, dir_only, by_path in self.rules if by_path == anchored and (is_dir or not dir_only))
+            for is_dir in (False, True) for anchored in (False, True)
+        }
+        self._each = [(re.compile(r), *flags) for r, *flags in reversed(self.rules)] if self.negated else []
+
+    @staticmethod
+    def _combine(patterns: Iterable[str]):
+        patterns = list(patterns)
+        return re.compile("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+
+    def extend(self, text: str, base: str) -> "IgnoreRules":
+        """Rules for a directory that has its own .gitignore."""
+        added = parse_gitignore(text, base)
+        return IgnoreRules(self.rules + added) if added else self
+
+    def ignored(self, path: str, name: str, is_dir: bool) -> bool:
+        """Whether the entry name at path, relative to the repository root, is ignored."""
+        if not self.negated:
+            by_name = self._combined[is_dir, False]
+            if by_name is not None and by_name.fullmatch(name):
+                return True
+            by_path = self._combined[is_dir, True]
+            return bool(by_path is not None and by_path.fullmatch(path))
+        for regex, negated, dir_only, anchored in self._each:
+            if dir_only and not is_dir:
+                continue
+            if regex.fullmatch(path if anchored else name):
+                return not negated
+        return False
+
+
+def _join(base: str, name: str) -> str:
+    return f"{base}/{name}" if base else name
+
+
+class RepoScan:
+    def __init__(self, root: str, listings: Dict[str, List[Tuple[str, bool]]], workers: int = DEFAULT_WORKERS):
+        """
+        The result of walk_repo.
+
+        Args:
+            root: Directory that was walked
+            listings: Per directory relative to root ("" for root), its kept (name, is_dir) entries sorted by name
+            workers: Threads used by read_heads
+        """
+        self.root = root
+        self.listings = listings
+        self.workers = workers
+        self._files = None
+
+    def walk(self, max_depth: Optional[int] = None) -> Iterator[Tuple[str, bool, int]]:
+        """(path, is_dir, depth) in sorted pre-order, down to max_depth levels."""
+        if max_depth is not None and max_depth <= 0:
+            return
+        stack = [("", iter(self.listings.get("", [])))]
+        while stack:
+            directory, entries = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, is_dir = entry
+            path = _join(directory, name)
+            depth = len(stack) - 1
+            yield path, is_dir, depth
+            if is_dir and (max_depth is None or depth + 1 < max_depth):
+                stack.append((path, iter(self.listings.get(path, []))))
+
+    def files(self) -> List[str]:
+        """Every kept file, in walk order."""
+        if self._files is None:
+            self._files = [path for path, is_dir, _ in self.walk() if not is_dir]
+        return self._files
+
+    def is_file(self, path: str) -> bool:
+        directory, _, name = path.rpartition("/")
+        return (name, False) in self.listings.get(directory, [])
+
+    def read_heads(self, paths: List[str], max_chars: int) -> Dict[str, str]:
+        """The first max_chars characters of each readable file in paths, read in parallel."""
+        def read(path: str) -> Optional[str]:
+            try:
+                with open(os.path.join(self.root, path), "r", encoding="utf-8", errors="ignore") as f:
+                    return f.read(max_chars)
+            except OSError:
+                return None
+
+        with timed("walk read"), ThreadPoolExecutor(max_workers=self.workers) as pool:
+            heads = dict(zip(paths, pool.map(read, paths)))
+        return {path: text for path, text in heads.items() if text is not None}
+
+
+def _list_directory(root: str, directory: str, rules: IgnoreRules) -> Tuple[List[Tuple[str, bool]], IgnoreRules]:
+    """Kept entries of one directory, sorted, and the rules its subdirectories inherit."""
+    full = os.path.join(root, directory) if directory else root
+    entries = []
+    gitignore = None
+    try:
+        with os.scandir(full) as it:
+            for entry in it:
+                try:
+                    # The type comes from the directory entry, so no stat per file on most filesystems;
+                    # symlinks are not followed, which also keeps cycles out
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+                if entry.name == ".gitignore" and not is_dir:
+                    gitignore = entry.path
+    except OSError:
+        return [], rules
+    if gitignore is not None:
+        try:
+            with open(gitignore, "r", encoding="utf-8", errors="ignore") as f:
+                rules = rules.extend(f.read(), directory)
+        except OSError:
+            pass
+    prefix = directory + "/" if directory else ""
+    entries = [(name, is_dir) for name, is_dir in entries if not rules.ignored(prefix + name, name, is_dir)]
+    entries.sort()
+    return entries, rules
+
+
+def walk_repo(root: str, workers: int = DEFAULT_WORKERS) -> RepoScan:
+    """
+    List root once, pruning ignored files and directories, with directories listed in parallel.
+
+    Rules come from DEFAULT_IGNORES, .git/info/exclude and every .gitignore on the way down.
+    The result does not depend on which listing finishes first.
+    """
+    rules = IgnoreRules(parse_gitignore("\n".join(DEFAULT_IGNORES)))
+    try:
+        with open(os.path.join(root, ".git", "info", "exclude"), "r", encoding="utf-8", errors="ignore") as f:
+            rules = rules.extend(f.read(), "")
+    except OSError:
+        pass
+
+    listings: Dict[str, List[Tuple[str, bool]]] = {}
+    tasks: "queue.Queue" = queue.Queue()
+    lock = threading.Lock()
+    # Tasks submitted or running; fewer than workers means a thread is idle
+    busy = [0]
+
+    def submit(pool, directory: str, inherited: IgnoreRules):
+        with lock:
+            busy[0] += 1
+        tasks.put(pool.submit(task, pool, directory, inherited))
+
+    def task(pool, directory: str, inherited: IgnoreRules) -> List[Tuple[str, List[Tuple[str, bool]]]]:
+        # Work through the subtree depth-first, handing directories to idle threads only,
+        # which costs far less than one handoff per directory
+        found = []
+        stack = [(directory, inherited)]
+        try:
+            while stack:
+                directory, inherited = stack.pop()
+                entries, inherited = _list_directory(root, directory, inherited)
+                found.append((directory, entries))
+                stack += [(_join(directory, name), inherited) for name, is_dir in entries if is_dir]
+                while len(stack) > 1 and busy[0] < workers:
+                    submit(pool, *stack.pop(0))
+        finally:
+            with lock:
+                busy[0] -= 1
+        return found
+
+    with timed("walk repo"), ThreadPoolExecutor(max_workers=workers) as pool:
+        submit(pool, "", rules)
+        # A task queues its subtasks before it finishes, so once the queue is empty after a result, all are done
+        while not tasks.empty():
+            for directory, entries in tasks.get().result():
+                listings[directory] = entries
+    return RepoScan(root, listings, workers)
+
+
+def format_tree(scan: RepoScan, max_depth: int = 3) -> str:
+    """Indented tree of scan down to max_depth levels, directories marked with a trailing slash and dotfiles hidden."""
+    lines = []
+    hidden_depth = None
+    for path, is_dir, depth in scan.walk(max_depth):
+        if hidden_depth is not None:
+            if depth > hidden_depth:
+                continue
+            hidden_depth = None
+        name = path.rpartition("/")[2]
+        if name.startswith("."):
+            hidden_depth = depth
+            continue
+        lines.append(f"{'  ' * depth}{name}{'/' if is_dir else ''}")
+    return "\n".join(lines)
@@ -0,0 +1,270 @@
+"""
+Persistent response cache for AI completions
+Content-addressed on (model, messages, sampling params) with TTL and LRU eviction
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from .cancellation import Cancelled, check_cancelled, current_token
+
+DEFAULT_CACHE_DIR = Path.home() / ".capybara"
+DEFAULT_TTL = 7 * 24 * 3600  # one week
+DEFAULT_MAX_MB = 50
+
+
+def make_key(model: str, messages, **params) -> str:
+    """Build a stable content hash for a completion request."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _InFlight:
+    """A pending computation that concurrent callers can wait on."""
+
+    def __init__(self, token: Optional[threading.Event] = None):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        # The leader's cancellation token; once set, the computation will not finish
+        self.token = token
+
+
+class ResponseCache:
+    def __init__(self, path: Optional[str] = None, ttl: float = DEFAULT_TTL,
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, enabled: bool = True):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database file (defaults to ~/.capybara/cache.db)
+            ttl: Seconds an entry stays valid
+            max_bytes: Total size of stored responses before LRU eviction kicks in
+            enabled: When False every lookup is a miss and nothing is stored
+        """
+        self.path = Path(path) if path else DEFAULT_CACHE_DIR / "cache.db"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.merged = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _InFlight] = {}
+        self._db = None
+        self._total_bytes = 0
+
+        if self.enabled:
+            try:
+                self._open()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: response cache disabled: {e}")
+                self.enabled = False
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached value, or None if missing or expired."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, size, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, size, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                self._total_bytes -= size
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return value
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Like get, but counts a hit when the value is found."""
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        """Store a value and evict least recently used entries over the size bound."""
+        if not self.enabled or value is None:
+            return
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._total_bytes += size
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Drop expired entries, then the oldest accessed ones until under max_bytes."""
+        if self._total_bytes <= self.max_bytes:
+            return
+        self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        while self._total_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY accessed LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+    def get_or_compute(self, key: str, compute: Callable[[], str], token: Optional[threading.Event] = None) -> str:
+        """
+        Return the cached value for key, computing it on a miss.
+
+        Identical requests issued while one is already in flight wait for
+        that call instead of making their own. A cancelled call is never
+        joined: its waiters compute the value themselves.
+
+        Args:
+            key: Cache key, e.g. from make_key
+            compute: Produces the value on a miss
+            token: Cancellation token of the calling command (defaults to the current one)
+        """
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        token = token if token is not None else current_token()
+        while True:
+            with self._lock:
+                flight = self._inflight.get(key)
+                if flight is not None and flight.token is not None and flight.token.is_set():
+                    # Its command was cancelled, e.g. by Ctrl-C, and the same question asked again
+                    flight = None
+                leader = flight is None
+                if leader:
+                    flight = _InFlight(token)
+                    self._inflight[key] = flight
+            if leader:
+                break
+            while not flight.event.wait(0.1):
+                check_cancelled(token)
+            if isinstance(flight.error, Cancelled):
+                # The leader's command gave up, not this one
+                continue
+            self.merged += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        self.misses += 1
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # A cancelled flight may already have been replaced by a new leader
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+            flight.event.set()
+
+    def clear(self) -> int:
+        """Remove all entries and return how many were dropped."""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+            self._total_bytes = 0
+        self.hits = self.misses = self.merged = 0
+        return count
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and storage usage."""
+        entries = 0
+        if self.enabled:
+            with self._lock:
+                entries = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "path": str(self.path),
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "merged": self.merged,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def format_cache_stats(stats: dict) -> str:
+    """Format cache statistics for display."""
+    if not stats["enabled"]:
+        return "[yellow]Response cache is disabled (CAPYBARA_CACHE=off)[/yellow]"
+
+    return "\n".join([
+        f"[bold]Hit rate:[/bold]  {stats['hit_rate'] * 100:.1f}% "
+        f"[dim]({stats['hits']} hits / {stats['misses']} misses, {stats['merged']} merged in-flight)[/dim]",
+        f"[bold]Entries:[/bold]   {stats['entries']}",
+        f"[bold]Size:[/bold]      {stats['bytes'] / 1024:.1f} KB / {stats['max_bytes'] / (1024 * 1024):.0f} MB",
+        f"[bold]TTL:[/bold]       {stats['ttl'] / 3600:.0f} h",
+        f"[dim]{stats['path']}[/dim]",
+    ])
+
+
+# Global instance
+_global_cache: Optional[ResponseCache] = None
+_global_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+    """Return the shared cache, configured from CAPYBARA_CACHE* environment variables."""
+    global _global_cache
+
+    with _global_lock:
+        if _global_cache is None:
+            enabled = os.getenv("CAPYBARA_CACHE", "on").lower() not in ("0", "off", "false", "no")
+            cache_dir = os.getenv("CAPYBARA_CACHE_DIR")
+            _global_cache = ResponseCache(
+                path=os.path.join(cache_dir, "cache.db") if cache_dir else None,
+                ttl=float(os.getenv("CAPYBARA_CACHE_TTL", DEFAULT_TTL)),
+                max_bytes=int(float(os.getenv("CAPYBARA_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+                enabled=enabled,
+            )
+        return _global_cache
@@ -0,0 +1,239 @@
+"""
+Streaming shell command execution
+Output is forwarded chunk by chunk as it arrives, so memory stays flat however much a command prints
+"""
+import codecs
+import locale
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from rich.markup import escape
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHUNK_SIZE = 64 * 1024
+STDERR_TAIL_BYTES = 8 * 1024
+
+# Programs that draw on or read from the terminal themselves
+INTERACTIVE_COMMANDS = {
+    "vi", "vim", "nvim", "nano", "emacs", "less", "more", "man", "top", "htop", "btop", "watch",
+    "ssh", "telnet", "ftp", "sftp", "mysql", "psql", "sqlite3", "python", "python3", "ipython",
+    "node", "irb", "bash", "sh", "zsh", "fish", "tmux", "screen", "fzf", "sudo", "su", "passwd",
+}
+INTERACTIVE_GIT = {"add -p", "add -i", "add --patch", "rebase -i", "rebase --interactive", "mergetool"}
+
+
+def is_interactive(cmd: str) -> bool:
+    """Whether cmd needs the real terminal, judged from its leading words."""
+    try:
+        words = shlex.split(cmd)
+    except ValueError:
+        words = cmd.split()
+    while words and ("=" in words[0] or words[0] in ("env", "time", "nice")):
+        words = words[1:]
+    if not words:
+        return False
+
+    extra = {c.strip() for c in os.getenv("CAPYBARA_TTY_COMMANDS", "").split(",") if c.strip()}
+    programs = INTERACTIVE_COMMANDS | extra
+    name = os.path.basename(words[0])
+    if name in ("python", "python3", "node", "bash", "sh", "zsh") and len(words) > 1:
+        # Running a script or -c is not interactive, the bare REPL is
+        return False
+    if name == "git" and len(words) > 1:
+        if words[1] == "commit":
+            # Without a message git opens an editor
+            return not any(w.startswith(("-m", "--message", "-F", "--file", "--no-edit", "-C")) for w in words[2:])
+        return " ".join(words[1:3]) in INTERACTIVE_GIT or words[1] in INTERACTIVE_GIT
+    return name in programs
+
+
+class TextSink:
+    def __init__(self, write_stdout: Callable[[str], None], write_stderr: Callable[[str], None],
+                 encoding: Optional[str] = None):
+        """
+        Decode byte chunks incrementally and forward the text.
+
+        Args:
+            write_stdout: Receives decoded stdout text
+            write_stderr: Receives decoded stderr text
+            encoding: Defaults to the locale's preferred encoding; undecodable bytes are replaced
+        """
+        encoding = encoding or locale.getpreferredencoding(False) or "utf-8"
+        self._out = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._err = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self.write_stdout = write_stdout
+        self.write_stderr = write_stderr
+        self._lock = threading.Lock()
+
+    def stdout(self, data: bytes):
+        with self._lock:
+            text = self._out.decode(data)
+            if text:
+                self.write_stdout(text)
+
+    def stderr(self, data: bytes):
+        with self._lock:
+            text = self._err.decode(data)
+            if text:
+                self.write_stderr(text)
+
+    def flush(self):
+        with self._lock:
+            text = self._out.decode(b"", final=True)
+            if text:
+                self.write_stdout(text)
+            text = self._err.decode(b"", final=True)
+            if text:
+                self.write_stderr(text)
+
+
+class TailBuffer:
+    def __init__(self, limit: int = STDERR_TAIL_BYTES):
+        """Keep roughly the last limit bytes appended, dropping whole chunks from the front."""
+        self.limit = limit
+        self.size = 0
+        self._chunks = deque()
+
+    def append(self, data: bytes):
+        self._chunks.append(data)
+        self.size += len(data)
+        while self.size - len(self._chunks[0]) >= self.limit:
+            self.size -= len(self._chunks.popleft())
+
+    def data(self) -> bytes:
+        return b"".join(self._chunks)
+
+    def text(self) -> str:
+        return self.data()[-self.limit:].decode("utf-8", errors="replace")
+
+
+class ExecResult:
+    def __init__(self, command: str):
+        self.command = command
+        self.returncode: Optional[int] = None
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.stderr_tail = ""
+        self.buffer_peak = 0
+        self.peak_rss = 0
+        self.elapsed = 0.0
+        self.interactive = False
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes, or 0 where the platform cannot tell."""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_streaming(cmd: str, sink, chunk_size: int = CHUNK_SIZE, tail_bytes: int = STDERR_TAIL_BYTES,
+                  tty_passthrough: bool = True, stdin=None) -> ExecResult:
+    """
+    Run cmd in a shell, forwarding output to sink as it arrives.
+
+    Args:
+        cmd: Shell command line
+        sink: Object with stdout(bytes), stderr(bytes) and flush() methods, e.g. a TextSink
+        chunk_size: Largest read from either pipe
+        tail_bytes: How much of the end of stderr to keep for the auto-fix prompt
+        tty_passthrough: Run interactive commands on the real terminal instead of through pipes
+        stdin: Child stdin; inherited by default, subprocess.DEVNULL when our stdin is not the user's
+
+    Returns:
+        ExecResult with the exit status, byte counts, stderr tail and peak memory
+    """
+    result = ExecResult(cmd)
+    started = time.perf_counter()
+
+    if tty_passthrough and sys.stdin.isatty() and is_interactive(cmd):
+        result.interactive = True
+        try:
+            result.returncode = subprocess.call(cmd, shell=True)
+        except KeyboardInterrupt:
+            result.returncode = -2
+        result.elapsed = time.perf_counter() - started
+        result.peak_rss = peak_rss()
+        return result
+
+    proc = subprocess.Popen(cmd, shell=True, stdin=stdin,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+    tail = TailBuffer(tail_bytes)
+
+    def pump_stderr():
+        fd = proc.stderr.fileno()
+        while True:
+            data = os.read(fd, chunk_size)
+            if not data:
+                break
+            result.stderr_bytes += len(data)
+            sink.stderr(data)
+            tail.append(data)
+
+    reader = threading.Thread(target=pump_stderr, daemon=True)
+    reader.start()
+    try:
+        fd = proc.stdout.fileno()
+        while True:
+            data = os.read(fd, chunk_size)
+            if not data:
+                break
+            result.stdout_bytes += len(data)
+            result.buffer_peak = max(result.buffer_peak, len(data) + tail.size)
+            sink.stdout(data)
+        result.returncode = proc.wait()
+    except KeyboardInterrupt:
+        # The child shares our process group and got the SIGINT too; make sure it is gone
+        for stop in (proc.terminate, proc.kill):
+            try:
+                proc.wait(timeout=1)
+                break
+            except subprocess.TimeoutExpired:
+                stop()
+        proc.wait()
+        result.returncode = -2
+    finally:
+        reader.join(timeout=2)
+        proc.stdout.close()
+        proc.stderr.close()
+        sink.flush()
+
+    result.stderr_tail = tail.text()
+    result.buffer_peak = max(result.buffer_peak, tail.size)
+    result.elapsed = time.perf_counter() - started
+    result.peak_rss = peak_rss()
+    return result
+
+
+def format_size(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def format_exec_result(result: ExecResult) -> str:
+    """Format the statistics of a finished command for display."""
+    lines = [f"[bold]Command:[/bold] {escape(result.command)}", f"Exit status: {result.returncode}"]
+    if result.interactive:
+        lines.append("Ran on the terminal (interactive)")
+    else:
+        rate = result.stdout_bytes / result.elapsed if result.elapsed else 0
+        lines.append(f"Output: {format_size(result.stdout_bytes)} stdout, {format_size(result.stderr_bytes)} stderr "
+                     f"[dim]({format_size(rate)}/s)[/dim]")
+        lines.append(f"Buffered at most: {format_size(result.buffer_peak)}")
+    lines.append(f"Elapsed: {result.elapsed * 1000:.0f} ms")
+    if result.peak_rss:
+        lines.append(f"CLI peak memory: {format_size(result.peak_rss)}")
+    return "\n".join(lines)
@@ -0,0 +1,252 @@
+"""
+Persistent shell coprocess
+Commands run in one long-lived bash (or sh), so exports, sourced scripts, aliases and
+functions carry over, and no shell is forked per command
+"""
+import atexit
+import os
+import secrets
+import selectors
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+from typing import Optional
+
+from .shell_exec import CHUNK_SIZE, STDERR_TAIL_BYTES, ExecResult, TailBuffer, peak_rss
+
+# Seconds to wait for a command to finish after Ctrl-C before restarting the shell
+INTERRUPT_GRACE = 2.0
+
+
+def persistent_shell_supported() -> bool:
+    return os.name == "posix" and bool(shutil.which("bash") or os.path.exists("/bin/sh"))
+
+
+class ShellSession:
+    def __init__(self, shell: Optional[str] = None):
+        """
+        Initialize the session; the shell itself starts on the first command.
+
+        Args:
+            shell: Shell executable, defaults to bash and falls back to /bin/sh
+        """
+        self.shell = shell or shutil.which("bash") or "/bin/sh"
+        self.is_bash = os.path.basename(self.shell) == "bash"
+        self.proc: Optional[subprocess.Popen] = None
+        self.cwd: Optional[str] = None
+        self.commands = 0
+        self.starts = 0
+        self._marker = b""
+        self._lock = threading.Lock()
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def _start(self):
+        # A random marker per shell, so command output cannot end a command early
+        self._marker = f"__CAPYBARA_{secrets.token_hex(8)}__".encode("ascii")
+        args = [self.shell, "--noprofile", "--norc"] if self.is_bash else [self.shell]
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, bufsize=0)
+        self.cwd = None
+        self.starts += 1
+        # Commands run inside a function, so Ctrl-C can abandon the rest of the
+        # line with return while the shell itself survives
+        setup = "__capybara_run() { eval \"$__capybara_cmd\"; }\ntrap 'return 130 2>/dev/null' INT\n"
+        if self.is_bash:
+            setup += "shopt -s expand_aliases\n"
+        self.proc.stdin.write(setup.encode("utf-8"))
+
+    def close(self):
+        """Stop the shell; the next command starts a fresh one."""
+        proc, self.proc = self.proc, None
+        self.cwd = None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=1)
+        except Exception:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+    def _script(self, cmd: str, tty: bool) -> bytes:
+        marker = self._marker.decode("ascii")
+        lines = []
+        cwd = os.getcwd()
+        if cwd != self.cwd:
+            lines.append(f"cd -- {shlex.quote(cwd)}")
+        # Passing the command as a quoted string keeps unbalanced quotes from swallowing the status lines
+        redirect = "</dev/tty >/dev/tty 2>/dev/tty" if tty else "</dev/null"
+        lines.append(f"__capybara_cmd={shlex.quote(cmd)}")
+        lines.append(f"__capybara_run {redirect}")
+        lines.append(f"__capybara_rc=$?; printf '%s %d %s\\n' '{marker}' \"$__capybara_rc\" \"$PWD\"; "
+                     f"printf '%s\\n' '{marker}' >&2")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def run(self, cmd: str, sink, chunk_size: int = CHUNK_SIZE, tail_bytes: int = STDERR_TAIL_BYTES,
+            tty: bool = False) -> ExecResult:
+        """
+        Run cmd in the shell, forwarding its output to sink as it arrives.
+
+        Args:
+            cmd: Shell command line
+            sink: Object with stdout(bytes), stderr(bytes) and flush() methods
+            chunk_size: Largest read from either pipe
+            tail_bytes: How much of the end of stderr to keep for the auto-fix prompt
+            tty: Connect the command to /dev/tty, for editors and other interactive programs
+
+        Returns:
+            ExecResult; the CLI's working directory follows any cd the command did
+        """
+        with self._lock:
+            if not self.alive():
+                self._start()
+            result = ExecResult(cmd)
+            result.interactive = tty
+            started = time.perf_counter()
+            self.commands += 1
+            try:
+                try:
+                    self.proc.stdin.write(self._script(cmd, tty))
+                except BrokenPipeError:
+                    # The shell died since the last command; start over once
+                    self.close()
+                    self._start()
+                    self.proc.stdin.write(self._script(cmd, tty))
+                self._collect(result, sink, chunk_size, tail_bytes)
+            finally:
+                sink.flush()
+            result.elapsed = time.perf_counter() - started
+            result.peak_rss = peak_rss()
+            return result
+
+    def _collect(self, result: ExecResult, sink, chunk_size: int, tail_bytes: int):
+        """Read both pipes until each has shown the marker, then apply the status line."""
+        marker = self._marker
+        keep = len(marker) - 1
+        streams = {"out": self.proc.stdout.fileno(), "err": self.proc.stderr.fileno()}
+        pending = {"out": b"", "err": b""}
+        found = {"out": False, "err": False}
+        done = {"out": False, "err": False}
+        tail = TailBuffer(tail_bytes)
+        interrupted_at = None
+
+        def emit(name, data):
+            if not data:
+                return
+            if name == "out":
+                result.stdout_bytes += len(data)
+                sink.stdout(data)
+            else:
+                result.stderr_bytes += len(data)
+                tail.append(data)
+                sink.stderr(data)
+
+        selector = selectors.DefaultSelector()
+        for name, fd in streams.items():
+            selector.register(fd, selectors.EVENT_READ, name)
+        try:
+            while not all(done.values()):
+                timeout = None if interrupted_at is None else interrupted_at + INTERRUPT_GRACE - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    # The command ignored Ctrl-C; give up on this shell
+                    self.close()
+                    result.returncode = -2
+                    return
+                try:
+                    events = selector.select(timeout)
+                except KeyboardInterrupt:
+                    interrupted_at = time.monotonic()
+                    continue
+
+                for key, _ in events:
+                    name = key.data
+                    data = os.read(key.fd, chunk_size)
+                    if not data:
+                        # The shell exited, e.g. the command was `exit`
+                        emit(name, pending[name] if not found[name] else b"")
+                        pending[name] = b""
+                        done[name] = True
+                        selector.unregister(key.fd)
+                        continue
+
+                    buffer = pending[name] + data
+                    result.buffer_peak = max(result.buffer_peak, len(buffer) + tail.size)
+                    if not found[name]:
+                        index = buffer.find(marker)
+                        if index < 0:
+                            # Hold back a possible partial marker at the end
+                            split = max(0, len(buffer) - keep)
+                            emit(name, buffer[:split])
+                            pending[name] = buffer[split:]
+                            continue
+                        emit(name, buffer[:index])
+                        buffer = buffer[index + len(marker):]
+                        found[name] = True
+                    pending[name] = buffer
+                    if b"\n" in buffer:
+                        done[name] = True
+                        selector.unregister(key.fd)
+        finally:
+            selector.close()
+
+        result.stderr_tail = tail.text()
+        if not found["out"]:
+            result.returncode = self.proc.wait() if self.proc else -1
+            self.close()
+            return
+
+        status = pending["out"].split(b"\n", 1)[0].decode("utf-8", errors="replace").strip()
+        code, _, cwd = status.partition(" ")
+        result.returncode = int(code) if code.lstrip("-").isdigit() else -1
+        self.cwd = cwd or self.cwd
+        if self.cwd and self.cwd != os.getcwd():
+            try:
+                os.chdir(self.cwd)
+            except OSError:
+                pass
+
+
+def format_session_status(session: Optional[ShellSession], enabled: bool) -> str:
+    """Format persistent shell state for display."""
+    if not persistent_shell_supported():
+        return "[dim]Persistent shell: not supported on this platform[/dim]"
+    if not enabled:
+        return "[bold]Persistent shell:[/bold] off [dim](each command starts a new shell)[/dim]"
+    lines = [f"[bold]Persistent shell:[/bold] on [dim]({session.shell})[/dim]"]
+    if session.alive():
+        lines.append(f"PID {session.proc.pid}, {session.commands} commands, started {session.starts} time(s)")
+    else:
+        lines.append("[dim]Starts with the next command[/dim]")
+    return "\n".join(lines)
+
+
+# Global instance
+_global_session: Optional[ShellSession] = None
+_enabled = os.getenv("CAPYBARA_PERSISTENT_SHELL", "off").lower() in ("1", "on", "true", "yes")
+
+
+def persistent_shell_enabled() -> bool:
+    return _enabled and persistent_shell_supported()
+
+
+def set_persistent_shell(enabled: bool):
+    """Turn the persistent shell on or off; turning it off stops the running shell."""
+    global _enabled
+    _enabled = enabled
+    if not enabled and _global_session is not None:
+        _global_session.close()
+
+
+def get_shell_session() -> ShellSession:
+    global _global_session
+
+    if _global_session is None:
+        _global_session = ShellSession(os.getenv("CAPYBARA_SHELL") or None)
+        atexit.register(_global_session.close)
+    return _global_session
@@ -0,0 +1,244 @@
+"""
+Importance ranking of a repository's source files for the README generator
+Builds a Python/JavaScript import graph and finds entry points from bounded file heads, then scores
+files by entry point, centrality, size and recency so prompts get the most informative files first
+"""
+import json
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+from .instrumentation import timed
+from .repo_walker import RepoScan
+
+# Imports sit at the top of a file, so only this much of each file is read
+IMPORT_HEAD_CHARS = 8 * 1024
+# Files considered at most, shallowest first; ranking a huge monorepo should not read all of it
+MAX_CANDIDATES = 5000
+# Larger files are most likely generated, vendored or minified
+LARGE_FILE = 256 * 1024
+RECENCY_DAYS = 30.0
+
+ENTRY_NAMES = {'main.py', 'cli.py', 'app.py', '__main__.py', 'manage.py', 'index.js', 'main.js', 'index.ts',
+               'main.ts', 'main.go', 'main.rs', 'lib.rs'}
+PY_EXTENSIONS = ('.py',)
+JS_EXTENSIONS = ('.js', '.jsx', '.ts', '.tsx', '.mjs', '.cjs')
+# Tried in order after a relative JavaScript specifier
+JS_RESOLVE = ['', '.js', '.ts', '.jsx', '.tsx', '.mjs', '.cjs', '/index.js', '/index.ts']
+LOW_VALUE_PARTS = {'test', 'tests', '__tests__', 'spec', 'bench', 'benchmarks', 'vendor', 'third_party', 'generated',
+                   'examples', 'fixtures', 'migrations', 'docs'}
+
+_PY_IMPORT = re.compile(r'^[ \t]*(?:from[ \t]+(\.*[\w.]*)[ \t]+import[ \t]+([\w., \t()*]+)|import[ \t]+([\w., \t]+))',
+                        re.MULTILINE)
+_JS_IMPORT = re.compile(r'''(?:\bfrom\s*|\bimport\s*\(?\s*|\brequire\s*\(\s*)["'](\.{1,2}/[^"']*)["']''')
+_PY_MAIN = re.compile(r'''^if\s+__name__\s*==\s*["']__main__["']''', re.MULTILINE)
+# "name = pkg.module:function" in console_scripts, [project.scripts] or setup.py entry_points
+_SCRIPT_TARGET = re.compile(r'''=\s*["']?([A-Za-z_][\w.]*):[A-Za-z_][\w.]*''')
+
+
+def _is_test(path: str) -> bool:
+    name = path.rpartition("/")[2]
+    stem = name.partition(".")[0]
+    return (stem.startswith("test_") or stem.endswith("_test") or ".test." in name or ".spec." in name
+            or stem == "conftest")
+
+
+class SourceIndex:
+    def __init__(self, scan: RepoScan, files: List[str]):
+        """
+        Index source files by their imports and entry points, reading bounded heads only.
+
+        Args:
+            scan: Walk of the repository
+            files: Source files relative to the root, in walk order
+        """
+        self.scan = scan
+        candidates = set(sorted(files, key=lambda path: path.count("/"))[:MAX_CANDIDATES])
+        self.files = [path for path in files if path in candidates]
+        # Past MAX_CANDIDATES, files are not read and rank after every indexed one
+        self.skipped = [path for path in files if path not in candidates]
+        self.sizes: Dict[str, int] = {}
+        self.mtimes: Dict[str, float] = {}
+        self.imports: Dict[str, Set[str]] = {path: set() for path in self.files}
+        self.importers: Dict[str, Set[str]] = {path: set() for path in self.files}
+        self.entry_points: Set[str] = set()
+
+        with timed("rank sources"):
+            self._stat()
+            heads = scan.read_heads([path for path in self.files if path in self.sizes], IMPORT_HEAD_CHARS)
+            self._modules = self._module_map()
+            for path, head in heads.items():
+                for target in self._resolve(path, head):
+                    if target != path:
+                        self.imports[path].add(target)
+                        self.importers[target].add(path)
+                if self._looks_like_entry(path, head):
+                    self.entry_points.add(path)
+            self.entry_points.update(self._declared_entry_points())
+
+    def _stat(self):
+        def stat(path: str):
+            try:
+                return os.stat(os.path.join(self.scan.root, path))
+            except OSError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.scan.workers) as pool:
+            for path, st in zip(self.files, pool.map(stat, self.files)):
+                if st is not None:
+                    self.sizes[path] = st.st_size
+                    self.mtimes[path] = st.st_mtime
+
+    def _module_map(self) -> Dict[str, str]:
+        """Dotted module name to file, for every suffix of each path so src/ layouts resolve too."""
+        modules: Dict[str, str] = {}
+        for path in self.files:
+            if not path.endswith(PY_EXTENSIONS):
+                continue
+            parts = path[:-3].split("/")
+            if parts[-1] == "__init__":
+                parts = parts[:-1]
+            # Longer suffixes are more specific; shallower files win ties
+            for i in range(len(parts)):
+                modules.setdefault(".".join(parts[i:]), path)
+        return modules
+
+    def _resolve(self, path: str, head: str) -> List[str]:
+        """Files in the index that path imports."""
+        targets = []
+        directory = path.rpartition("/")[0]
+        if path.endswith(PY_EXTENSIONS):
+            package = directory.split("/") if directory else []
+            for match in _PY_IMPORT.finditer(head):
+                source, names, plain = match.groups()
+                if plain is not None:
+                    modules = [name.split(" as ")[0].strip() for name in plain.split(",")]
+                elif source.startswith("."):
+                    level = len(source) - len(source.lstrip("."))
+                    base = package[:len(package) - (level - 1)] if level > 1 else package
+                    prefix = "/".join(base + source.lstrip(".").split(".")) if source.strip(".") else "/".join(base)
+                    for name in re.split(r"[,\s()]+", names):
+                        if name and name != "*":
+                            targets += self._py_file(f"{prefix}/{name}" if prefix else name)
+                    targets += self._py_file(prefix)
+                    continue
+                else:
+                    modules = [f"{source}.{name}" for name in re.split(r"[,\s()]+", names) if name and name != "*"]
+                    modules.append(source)
+                for module in modules:
+                    if module in self._modules:
+                        targets.append(self._modules[module])
+        elif path.endswith(JS_EXTENSIONS):
+            for specifier in _JS_IMPORT.findall(head):
+                base = os.path.normpath(os.path.join(directory, specifier)).replace(os.sep, "/")
+                for suffix in JS_RESOLVE:
+                    if base + suffix in self.imports:
+                        targets.append(base + suffix)
+                        break
+        return targets
+
+    def _py_file(self, module_path: str) -> List[str]:
+        """The file for a relative import resolved to a path without extension, if indexed."""
+        for candidate in (f"{module_path}.py", f"{module_path}/__init__.py"):
+            if candidate in self.imports:
+                return [candidate]
+        return []
+
+    def _looks_like_entry(self, path: str, head: str) -> bool:
+        parts = path.split("/")
+        return (parts[-1] in ENTRY_NAMES or "bin" in parts[:-1] or head.startswith("#!")
+                or (path.endswith(PY_EXTENSIONS) and bool(_PY_MAIN.search(head)))
+                or (parts[-1] == "main.go" and "cmd" in parts))
+
+    def _declared_entry_points(self) -> Set[str]:
+        """Files named by package.json bin/main or by Python console scripts."""
+        found = set()
+        heads = self.scan.read_heads([name for name in ("package.json", "pyproject.toml", "setup.cfg", "setup.py")
+                                      if self.scan.is_file(name)], 64 * 1024)
+        try:
+            package = json.loads(heads.get("package.json") or "{}")
+        except ValueError:
+            package = {}
+        if isinstance(package, dict):
+            targets = [package.get("main")]
+            bin_field = package.get("bin")
+            targets += list(bin_field.values()) if isinstance(bin_field, dict) else [bin_field]
+            for target in targets:
+                if isinstance(target, str):
+                    target = os.path.normpath(target).replace(os.sep, "/")
+                    if target in self.imports:
+                        found.add(target)
+        for name in ("pyproject.toml", "setup.cfg", "setup.py"):
+            for module in _SCRIPT_TARGET.findall(heads.get(name, "")):
+                if module in self._modules:
+                    found.add(self._modules[module])
+        return found
+
+    def centrality(self) -> Dict[str, float]:
+        """PageRank over the import graph: a file matters when files that matter import it."""
+        files = self.files
+        if not files:
+            return {}
+        rank = {path: 1.0 / len(files) for path in files}
+        for _ in range(20):
+            # Files importing nothing spread their rank evenly
+            sinks = sum(rank[path] for path in files if not self.imports[path]) / len(files)
+            rank = {path: 0.15 / len(files) + 0.85 * (sinks + sum(rank[src] / len(self.imports[src])
+                                                                  for src in self.importers[path]))
+                    for path in files}
+        return {path: value * len(files) for path, value in rank.items()}
+
+    def scores(self) -> Dict[str, float]:
+        """Importance of every indexed file; higher is more informative."""
+        centrality = self.centrality()
+        newest = max(self.mtimes.values(), default=0.0)
+        scores = {}
+        for path in self.files:
+            size = self.sizes.get(path)
+            if not size:
+                # Missing or empty, e.g. a bare __init__.py
+                scores[path] = -1.0
+                continue
+            parts = path.split("/")
+            score = 3.0 if path in self.entry_points else 0.0
+            score += 1.5 * math.log1p(centrality.get(path, 0.0) + len(self.importers[path]))
+            # Mid-sized files say the most; huge ones are mostly generated or vendored
+            score += min(1.0, math.log1p(size) / math.log1p(32 * 1024))
+            if size > LARGE_FILE:
+                score -= 2.0
+            score += 0.5 * math.exp(-(newest - self.mtimes[path]) / (RECENCY_DAYS * 86400))
+            score -= 0.1 * (len(parts) - 1)
+            if _is_test(path) or LOW_VALUE_PARTS.intersection(parts[:-1]) or ".min." in parts[-1]:
+                score -= 2.0
+            scores[path] = score
+        return scores
+
+    def ranked(self) -> List[str]:
+        """Every file, most informative first; ties keep walk order."""
+        scores = self.scores()
+        order = {path: i for i, path in enumerate(self.files)}
+        return sorted(self.files, key=lambda path: (-scores[path], order[path])) + self.skipped
+
+    def select(self, max_files: int, max_chars: Optional[int] = None,
+               head_chars: int = IMPORT_HEAD_CHARS) -> List[str]:
+        """
+        The most informative files, at most max_files of them.
+
+        Args:
+            max_files: Files returned at most
+            max_chars: Total characters of the files' heads allowed; files that would exceed it are skipped
+            head_chars: Characters of each file that will be read
+        """
+        chosen = []
+        for path in self.ranked():
+            if len(chosen) >= max_files:
+                break
+            cost = min(self.sizes.get(path, 0), head_chars)
+            if max_chars is not None:
+                if cost > max_chars:
+                    continue
+                max_chars -= cost
+            chosen.append(path)
+        return chosen
@@ -0,0 +1,100 @@
+"""
+Startup profiling for --profile-startup
+Times the CLI from launch to its first prompt and breaks import time down with python -X importtime
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+from rich.markup import escape
+
+TARGET_MS = 150
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+
+def parse_importtime(text: str) -> List[dict]:
+    """Parse python -X importtime output into one entry per module, in import order."""
+    entries = []
+    for line in text.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            entries.append({
+                "module": match.group(4),
+                "self_ms": int(match.group(1)) / 1000,
+                "cumulative_ms": int(match.group(2)) / 1000,
+                # importtime indents nested imports by two spaces per level
+                "depth": len(match.group(3)) // 2,
+            })
+    return entries
+
+
+def _child_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # With no key in the environment (.env is loaded into it) or config.yaml, the child would stop at the
+    # API key prompt and read EOF; any key will do, as it exits before making a request
+    if not env.get("OPENAI_API_KEY") and not os.path.exists("config.yaml"):
+        env["OPENAI_API_KEY"] = "startup-profile"
+    return env
+
+
+def _launch(script: str, options: Tuple[str, ...] = ()) -> Tuple[float, str]:
+    started = time.perf_counter()
+    child = subprocess.run(
+        [sys.executable, *options, script, "--startup-only"],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=_child_env(),
+    )
+    elapsed = time.perf_counter() - started
+    if child.returncode != 0:
+        tail = "\n".join(child.stderr.splitlines()[-5:])
+        raise RuntimeError(f"Startup run failed (exit {child.returncode}):\n{tail}")
+    return elapsed * 1000, child.stderr
+
+
+def profile_startup(script: str, runs: int = 5) -> dict:
+    """
+    Launch the CLI until its first prompt, runs times plainly and once under -X importtime.
+
+    Each run is a fresh interpreter that exits where it would prompt,
+    so the times include interpreter startup, as a user would see it.
+
+    Raises:
+        RuntimeError: If a run exits with an error, with the end of its stderr
+    """
+    samples = [_launch(script)[0] for _ in range(runs)]
+    _, stderr = _launch(script, ("-X", "importtime"))
+    imports = parse_importtime(stderr)
+    return {
+        "runs_ms": samples,
+        "median_ms": statistics.median(samples),
+        "best_ms": min(samples),
+        "import_ms": sum(e["cumulative_ms"] for e in imports if e["depth"] == 0),
+        "imports": imports,
+    }
+
+
+def format_startup_profile(report: dict, top: int = 12) -> str:
+    """Format a startup profile: time to prompt, slowest top-level imports and packages by self time."""
+    color = "green" if report["median_ms"] < TARGET_MS else "yellow"
+    lines = [
+        f"[bold]Time to first prompt:[/bold] [{color}]{report['median_ms']:.0f} ms[/{color}] "
+        f"[dim](median of {len(report['runs_ms'])}, best {report['best_ms']:.0f} ms, target {TARGET_MS} ms)[/dim]",
+        f"[bold]Imports:[/bold] {report['import_ms']:.0f} ms [dim](measured under -X importtime, which adds overhead)[/dim]",
+        "",
+        "[bold]Slowest top-level imports[/bold] [dim](including what they import)[/dim]",
+    ]
+    imports = report["imports"]
+    for entry in sorted((e for e in imports if e["depth"] == 0), key=lambda e: -e["cumulative_ms"])[:top]:
+        lines.append(f"  {entry['cumulative_ms']:>8.1f} ms  {escape(entry['module'])}")
+
+    packages: Dict[str, float] = {}
+    for entry in imports:
+        package = entry["module"].split(".", 1)[0]
+        packages[package] = packages.get(package, 0.0) + entry["self_ms"]
+    lines += ["", "[bold]Packages by own import time[/bold]"]
+    for package, ms in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {ms:>8.1f} ms  {escape(package)}")
+    return "\n".join(lines)
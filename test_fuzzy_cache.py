@@ -0,0 +1,44 @@
+"""
+Tests for similar-query reuse: paraphrases share an answer, requests that differ in a salient token do not
+Run with pytest, or as a script.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from plugins.fuzzy_cache import FuzzyCache
+
+
+def make_cache() -> FuzzyCache:
+    return FuzzyCache(os.path.join(tempfile.mkdtemp(), "fuzzy.jsonl"))
+
+
+def test_paraphrase_reuses_answer():
+    cache = make_cache()
+    cache.add("find", "find all python files", 'find . -name "*.py"')
+    assert cache.lookup("find", "find python files") == 'find . -name "*.py"'
+
+
+def test_number_words_must_match():
+    cache = make_cache()
+    cache.add("git", "squash the last few commits into one", "git rebase -i HEAD~3")
+    assert cache.lookup("git", "squash the last few commits into two") is None
+    assert cache.lookup("git", "squash the last three commits into one") is None
+    assert cache.lookup("git", "squash the last few commits into one please") == "git rebase -i HEAD~3"
+
+
+def test_identifiers_and_hex_ids_must_match():
+    cache = make_cache()
+    cache.add("git", "revert merge commit deadbeef", "git revert -m 1 deadbeef")
+    cache.add("git", "checkout branch feature-login", "git switch feature-login")
+    assert cache.lookup("git", "revert merge commit deadbeee") is None
+    assert cache.lookup("git", "checkout branch feature-signup") is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")